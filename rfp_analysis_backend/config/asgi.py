@@ -0,0 +1,15 @@
+"""
+ASGI config for the RFP analysis backend.
+
+Serve with an ASGI server (e.g. `uvicorn config.asgi:application`) so the
+async analyze, chat and ingestion views can hold many LLM-bound requests
+on one worker.
+"""
+import os
+from dotenv import load_dotenv
+from django.core.asgi import get_asgi_application
+
+load_dotenv()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+application = get_asgi_application()
@@ -21,6 +21,7 @@ INSTALLED_APPS = [
     "rest_framework",
     "corsheaders",
     "rfp",  # Our RFP app
+    "csuite_analysis",
 ]
 
 # Middleware
@@ -89,6 +90,7 @@ TEMPLATES = [
 ]
 
 ROOT_URLCONF = "config.urls"
+ASGI_APPLICATION = "config.asgi.application"
 
 DATABASES = {
     "default": {
@@ -104,3 +106,66 @@ PROTECTED_INDEXES = [
     "paidmediabids"
 ]
 
+# Exact-match LLM response cache (see llm_cache.py)
+LLM_CACHE_DIR = BASE_DIR / ".cache" / "llm"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7 * 24 * 60 * 60))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Stored RFP analyses served by report, matrix and export endpoints (see rfp/rfp_analyzer.py)
+ANALYSIS_CACHE_DIR = BASE_DIR / ".cache" / "analyses"
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", 7 * 24 * 60 * 60))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Chat conversation memory (see rfp/conversation.py)
+CHAT_MEMORY_RECENT_MESSAGES = 6
+CHAT_MEMORY_TOKEN_BUDGET = 1500
+# ada-002 scores unrelated questions on one topic above 0.8, so only near-rephrasings reuse chunks
+CHAT_MEMORY_REUSE_THRESHOLD = float(os.getenv("CHAT_MEMORY_REUSE_THRESHOLD", 0.9))
+CHAT_MEMORY_TTL = 24 * 60 * 60
+
+# Semantic question cache for chat (see rfp/semantic_cache.py)
+CHAT_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("CHAT_SEMANTIC_CACHE_THRESHOLD", 0.92))
+CHAT_SEMANTIC_CACHE_MAX_ENTRIES = 500
+CHAT_SEMANTIC_CACHE_TTL = 24 * 60 * 60
+# Per-session invalidation stamps shared by all workers
+CHAT_SEMANTIC_CACHE_DIR = BASE_DIR / ".cache" / "semantic_cache"
+
+# Historical bid centroid index (see rfp/bid_index.py)
+BID_INDEX_DIR = BASE_DIR / ".cache" / "bid_index"
+# Seconds between background refreshes in each worker (0 disables the refresher);
+# with auto-update off workers only reload what build_bid_index writes
+BID_INDEX_REFRESH_INTERVAL = int(os.getenv("BID_INDEX_REFRESH_INTERVAL", 15 * 60))
+BID_INDEX_AUTO_UPDATE = os.getenv("BID_INDEX_AUTO_UPDATE", "true").lower() == "true"
+
+# Threads used to render files for bulk-export/
+BULK_EXPORT_WORKERS = int(os.getenv("BULK_EXPORT_WORKERS", 4))
+
+# C-suite analysis: IC questions processed at once per run
+CSUITE_CONCURRENCY = int(os.getenv("CSUITE_CONCURRENCY", 4))
+# Folder FAISS indexes cached on disk (see csuite_analysis/index_cache.py)
+FAISS_CACHE_DIR = BASE_DIR / ".cache" / "faiss"
+FAISS_CACHE_MAX_BYTES = int(os.getenv("FAISS_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+# Folder PDFs downloaded for indexing (see csuite_analysis/downloads.py)
+PDF_CACHE_DIR = BASE_DIR / ".cache" / "pdfs"
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+PDF_DOWNLOAD_WORKERS = int(os.getenv("PDF_DOWNLOAD_WORKERS", 8))
+# Web search results for the C-suite web tool (see csuite_analysis/search_cache.py):
+# fresh for SEARCH_CACHE_TTL, then served stale and refreshed in the background
+# for SEARCH_CACHE_STALE_TTL more seconds
+SEARCH_CACHE_DIR = BASE_DIR / ".cache" / "search"
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 24 * 60 * 60))
+SEARCH_CACHE_STALE_TTL = int(os.getenv("SEARCH_CACHE_STALE_TTL", 7 * 24 * 60 * 60))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Seconds before a slow RAG or web step is replaced by a fallback answer
+CSUITE_RAG_TIMEOUT = int(os.getenv("CSUITE_RAG_TIMEOUT", 90))
+CSUITE_WEB_TIMEOUT = int(os.getenv("CSUITE_WEB_TIMEOUT", 20))
+# Seconds between keep-alive comments on an idle analyze/resume stream
+CSUITE_SSE_HEARTBEAT = int(os.getenv("CSUITE_SSE_HEARTBEAT", 15))
+# Seconds without an update after which a "running" run counts as orphaned and can be resumed
+CSUITE_RUN_STALE_AFTER = int(os.getenv("CSUITE_RUN_STALE_AFTER", 120))
+
+# Questionnaire batches: concurrent completions per chat-batch/ request
+QUESTIONNAIRE_CONCURRENCY = int(os.getenv("QUESTIONNAIRE_CONCURRENCY", 8))
+# Answers kept on disk for download-questionnaire/, shared by every worker on the host
+QUESTIONNAIRE_CACHE_DIR = BASE_DIR / ".cache" / "questionnaires"
+QUESTIONNAIRE_TTL = int(os.getenv("QUESTIONNAIRE_TTL", 24 * 60 * 60))
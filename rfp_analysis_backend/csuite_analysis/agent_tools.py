@@ -1,15 +1,51 @@
 from openai import OpenAI
 from duckduckgo_search import DDGS
 from .utils import function_tool 
+from .search_cache import get_search_cache
+from langchain_community.callbacks.openai_info import OpenAICallbackHandler
+
+
+def chain_http_client(rag_chain):
+    """
+    The HTTP client given to a RetrievalQA chain's LLM by make_qa_chain, or
+    None. Only that client is safe to close: an LLM built without one shares
+    langchain-openai's per-process default client.
+    """
+    llm_chain = getattr(getattr(rag_chain, "combine_documents_chain", None), "llm_chain", None)
+    return getattr(getattr(llm_chain, "llm", None), "http_client", None)
+
+
+def rag_tool(rag_chain, cancel_token=None, usage=None, retrieved=None):
+    """
+    Answer questions from the company documents. retrieved optionally maps
+    question text to chunks fetched ahead of time (see
+    retrieval.pre_retrieve); those questions go straight to the chain's
+    answering step, and any other question is retrieved by the chain itself.
+    """
+    http_client = chain_http_client(rag_chain)
+    if cancel_token is not None and http_client is not None:
+        # The chain and its client belong to this run, so closing it on cancel aborts in-flight answers
+        cancel_token.on_cancel(http_client.close)
 
-
-def rag_tool(rag_chain):
     @function_tool
     def tool(question: str) -> str:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
         try:
             # Check if the rag_chain expects 'query' or 'question' as input
-            if hasattr(rag_chain, 'input_keys') and 'query' in rag_chain.input_keys:
-                result = rag_chain.invoke({"query": question})
+            if retrieved and question in retrieved:
+                docs = retrieved[question]
+                combine = rag_chain.combine_documents_chain
+                handler = OpenAICallbackHandler()
+                output = combine.invoke({"input_documents": docs, "question": question}, config={"callbacks": [handler]})
+                if usage is not None:
+                    usage.record("gpt-4.1", handler.prompt_tokens, handler.completion_tokens)
+                result = {"result": output[combine.output_key], "source_documents": docs}
+            elif hasattr(rag_chain, 'input_keys') and 'query' in rag_chain.input_keys:
+                handler = OpenAICallbackHandler()
+                result = rag_chain.invoke({"query": question}, config={"callbacks": [handler]})
+                if usage is not None:
+                    usage.record("gpt-4.1", handler.prompt_tokens, handler.completion_tokens)
             else:
                 # Try with a different input format or provide a default response
                 try:
@@ -26,30 +62,41 @@ def rag_tool(rag_chain):
             else:
                 return str(result)
         except Exception as e:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
             return f"RAG Error: {str(e)}\n\nNo relevant information was found in the company documents."
     return tool
 
 
 
-def web_search_tool():
+def web_search_tool(cancel_token=None):
     @function_tool
     def tool(question: str) -> str:
         """
         Search the web for an answer using DuckDuckGo and return formatted results.
         """
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
         try:
             # Add "Rhetorik Ltd" with quotes to ensure exact match
             company_name = '"Rhetorik Ltd"'
             enhanced_question = f"{company_name} {question}"
             
-            ddg = DDGS()
-            results = ddg.text(enhanced_question, max_results=3)
+            search_cache = get_search_cache()
+
+            def search(query):
+                # Identical searches are answered from the cache and refreshed in the background
+                return search_cache.get_or_fetch(
+                    query, lambda: DDGS().text(query, max_results=3) or [], max_results=3
+                )
+
+            results = search(enhanced_question)
 
             if not results:
                 # Try again with just Rhetorik in quotes if no results
                 company_name = '"Rhetorik"'
                 enhanced_question = f"{company_name} {question}"
-                results = ddg.text(enhanced_question, max_results=3)
+                results = search(enhanced_question)
                 
                 if not results:
                     return "Web search returned no relevant results for Rhetorik."
@@ -68,14 +115,19 @@ def web_search_tool():
     return tool
 
 from openai import OpenAI
+from llm_cache import get_llm_cache
 
-def analyst_appraisal_tool():
+def analyst_appraisal_tool(bypass_cache=False, cancel_token=None, usage=None):
     @function_tool
     def tool(question: str, rag_response: str, web_response: str, context: str) -> str:
         """
         Evaluate the responses from RAG and web search, provide a score and FT-style appraisal.
         """
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
         client = OpenAI()
+        # Closing the client aborts the request if the run is cancelled mid-call
+        unregister = cancel_token.on_cancel(client.close) if cancel_token is not None else None
 
         prompt = f"""
 You are a financial analyst preparing a due diligence review for a private equity investment committee.
@@ -115,21 +167,32 @@ IMPORTANT: Ensure your response includes ALL THREE sections: Score, Appraisal, a
 """
 
         try:
-            response = client.chat.completions.create(
-                model="gpt-4.1",
-                temperature=0.3,
-                max_tokens=2048,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=-0.2,
-                messages=[
-                    {"role": "system", "content": "You are a professional financial analyst."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
+            messages = [
+                {"role": "system", "content": "You are a professional financial analyst."},
+                {"role": "user", "content": prompt}
+            ]
+            generation_kwargs = {
+                "temperature": 0.3,
+                "max_tokens": 2048,
+                "top_p": 1.0,
+                "frequency_penalty": 0.0,
+                "presence_penalty": -0.2
+            }
+
+            def complete():
+                response = client.chat.completions.create(
+                    model="gpt-4.1",
+                    messages=messages,
+                    **generation_kwargs
+                )
+                if usage is not None and response.usage:
+                    usage.record("gpt-4.1", response.usage.prompt_tokens, response.usage.completion_tokens)
+                return response.choices[0].message.content
+
             # Get the response content
-            content = response.choices[0].message.content.strip()
+            content = get_llm_cache().get_or_create(
+                "gpt-4.1", messages, generation_kwargs, complete, bypass=bypass_cache
+            ).strip()
             
             # Ensure we have all three sections
             if "Score:" not in content:
@@ -143,6 +206,8 @@ IMPORTANT: Ensure your response includes ALL THREE sections: Score, Appraisal, a
                 
             return content
         except Exception as e:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
             return f"""
 Score: 2/5
 
@@ -152,5 +217,9 @@ Error encountered during analysis. The available information was insufficient to
 Agent Commentary:
 An error occurred during processing: {str(e)}
 """
+        finally:
+            if unregister:
+                unregister()
+            client.close()
 
     return tool
@@ -0,0 +1,101 @@
+# csuite_analysis/cancellation.py
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# USD per million tokens, used to report the cost of cancelled work
+MODEL_PRICING = {
+    "gpt-4.1": {"input": 2.00, "output": 8.00},
+}
+
+# How often blocking waits check for cancellation, in seconds
+POLL_INTERVAL = 0.25
+
+
+class AnalysisCancelled(Exception):
+    """Raised inside analysis steps once their run has been cancelled."""
+
+
+class CancelToken:
+    """
+    Cooperative cancellation for one analysis run.
+
+    Steps check the token between calls and poll it while waiting. Code
+    holding a client for an in-flight request registers a callback (e.g.
+    the client's close method) with on_cancel so the request is aborted as
+    soon as the run is cancelled.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Abort callback failed: {e}")
+
+    def on_cancel(self, callback):
+        """
+        Call callback when the run is cancelled (at once if it already is).
+        Returns a function that unregisters it.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        callback()
+        return lambda: None
+
+    def _unregister(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise AnalysisCancelled(self.reason)
+
+    def wait(self, timeout):
+        """Sleep up to timeout seconds, returning True early if cancelled."""
+        return self._event.wait(timeout)
+
+
+class UsageTracker:
+    """Token usage of one run across threads, priced per model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage = {}
+
+    def record(self, model, prompt_tokens, completion_tokens):
+        with self._lock:
+            usage = self._usage.setdefault(model, {"prompt_tokens": 0, "completion_tokens": 0})
+            usage["prompt_tokens"] += prompt_tokens or 0
+            usage["completion_tokens"] += completion_tokens or 0
+
+    def summary(self):
+        with self._lock:
+            usage = {model: dict(tokens) for model, tokens in self._usage.items()}
+        cost = 0.0
+        for model, tokens in usage.items():
+            pricing = MODEL_PRICING.get(model)
+            if pricing:
+                cost += (tokens["prompt_tokens"] * pricing["input"] + tokens["completion_tokens"] * pricing["output"]) / 1_000_000
+        return {"models": usage, "cost_usd": round(cost, 4)}
@@ -0,0 +1,180 @@
+# csuite_analysis/downloads.py
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable from Django settings
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = (10, 120)
+
+
+def is_remote(url):
+    return url.startswith(("http://", "https://"))
+
+
+class DownloadManager:
+    """
+    Downloads folder PDFs into a local blob cache.
+
+    All requests share one pooled, retrying requests.Session, so
+    concurrent downloads reuse connections to S3. Bodies are streamed to
+    disk in chunks rather than held in memory. Each blob keeps the ETag and
+    Last-Modified it was served with, and later fetches send them as
+    If-None-Match / If-Modified-Since, so an unchanged object costs a 304
+    instead of a download. The least recently used blobs are removed when
+    the cache grows past max_bytes.
+    """
+
+    def __init__(self, directory, max_workers=DEFAULT_WORKERS, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = str(directory)
+        self.max_workers = max_workers
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.session = requests.Session()
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["HEAD", "GET"]
+        )
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _paths(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, digest[:2], digest)
+        return f"{base}.pdf", f"{base}.json"
+
+    def _read_meta(self, meta_path):
+        try:
+            with open(meta_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def fetch(self, url):
+        """
+        Return a local path holding the current content of url, downloading
+        it only if the cached copy is missing or stale. Local paths are
+        returned as they are.
+        """
+        if not is_remote(url):
+            return url
+
+        blob_path, meta_path = self._paths(url)
+        meta = self._read_meta(meta_path) if os.path.exists(blob_path) else None
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        with self.session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+            if response.status_code == 304 and meta:
+                # Touch the blob so eviction treats it as recently used
+                os.utime(blob_path, None)
+                return blob_path
+            response.raise_for_status()
+
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            content_hash = hashlib.sha256()
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        file.write(chunk)
+                        content_hash.update(chunk)
+                os.replace(tmp_path, blob_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            with open(meta_path, "w") as file:
+                json.dump({
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "sha256": content_hash.hexdigest(),
+                    "size": os.path.getsize(blob_path)
+                }, file)
+        logger.info(f"Downloaded {url}")
+        return blob_path
+
+    def fetch_all(self, urls):
+        """
+        Fetch many URLs concurrently.
+
+        Returns:
+            Dict of url -> local path, or None for files that failed
+        """
+        def fetch_or_none(url):
+            try:
+                return self.fetch(url)
+            except Exception as e:
+                print(f"Error downloading PDF from {url}: {str(e)}")
+                return None
+
+        urls = list(dict.fromkeys(urls))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            paths = dict(zip(urls, executor.map(fetch_or_none, urls)))
+        self._evict()
+        return paths
+
+    def _evict(self):
+        """Remove least recently used blobs until the cache fits in max_bytes."""
+        with self._lock:
+            blobs = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith(".pdf"):
+                        path = os.path.join(root, name)
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            continue
+                        blobs.append((stat.st_mtime, stat.st_size, path))
+            size = sum(blob_size for _, blob_size, _ in blobs)
+            for _, blob_size, path in sorted(blobs):
+                if size <= self.max_bytes:
+                    break
+                for stale in (path, f"{path[:-len('.pdf')]}.json"):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+                size -= blob_size
+
+
+_download_manager = None
+_download_manager_lock = threading.Lock()
+
+def get_download_manager():
+    """Return the per-process download manager, configured from Django settings."""
+    global _download_manager
+    if _download_manager is None:
+        with _download_manager_lock:
+            if _download_manager is None:
+                from django.conf import settings
+                _download_manager = DownloadManager(
+                    getattr(settings, "PDF_CACHE_DIR", settings.BASE_DIR / ".cache" / "pdfs"),
+                    max_workers=getattr(settings, "PDF_DOWNLOAD_WORKERS", DEFAULT_WORKERS),
+                    max_bytes=getattr(settings, "PDF_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES),
+                )
+    return _download_manager
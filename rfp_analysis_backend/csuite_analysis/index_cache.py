@@ -0,0 +1,204 @@
+# csuite_analysis/index_cache.py
+
+import os
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from langchain_community.vectorstores import FAISS
+from .downloads import get_download_manager
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable from Django settings
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+HEAD_TIMEOUT = 10
+HEAD_WORKERS = 8
+
+
+def file_fingerprint(session, pdf):
+    """
+    Identify one folder file by its id (URL) and, when the server reports
+    one, its content hash (ETag) or failing that its size and modified time.
+    """
+    fingerprint = {"file_url": pdf["file_url"]}
+    if os.path.exists(pdf["file_url"]):
+        # Local file paths
+        stat = os.stat(pdf["file_url"])
+        fingerprint["size"] = stat.st_size
+        fingerprint["last_modified"] = stat.st_mtime
+        return fingerprint
+    try:
+        response = session.head(pdf["file_url"], timeout=HEAD_TIMEOUT, allow_redirects=True)
+        if response.ok:
+            fingerprint["etag"] = response.headers.get("ETag")
+            fingerprint["last_modified"] = response.headers.get("Last-Modified")
+            fingerprint["size"] = response.headers.get("Content-Length")
+    except requests.RequestException as e:
+        logger.warning(f"HEAD failed for {pdf['file_url']}: {e}")
+    return fingerprint
+
+
+def folder_fingerprints(pdf_files):
+    """Fingerprint every file of a folder concurrently, in file_url order."""
+    # HEAD requests share the download manager's pooled connections
+    session = get_download_manager().session
+    with ThreadPoolExecutor(max_workers=HEAD_WORKERS) as executor:
+        fingerprints = list(executor.map(lambda pdf: file_fingerprint(session, pdf), pdf_files))
+    return sorted(fingerprints, key=lambda fingerprint: fingerprint["file_url"])
+
+
+def folder_cache_key(folder):
+    """
+    Stable cache key for a folder: the hash of its identity (e.g. the folder
+    dict sent by the client), or of its file URLs when no identity is known.
+    """
+    encoded = json.dumps(folder, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class FolderIndexCache:
+    """
+    On-disk cache of FAISS vector stores, one per folder.
+
+    Each entry is a directory written by FAISS.save_local (the index plus
+    the pickled docstore) and a manifest.json recording, for every file, the
+    fingerprint it was indexed at and the ids of its chunks. The manifest
+    lets the indexer update an entry in place when files change, and a
+    repeat analysis of an unchanged folder skips downloading and embedding
+    entirely. Indexes are memory-mapped on read-only loads where FAISS
+    supports it. When the cache grows past max_bytes the least recently
+    used entries are removed.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def key_lock(self, key):
+        """Lock serialising updates of one folder's entry within this process."""
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def load_manifest(self, key):
+        """Return the manifest of a cached folder ({"files": {...}}), or None."""
+        try:
+            with open(os.path.join(self._path(key), "manifest.json"), "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, key, embeddings, mmap=True):
+        """
+        Return the cached vector store for a key, or None. Pass mmap=False
+        when the store is going to be modified.
+        """
+        path = self._path(key)
+        if not os.path.exists(os.path.join(path, "index.faiss")):
+            return None
+        try:
+            if not mmap:
+                raise ValueError("memory mapping not requested")
+            vectorstore = self._load_mmap(path, embeddings)
+        except Exception as e:
+            if mmap:
+                logger.warning(f"Memory-mapped load failed for {path} ({e}), loading normally")
+            try:
+                vectorstore = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+            except Exception as e:
+                logger.error(f"Discarding unreadable index cache entry {path}: {e}")
+                self.delete(key)
+                return None
+        # Touch the entry so eviction treats it as recently used
+        os.utime(path, None)
+        logger.info(f"Loaded cached folder index {key}")
+        return vectorstore
+
+    @staticmethod
+    def _load_mmap(path, embeddings):
+        import faiss
+        index = faiss.read_index(os.path.join(path, "index.faiss"), faiss.IO_FLAG_MMAP)
+        with open(os.path.join(path, "index.pkl"), "rb") as file:
+            docstore, index_to_docstore_id = pickle.load(file)
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id
+        )
+
+    def save(self, key, vectorstore, manifest):
+        """Save a vector store and its manifest under a key, replacing any previous entry."""
+        tmp_path = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+        try:
+            vectorstore.save_local(tmp_path)
+            with open(os.path.join(tmp_path, "manifest.json"), "w") as file:
+                json.dump({**manifest, "updated": time.time()}, file)
+            path = self._path(key)
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Failed to cache folder index {key}: {e}")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return
+        self._evict()
+
+    def delete(self, key):
+        shutil.rmtree(self._path(key), ignore_errors=True)
+
+    @staticmethod
+    def _entry_size(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                path = self._path(name)
+                if name.startswith(".") or not os.path.isdir(path):
+                    continue
+                entries.append((os.path.getmtime(path), self._entry_size(path), path))
+            size = sum(entry_size for _, entry_size, _ in entries)
+            for _, entry_size, path in sorted(entries):
+                if size <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                size -= entry_size
+                logger.info(f"Evicted folder index {os.path.basename(path)}")
+
+
+_index_cache = None
+_index_cache_lock = threading.Lock()
+
+def get_index_cache():
+    """Return the per-process folder index cache, configured from Django settings."""
+    global _index_cache
+    if _index_cache is None:
+        with _index_cache_lock:
+            if _index_cache is None:
+                from django.conf import settings
+                _index_cache = FolderIndexCache(
+                    getattr(settings, "FAISS_CACHE_DIR", settings.BASE_DIR / ".cache" / "faiss"),
+                    max_bytes=getattr(settings, "FAISS_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES),
+                )
+    return _index_cache
@@ -0,0 +1,130 @@
+# csuite_analysis/indexer.py
+
+import hashlib
+import logging
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_text_splitters.character import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+from .index_cache import get_index_cache, folder_fingerprints, folder_cache_key
+from .downloads import get_download_manager
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+def split_file(pdf, local_path):
+    """
+    Load and split one downloaded PDF into chunks with ids derived from its
+    URL, so the chunks of a file can be found again and deleted when it
+    changes.
+
+    Returns:
+        (chunks, ids); both empty if the file could not be loaded
+    """
+    try:
+        documents = PyPDFLoader(local_path).load()
+    except Exception as e:
+        print(f"Error loading PDF from {pdf.get('file_url')}: {str(e)}")
+        return [], []
+    for document in documents:
+        # Point sources at the folder file rather than the local blob
+        document.metadata["source"] = pdf["file_url"]
+        document.metadata["file_name"] = pdf.get("file_name")
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = text_splitter.split_documents(documents)
+    prefix = hashlib.sha256(pdf["file_url"].encode("utf-8")).hexdigest()[:16]
+    return chunks, [f"{prefix}-{i}" for i in range(len(chunks))]
+
+
+def diff_manifest(manifest_files, fingerprints):
+    """
+    Compare the files recorded in a manifest with the folder's current
+    fingerprints.
+
+    Returns:
+        (added, changed, removed) lists of file URLs
+    """
+    added = [url for url in fingerprints if url not in manifest_files]
+    changed = [
+        url for url in fingerprints
+        if url in manifest_files and manifest_files[url]["fingerprint"] != fingerprints[url]
+    ]
+    removed = [url for url in manifest_files if url not in fingerprints]
+    return added, changed, removed
+
+
+def sync_folder_index(pdf_files, embeddings, folder=None):
+    """
+    Bring the cached FAISS index of a folder in line with its current files.
+
+    Only new or changed files are downloaded and embedded; the chunks of
+    changed and removed files are deleted from the index, which is then
+    saved back in place. An unchanged folder is loaded straight from the
+    cache (memory-mapped).
+
+    Args:
+        pdf_files: The folder's current {"file_name", "file_url"} dicts
+        embeddings: Embedding model for new chunks and queries
+        folder: Identity of the folder, e.g. the folder dict from the
+            request; defaults to its file URLs
+
+    Returns:
+        The vector store, or None if the folder has no loadable documents
+    """
+    index_cache = get_index_cache()
+    key = folder_cache_key(folder if folder is not None else sorted(pdf["file_url"] for pdf in pdf_files))
+    files_by_url = {pdf["file_url"]: pdf for pdf in pdf_files}
+    fingerprints = {fingerprint["file_url"]: fingerprint for fingerprint in folder_fingerprints(pdf_files)}
+
+    with index_cache.key_lock(key):
+        manifest = index_cache.load_manifest(key) or {"files": {}}
+        manifest_files = manifest["files"]
+        added, changed, removed = diff_manifest(manifest_files, fingerprints)
+
+        if not (added or changed or removed):
+            vectorstore = index_cache.load(key, embeddings)
+            if vectorstore is not None:
+                print(f"Using cached index for {len(pdf_files)} PDFs")
+                return vectorstore
+            # Manifest without a usable index: index everything again
+            manifest_files = {}
+            added, changed, removed = list(fingerprints), [], []
+
+        vectorstore = index_cache.load(key, embeddings, mmap=False) if manifest_files else None
+        if vectorstore is None:
+            # Nothing usable on disk, so every file is new
+            manifest_files = {}
+            added, changed, removed = list(fingerprints), [], []
+
+        print(f"Updating folder index: {len(added)} added, {len(changed)} changed, {len(removed)} removed")
+
+        stale_ids = [chunk_id for url in changed + removed for chunk_id in manifest_files[url]["ids"]]
+        if stale_ids:
+            vectorstore.delete(stale_ids)
+        for url in removed:
+            manifest_files.pop(url)
+
+        # Download what needs embedding concurrently; unchanged blobs are revalidated, not re-fetched
+        local_paths = get_download_manager().fetch_all(added + changed)
+        for url in added + changed:
+            if local_paths.get(url) is None:
+                # Failed downloads stay out of the manifest so the next run retries them
+                manifest_files.pop(url, None)
+                continue
+            chunks, ids = split_file(files_by_url[url], local_paths[url])
+            if chunks:
+                if vectorstore is None:
+                    vectorstore = FAISS.from_documents(chunks, embeddings, ids=ids)
+                else:
+                    vectorstore.add_documents(chunks, ids=ids)
+            # Unparseable files are recorded too, so they are retried only when they change
+            manifest_files[url] = {"fingerprint": fingerprints[url], "ids": ids}
+
+        if vectorstore is None or not vectorstore.index_to_docstore_id:
+            index_cache.delete(key)
+            return None
+
+        index_cache.save(key, vectorstore, {"folder": folder, "files": manifest_files})
+        return vectorstore
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.6 on 2026-10-19 10:00
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('interrupted', 'Interrupted'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('questions', models.JSONField(default=list)),
+                ('folder', models.JSONField(default=dict)),
+                ('folder_data', models.JSONField(default=dict)),
+                ('options', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('result', models.JSONField(default=dict)),
+                ('completed_at', models.DateTimeField(auto_now_add=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='csuite_analysis.analysisrun')),
+            ],
+            options={
+                'ordering': ['index'],
+                'unique_together': {('run', 'index')},
+            },
+        ),
+    ]
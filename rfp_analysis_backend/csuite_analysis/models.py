@@ -0,0 +1,37 @@
+import uuid
+from django.db import models
+
+class AnalysisRun(models.Model):
+    """One C-suite analysis request, kept so an interrupted run can be resumed."""
+    STATUS_CHOICES = [
+        ("running", "Running"),
+        ("interrupted", "Interrupted"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="running")
+    questions = models.JSONField(default=list)
+    folder = models.JSONField(default=dict)
+    folder_data = models.JSONField(default=dict)
+    options = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
+
+class QuestionResult(models.Model):
+    """Checkpointed result of one question of a run."""
+    run = models.ForeignKey(AnalysisRun, on_delete=models.CASCADE, related_name="results")
+    index = models.PositiveIntegerField()
+    result = models.JSONField(default=dict)
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("run", "index")
+        ordering = ["index"]
+
+    def __str__(self):
+        return f"{self.run_id} question {self.index + 1}"
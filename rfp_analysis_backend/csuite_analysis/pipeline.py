@@ -1,110 +1,106 @@
 from .dummy_data import extract_pdf_files
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters.character import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+import httpx
 from langchain.chains import RetrievalQA
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import PromptTemplate
+from .indexer import sync_folder_index
+from .downloads import get_download_manager
 
 import os
 import re
-import requests
 from urllib.parse import urlparse
 
+# Time limit for one answer request of the RAG chain, in seconds
+QA_REQUEST_TIMEOUT = 120
+
 def is_valid_url(url):
     parsed = urlparse(url)
     return all([parsed.scheme, parsed.netloc])
 
 def process_pdf_path(pdf_path_list):
-    local_paths = []
-    for pdf in pdf_path_list:
-        file_url = pdf['file_url']
-        if not is_valid_url(file_url):
-            continue
-        response = requests.get(file_url)
-        if response.status_code == 200:
-            temp_path = os.path.join('/tmp', pdf['file_name'])
-            with open(temp_path, 'wb') as f:
-                f.write(response.content)
-            local_paths.append(temp_path)
-    return local_paths
+    """Download the given PDFs concurrently and return their local paths."""
+    urls = [pdf['file_url'] for pdf in pdf_path_list if is_valid_url(pdf['file_url'])]
+    paths = get_download_manager().fetch_all(urls)
+    return [paths[url] for url in urls if paths.get(url)]
 
-def build_rag_chain_from_pdfs(folder_data):
-    """Build a RAG chain from PDF files"""
-    from langchain.document_loaders import PyPDFLoader
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
-    from langchain.vectorstores import FAISS
-    from langchain.embeddings import OpenAIEmbeddings
-    from langchain.chains import RetrievalQA
-    from langchain.chat_models import ChatOpenAI
+def normalize_pdf_files(folder_data):
+    """
+    Accept the raw folder structure, a list of {"file_name", "file_url"}
+    dicts or a list of local paths, and return a list of file dicts.
+    """
+    # Case 1: folder_data is a list of file paths (strings)
+    if isinstance(folder_data, list) and all(isinstance(item, str) for item in folder_data):
+        return [{"file_name": os.path.basename(path), "file_type": "pdf", "file_url": path} for path in folder_data]
+    
+    # Case 2: folder_data is a list of file dicts, as built by run_agent_analysis
+    if isinstance(folder_data, list):
+        return [item for item in folder_data if isinstance(item, dict) and item.get("file_url")]
     
+    # Case 3: folder_data is the raw folder data structure
+    if isinstance(folder_data, dict) and "body" in folder_data:
+        return extract_pdf_files(folder_data)
+    
+    return []
+
+def load_or_build_vectorstore(pdf_files, folder=None):
+    """
+    Return a FAISS vector store for a folder's PDFs. The folder's cached
+    index is reused, and only files added or changed since it was built
+    are downloaded and embedded (see indexer.sync_folder_index).
+    
+    Returns:
+        The vector store, or None if no document could be loaded
+    """
+    return sync_folder_index(pdf_files, OpenAIEmbeddings(), folder=folder)
+
+def make_qa_chain(vectorstore):
+    """
+    Create the RetrievalQA chain over a vector store. The chain's LLM gets
+    an HTTP client of its own (see agent_tools.chain_http_client), so the
+    run using it can close it to abort requests without touching the
+    process-wide default client.
+    """
+    retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
+    llm = ChatOpenAI(
+        model="gpt-4.1",
+        temperature=0,
+        http_client=httpx.Client(timeout=httpx.Timeout(QA_REQUEST_TIMEOUT, connect=10))
+    )
+    return RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff",
+        retriever=retriever,
+        return_source_documents=True
+    )
+
+def message_chain(message):
+    """A stand-in chain that answers every query with a fixed message."""
+    def chain(query):
+        return {
+            "result": message,
+            "source_documents": []
+        }
+    chain.invoke = lambda x: chain(x.get("query", ""))
+    return chain
+
+def build_rag_chain_from_pdfs(folder_data, folder=None):
+    """
+    Build a RAG chain from PDF files. Pass the folder's identity (e.g. the
+    folder dict from the request) so its index is updated incrementally.
+    """
     try:
-        # Handle different input formats
-        documents = []
-        
-        # Case 1: folder_data is a list of file paths (strings)
-        if isinstance(folder_data, list) and all(isinstance(item, str) for item in folder_data):
-            for file_path in folder_data:
-                try:
-                    loader = PyPDFLoader(file_path)
-                    documents.extend(loader.load())
-                except Exception as e:
-                    print(f"Error loading PDF from path {file_path}: {str(e)}")
-        
-        # Case 2: folder_data is the raw folder data structure
-        elif isinstance(folder_data, dict) and "body" in folder_data:
-            pdf_files = extract_pdf_files(folder_data)
-            
-            for pdf in pdf_files:
-                try:
-                    url = pdf.get("file_url")
-                    if url:
-                        loader = PyPDFLoader(url)
-                        documents.extend(loader.load())
-                except Exception as e:
-                    print(f"Error loading PDF from URL {pdf.get('file_url')}: {str(e)}")
+        pdf_files = normalize_pdf_files(folder_data)
+        vectorstore = load_or_build_vectorstore(pdf_files, folder=folder) if pdf_files else None
         
         # If no documents were loaded, return a simple chain that returns a default message
-        if not documents:
-            def simple_chain(query):
-                return {
-                    "result": "No documents were found or could be processed.",
-                    "source_documents": []
-                }
-            simple_chain.invoke = lambda x: simple_chain(x.get("query", ""))
-            return simple_chain
-        
-        # Split documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = text_splitter.split_documents(documents)
-        
-        # Create vector store
-        embeddings = OpenAIEmbeddings()
-        vectorstore = FAISS.from_documents(chunks, embeddings)
-        
-        # Create retriever
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-        
-        # Create QA chain
-        llm = ChatOpenAI(model="gpt-4.1", temperature=0)
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            return_source_documents=True
-        )
+        if vectorstore is None:
+            return message_chain("No documents were found or could be processed.")
         
-        return qa_chain
+        return make_qa_chain(vectorstore)
     
     except Exception as e:
         print(f"Error building RAG chain: {str(e)}")
         
         # Return a simple function that acts like a chain but just returns an error message
-        def error_chain(query):
-            return {
-                "result": f"Error processing documents: {str(e)}",
-                "source_documents": []
-            }
-        error_chain.invoke = lambda x: error_chain(x.get("query", ""))
-        return error_chain
+        return message_chain(f"Error processing documents: {str(e)}")
@@ -0,0 +1,59 @@
+# csuite_analysis/retrieval.py
+
+import logging
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# Chunks per question when the chain's retriever doesn't say
+DEFAULT_K = 4
+
+
+def chain_retriever(rag_chain):
+    """
+    The vector store and k behind a RetrievalQA chain's retriever, or
+    (None, None) for chains without one (e.g. message_chain).
+    """
+    retriever = getattr(rag_chain, "retriever", None)
+    vectorstore = getattr(retriever, "vectorstore", None)
+    if vectorstore is None or not hasattr(vectorstore, "index"):
+        return None, None
+    return vectorstore, getattr(retriever, "search_kwargs", {}).get("k", DEFAULT_K)
+
+
+def pre_retrieve(vectorstore, questions, k=DEFAULT_K):
+    """
+    Retrieve the chunks of every question at once: one batched embedding
+    request for all the questions and one FAISS search over the resulting
+    matrix, instead of an embedding round trip and a search per question.
+
+    Args:
+        vectorstore: LangChain FAISS store
+        questions: Question texts
+        k: Chunks per question
+
+    Returns:
+        A list with each question's retrieved Documents, best match first
+    """
+    if not questions:
+        return []
+    vectors = np.asarray(vectorstore.embeddings.embed_documents(list(questions)), dtype=np.float32)
+    if getattr(vectorstore, "_normalize_L2", False):
+        import faiss
+        faiss.normalize_L2(vectors)
+    _, indices = vectorstore.index.search(vectors, k)
+
+    retrieved = []
+    for row in indices:
+        docs = []
+        for i in row:
+            # FAISS pads with -1 when the index holds fewer than k vectors
+            if i == -1:
+                continue
+            doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(i)])
+            if isinstance(doc, Document):
+                docs.append(doc)
+        retrieved.append(docs)
+    logger.info(f"Pre-retrieved {k} chunks for {len(questions)} questions in one batch")
+    return retrieved
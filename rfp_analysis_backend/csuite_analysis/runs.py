@@ -0,0 +1,176 @@
+# csuite_analysis/runs.py
+
+import json
+import time
+import asyncio
+import logging
+import threading
+from datetime import timedelta
+from django.db import close_old_connections
+from django.utils import timezone
+from .models import AnalysisRun, QuestionResult
+from .tasks import run_agent_analysis, is_complete, HEARTBEAT
+from .cancellation import CancelToken
+
+logger = logging.getLogger(__name__)
+
+# Seconds between heartbeats on an idle stream, overridable with CSUITE_SSE_HEARTBEAT
+DEFAULT_HEARTBEAT_INTERVAL = 15
+
+# A running run not touched for this long is taken to be orphaned (e.g. by a
+# crashed worker) and may be resumed; overridable with CSUITE_RUN_STALE_AFTER
+DEFAULT_STALE_AFTER = 120
+
+# How often a driving stream refreshes its run's updated_at, in seconds
+TOUCH_INTERVAL = 30
+
+
+def start_run(questions, folder, folder_data, options):
+    """Record a new analysis run so it can be resumed if the stream is cut off."""
+    return AnalysisRun.objects.create(
+        questions=questions,
+        folder=folder,
+        folder_data=folder_data,
+        options=options
+    )
+
+
+def checkpoint(run, idx, result):
+    """Save a finished question. Errors and timeout fallbacks are left pending for a resume."""
+    if is_complete(result):
+        QuestionResult.objects.update_or_create(run=run, index=idx, defaults={"result": result})
+
+
+def touch(run):
+    AnalysisRun.objects.filter(pk=run.pk).update(updated_at=timezone.now())
+
+
+def claim_run(run, stale_after=DEFAULT_STALE_AFTER):
+    """
+    Atomically mark a run as running, unless another stream is still
+    driving it (status running and touched within stale_after seconds).
+    Returns whether the run was claimed.
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    claimed = (
+        AnalysisRun.objects.filter(pk=run.pk)
+        .exclude(status="running", updated_at__gt=cutoff)
+        .update(status="running", updated_at=timezone.now())
+    )
+    return claimed == 1
+
+
+def stream_run(run, cancel_token=None):
+    """
+    Run (or resume) an analysis run, yielding its JSON events.
+
+    The first event announces the run id. Questions already checkpointed
+    are replayed immediately and only the rest are run; each new result is
+    saved as soon as it completes. The run is marked completed or failed at
+    the end (failed also when some questions only got an error or fallback
+    answer, so it can be resumed), or interrupted if the client goes away
+    (or cancel_token is cancelled) first. While it runs, updated_at is
+    refreshed so resume can tell it from an orphaned run. Heartbeats from
+    run_agent_analysis are passed on.
+    """
+    completed = {result.index: result.result for result in run.results.all() if is_complete(result.result)}
+    yield json.dumps({
+        "type": "run",
+        "run_id": str(run.id),
+        "resumed": bool(completed),
+        "completed": len(completed),
+        "total": len(run.questions)
+    })
+
+    AnalysisRun.objects.filter(pk=run.pk).update(status="running", updated_at=timezone.now())
+    status = "interrupted"
+    events = run_agent_analysis(
+        questions=run.questions,
+        folder=run.folder_data,
+        folder_id=run.folder,
+        completed=completed,
+        on_result=lambda idx, result: checkpoint(run, idx, result),
+        cancel_token=cancel_token,
+        **run.options
+    )
+    try:
+        failed = False
+        last_touch = time.monotonic()
+        for update in events:
+            if update is not HEARTBEAT:
+                event = json.loads(update)
+                failed = failed or event.get("type") == "error"
+                if event.get("type") == "result" and not is_complete(event["result"]):
+                    failed = True
+            if time.monotonic() - last_touch > TOUCH_INTERVAL:
+                touch(run)
+                last_touch = time.monotonic()
+            yield update
+        if cancel_token is None or not cancel_token.cancelled:
+            status = "failed" if failed else "completed"
+    except Exception:
+        status = "failed"
+        raise
+    finally:
+        # Closing the analysis cancels whatever it still has in flight
+        events.close()
+        AnalysisRun.objects.filter(pk=run.pk).update(status=status, updated_at=timezone.now())
+
+
+async def astream_run(run, heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL):
+    """
+    Async iteration over stream_run's events, for serving under ASGI.
+
+    The synchronous run (its thread pools and database writes) is driven
+    on a thread of its own and its events are handed to the event loop
+    through a queue, so a waiting client holds no request worker. HEARTBEAT
+    is yielded whenever heartbeat_interval seconds pass without an event.
+    If the stream is cancelled or closed early (e.g. Django cancels it when
+    the client disconnects) the run is cancelled and its thread exits
+    within about a second.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancel_token = CancelToken()
+    done = object()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # The event loop has already gone away
+            pass
+
+    def drive():
+        events = stream_run(run, cancel_token)
+        try:
+            for update in events:
+                if cancel_token.cancelled:
+                    break
+                # The async side sends its own heartbeats
+                if update is not HEARTBEAT:
+                    put(update)
+        except Exception as e:
+            logger.error(f"Analysis run {run.pk} failed: {e}")
+            put(json.dumps({"type": "error", "message": str(e)}))
+        finally:
+            events.close()
+            close_old_connections()
+            put(done)
+
+    threading.Thread(target=drive, name=f"csuite-run-{run.pk}", daemon=True).start()
+    finished = False
+    try:
+        while True:
+            try:
+                update = await asyncio.wait_for(queue.get(), timeout=heartbeat_interval)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT
+                continue
+            if update is done:
+                finished = True
+                return
+            yield update
+    finally:
+        if not finished:
+            cancel_token.cancel("client disconnected")
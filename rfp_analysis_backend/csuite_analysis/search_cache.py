@@ -0,0 +1,108 @@
+# csuite_analysis/search_cache.py
+
+import re
+import time
+import logging
+import threading
+from disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable from Django settings
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_STALE_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive form of a search query."""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class SearchCache:
+    """
+    Persistent cache of web search results with stale-while-revalidate.
+
+    Results are stored in a DiskCache keyed by the normalised query. Within
+    `ttl` seconds they are returned as they are. For a further `stale_ttl`
+    seconds they are still returned immediately, but a background thread
+    re-runs the search and replaces them. Anything older is fetched again
+    before returning.
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, stale_ttl=DEFAULT_STALE_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.store = DiskCache(directory, ttl, max_bytes)
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    @staticmethod
+    def make_key(query, **params):
+        return {"query": normalize_query(query), "params": params}
+
+    def _refresh(self, key, fetch):
+        try:
+            results = fetch()
+            # Keep serving the stale results rather than an empty (often throttled) response
+            if results:
+                self.store.set(key, results)
+        except Exception as e:
+            logger.warning(f"Background search refresh failed for {key['query']!r}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(self.store.hash_key(key))
+
+    def _refresh_in_background(self, key, fetch):
+        digest = self.store.hash_key(key)
+        with self._lock:
+            # One refresh per query at a time
+            if digest in self._refreshing:
+                return
+            self._refreshing.add(digest)
+        threading.Thread(target=self._refresh, args=(key, fetch), daemon=True).start()
+
+    def get_or_fetch(self, query, fetch, **params):
+        """
+        Return results for a query, calling fetch() only on a miss or once
+        the cached results are too old to serve. fetch must return a
+        JSON-serializable value; exceptions it raises are not cached, and
+        neither are empty results, which search providers also return when
+        throttling.
+        """
+        key = self.make_key(query, **params)
+        entry = self.store.get_entry(key)
+        if entry is not None:
+            age = time.time() - entry.get("created", 0)
+            if age <= self.store.ttl:
+                return entry["value"]
+            if age <= self.store.ttl + self.stale_ttl:
+                logger.info(f"Serving stale search results for {key['query']!r} while refreshing")
+                self._refresh_in_background(key, fetch)
+                return entry["value"]
+
+        results = fetch()
+        if results:
+            self.store.set(key, results)
+        elif entry is not None:
+            # Nothing new: expired results beat none at all
+            return entry["value"]
+        return results
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+def get_search_cache():
+    """Return the per-process search cache, configured from Django settings."""
+    global _search_cache
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                from django.conf import settings
+                _search_cache = SearchCache(
+                    getattr(settings, "SEARCH_CACHE_DIR", settings.BASE_DIR / ".cache" / "search"),
+                    ttl=getattr(settings, "SEARCH_CACHE_TTL", DEFAULT_TTL),
+                    stale_ttl=getattr(settings, "SEARCH_CACHE_STALE_TTL", DEFAULT_STALE_TTL),
+                    max_bytes=getattr(settings, "SEARCH_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES),
+                )
+    return _search_cache
@@ -1,18 +1,384 @@
 from .questions import IC_Questions, response_guidelines
 from .dummy_data import folder_list_raw_dummy
 from .pipeline import build_rag_chain_from_pdfs
-from .agent_tools import rag_tool, web_search_tool, analyst_appraisal_tool
+from .agent_tools import rag_tool, web_search_tool, analyst_appraisal_tool, chain_http_client
+from .retrieval import chain_retriever, pre_retrieve
+from .cancellation import CancelToken, UsageTracker, AnalysisCancelled, POLL_INTERVAL
 from langchain.output_parsers import StructuredOutputParser, ResponseSchema
 import os
 import re  # Add import for regex
 import json # Add json import
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
+logger = logging.getLogger(__name__)
 
-def run_agent_analysis(questions=None, folder=None):
+# Questions processed at once, overridable with the CSUITE_CONCURRENCY setting
+DEFAULT_CONCURRENCY = 4
+
+# Per-step time limits in seconds, overridable with CSUITE_RAG_TIMEOUT / CSUITE_WEB_TIMEOUT
+DEFAULT_RAG_TIMEOUT = 90
+DEFAULT_WEB_TIMEOUT = 20
+
+# How many earlier questions feed the "previous context" of the analyst step
+PRIOR_CONTEXT_QUESTIONS = 2
+
+# Yielded by run_agent_analysis while nothing has finished, at most this many
+# seconds apart, so the response writes often enough to notice a disconnect
+HEARTBEAT = None
+HEARTBEAT_INTERVAL = 1.0
+
+
+def resolve_dependencies(total, depends_on=None, previous_context=True):
+    """
+    Work out which earlier questions each question takes context from.
+
+    Args:
+        total: Number of questions
+        depends_on: Optional {index: [earlier indices]} (0-based; keys may be
+            strings when they come from JSON). Overrides previous_context
+            for the questions it lists.
+        previous_context: Give every other question the context of the
+            PRIOR_CONTEXT_QUESTIONS questions before it
+
+    Returns:
+        A list with the sorted dependency indices of each question
+    """
+    dependencies = []
+    for idx in range(total):
+        if previous_context:
+            dependencies.append(list(range(max(0, idx - PRIOR_CONTEXT_QUESTIONS), idx)))
+        else:
+            dependencies.append([])
+
+    if depends_on is not None and not isinstance(depends_on, dict):
+        raise ValueError("depends_on must be an object mapping question indices to lists of indices")
+    for key, indices in (depends_on or {}).items():
+        if not isinstance(indices, list):
+            raise ValueError(f"depends_on[{key}] must be a list of question indices")
+        idx = int(key)
+        if not 0 <= idx < total:
+            raise ValueError(f"depends_on refers to unknown question {idx}")
+        # Only earlier questions can be waited on, so the pool can never deadlock
+        invalid = [int(i) for i in indices if not 0 <= int(i) < idx]
+        if invalid:
+            raise ValueError(f"Question {idx} can only depend on earlier questions, not {invalid}")
+        dependencies[idx] = sorted({int(i) for i in indices})
+    return dependencies
+
+
+def format_prior_context(entries):
+    """Build the analyst's "previous context" from (question, rag, web) entries."""
+    safe_context = []
+    for i, (q_prev, rag_prev, web_prev) in enumerate(entries):
+        safe_context.append(f"Q{i+1}: {q_prev}\nRAG: {rag_prev[:1000]}\nWEB: {web_prev[:1000]}")
+    return "\n\n".join(safe_context)
+
+
+def parse_sources(raw_sources):
+    """Turn the analyst's sources (lines of text or a list of dicts) into {title: location}."""
+    source_dict = {}
+    if isinstance(raw_sources, str):
+        for line in raw_sources.strip().split("\n"):
+            if line:
+                if "http" in line:
+                    try:
+                        name, url = line.rsplit("(", 1)
+                        source_dict[name.strip()] = url.strip("() ")
+                    except:
+                        source_dict[line.strip()] = None
+                else:
+                    source_dict[line.strip()] = None
+    elif isinstance(raw_sources, list):
+        for src in raw_sources:
+            if isinstance(src, dict) and "title" in src and "location" in src:
+                source_dict[src["title"]] = src["location"]
+    return source_dict
+
+
+def error_result(question, error):
+    return {
+        "incomplete": True,
+        "question_text": question,
+        "score": 0,
+        "scoring": "Error during processing",
+        "sources": {},
+        "rationale": {
+            "rag_response": "",
+            "web_response": "",
+            "agent_commentary": str(error)
+        }
+    }
+
+
+class QuestionContext:
+    """
+    Retrieval results shared between concurrently running questions.
+
+    A question publishes its RAG and web responses as soon as it has them,
+    and questions that depend on it wait only for that, not for its
+    appraisal.
+    """
+
+    def __init__(self, total):
+        self._ready = [threading.Event() for _ in range(total)]
+        self._entries = {}
+
+    def publish(self, idx, entry=None):
+        if entry is not None:
+            self._entries[idx] = entry
+        self._ready[idx].set()
+
+    def wait_for(self, indices, cancel_token=None):
+        entries = []
+        for idx in indices:
+            while not self._ready[idx].wait(POLL_INTERVAL):
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+            if idx in self._entries:
+                entries.append(self._entries[idx])
+        return entries
+
+
+def step_result(future, timeout, fallback, cancel_token=None, deadline=None):
+    """
+    Wait for a step up to timeout seconds (or until deadline, a
+    time.monotonic() value), returning fallback if it takes longer. Raises
+    AnalysisCancelled as soon as the run is cancelled.
+    """
+    if deadline is None:
+        deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        done, _ = wait([future], timeout=max(0, min(POLL_INTERVAL, remaining)))
+        if done:
+            return future.result()
+        if cancel_token is not None and cancel_token.cancelled:
+            future.cancel()
+            cancel_token.raise_if_cancelled()
+        if remaining <= 0:
+            # The step's thread cannot be interrupted; it finishes in the background
+            future.cancel()
+            logger.warning(f"Step timed out after {timeout}s, using fallback")
+            return fallback
+
+
+def start_step(fn, *args):
+    """
+    Run fn(*args) on a thread of its own and return a Future for it.
+
+    Steps are not queued on a bounded pool: one that is abandoned after its
+    timeout keeps running in the background, and on a pool enough of those
+    would leave later steps queued until their own time limits ran out.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="csuite-step", daemon=True).start()
+    return future
+
+
+class StepRunner:
+    """
+    Runs the independent RAG and web steps of a question side by side, each
+    with its own time limit counted from when both start.
+    """
+
+    def __init__(self, rag_timeout, web_timeout, cancel_token=None):
+        self.rag_timeout = rag_timeout
+        self.web_timeout = web_timeout
+        self.cancel_token = cancel_token
+
+    def retrieve(self, rag, web, question):
+        """
+        Return (rag_response, web_response, timed_out) once both resolve or
+        time out; timed_out is set if either is a fallback answer.
+        """
+        started = time.monotonic()
+        rag_future = start_step(rag, question)
+        web_future = start_step(web, question)
+        rag_fallback = f"RAG Error: document search timed out after {self.rag_timeout}s\n\nNo relevant information was found in the company documents."
+        web_fallback = f"Web search timed out after {self.web_timeout}s; no external validation is available."
+        rag_response = step_result(
+            rag_future, self.rag_timeout, rag_fallback,
+            self.cancel_token, deadline=started + self.rag_timeout
+        )
+        # Waiting on the RAG step used up part of the web step's time, not extra time
+        web_response = step_result(
+            web_future, self.web_timeout, web_fallback,
+            self.cancel_token, deadline=started + self.web_timeout
+        )
+        return rag_response, web_response, rag_response is rag_fallback or web_response is web_fallback
+
+
+def _run_question(idx, question, tools, dependencies, shared_context, output_parser, steps):
+    """
+    Answer one question: the RAG and web validation steps concurrently,
+    then the analyst appraisal with context from the questions it depends on.
+
+    Returns:
+        The question's entry in the final results
+    """
+    rag, web, analyst = tools
+    published = False
+    try:
+        # Steps 1 and 2: RAG Tool and Web Validation, run side by side
+        rag_response, web_response, timed_out = steps.retrieve(rag, web, question)
+        
+        shared_context.publish(idx, (question, rag_response, web_response))
+        published = True
+        
+        # Step 3: Analyst Appraisal
+        prior_context = format_prior_context(shared_context.wait_for(dependencies, steps.cancel_token))
+        if steps.cancel_token is not None:
+            steps.cancel_token.raise_if_cancelled()
+        appraisal_output = analyst(
+            question=question,
+            rag_response=rag_response,
+            web_response=web_response,
+            context=prior_context
+        )
+
+        # Parse appraisal output
+        try:
+            parsed_appraisal = output_parser.parse(appraisal_output)
+        except Exception as e:
+            parsed_appraisal = {
+                "score": None,
+                "scoring": appraisal_output,
+                "sources": {},
+                "agent_commentary": f"Parsing failed: {str(e)}"
+            }
+
+        result = {
+            "question_text": question,
+            "score": int(parsed_appraisal.get("score") or 0),
+            "scoring": parsed_appraisal.get("scoring", ""),
+            "sources": parse_sources(parsed_appraisal.get("sources", "")),
+            "rationale": {
+                "rag_response": rag_response,
+                "web_response": web_response,
+                "agent_commentary": parsed_appraisal.get("agent_commentary", "")
+            }
+        }
+        if timed_out:
+            # Answered from a fallback, so a resumed run should try it again
+            result["incomplete"] = True
+        return result
+
+    except AnalysisCancelled:
+        raise
+    except Exception as e:
+        return error_result(question, e)
+    finally:
+        # Never leave dependent questions waiting
+        if not published:
+            shared_context.publish(idx)
+
+
+def prepare_rag(pdf_files, questions, folder_id=None):
+    """
+    Build the folder's RAG chain and retrieve the chunks of all the
+    questions in one batch.
+
+    Returns:
+        (rag_chain, retrieved) where retrieved maps question text to its
+        chunks; it is empty if the chain has no index to search or batched
+        retrieval failed, and the chain then retrieves per question
+    """
+    rag_chain = build_rag_chain_from_pdfs(pdf_files, folder=folder_id)
+    vectorstore, k = chain_retriever(rag_chain)
+    if vectorstore is None:
+        return rag_chain, {}
+    unique_questions = list(dict.fromkeys(questions))
+    try:
+        return rag_chain, dict(zip(unique_questions, pre_retrieve(vectorstore, unique_questions, k)))
+    except Exception as e:
+        logger.warning(f"Batched pre-retrieval failed, retrieving per question: {e}")
+        return rag_chain, {}
+
+
+def is_complete(result):
+    """Whether a question's result is final, rather than an error or step-timeout fallback."""
+    return not result.get("incomplete") and result.get("scoring") != "Error during processing"
+
+
+def result_events(idx, result, done, total, replayed=False):
+    """The "result" and "progress" events sent when a question finishes."""
+    event = {"type": "result", "index": idx, "key": f"question_{idx+1}", "result": result}
+    if replayed:
+        event["replayed"] = True
+    yield json.dumps(event)
+    yield json.dumps({"type": "progress", "current": done, "total": total})
+
+
+def run_agent_analysis(questions=None, folder=None, bypass_cache=False, concurrency=None,
+                       depends_on=None, previous_context=True, folder_id=None,
+                       completed=None, on_result=None, cancel_token=None):
+    """
+    Run the IC questions against a folder's PDFs, yielding JSON events.
+
+    Questions run concurrently on a pool of `concurrency` threads. Each
+    yields a "result" event and a "progress" event as it finishes, and a
+    final "complete" event carries every result in question order. A
+    question's analyst step waits for the retrieval of the questions it
+    depends on (see resolve_dependencies), so "previous context" is kept
+    while their RAG and web steps still overlap.
+
+    folder_id identifies the folder (e.g. the request's folder dict) so
+    its document index is cached and updated incrementally.
+
+    completed maps question indices to results from an earlier run; they
+    are replayed straight away and only the other questions are run.
+    on_result(idx, result) is called as each question finishes, e.g. to
+    checkpoint it.
+
+    HEARTBEAT (None) is yielded whenever a second passes without an event,
+    so the caller writes often enough to notice a disconnected client.
+    Closing the generator, or cancelling cancel_token, cancels the run:
+    outstanding model calls are aborted, pending questions are dropped and
+    the token usage spent so far is logged.
+    """
     from .questions import IC_Questions  # keep this import here for default fallback
+    from django.conf import settings
     
     if questions is None:
         questions = IC_Questions
+    concurrency = max(1, int(concurrency or getattr(settings, "CSUITE_CONCURRENCY", DEFAULT_CONCURRENCY)))
+    
+    try:
+        dependencies = resolve_dependencies(len(questions), depends_on, previous_context)
+    except (TypeError, ValueError) as e:
+        yield json.dumps({"type": "error", "message": f"Invalid depends_on: {str(e)}"})
+        return
+
+    if cancel_token is None:
+        cancel_token = CancelToken()
+    usage = UsageTracker()
+    total_questions = len(questions)
+    shared_context = QuestionContext(total_questions)
+    results = {}
+
+    # Replay questions finished by an earlier run; their retrieval still feeds later context
+    for idx, result in sorted((int(idx), result) for idx, result in (completed or {}).items()):
+        results[idx] = result
+        rationale = result.get("rationale", {})
+        shared_context.publish(idx, (questions[idx], rationale.get("rag_response", ""), rationale.get("web_response", "")))
+        yield from result_events(idx, result, len(results), total_questions, replayed=True)
+    
+    pending = [idx for idx in range(total_questions) if idx not in results]
+    if not pending:
+        yield json.dumps({"type": "complete", "results": {f"question_{idx+1}": results[idx] for idx in range(total_questions)}})
+        return
 
     # Extract PDF files from Tapestry folder data
     pdf_files = []
@@ -33,127 +399,86 @@ def run_agent_analysis(questions=None, folder=None):
         yield json.dumps({"type": "error", "message": "No PDF files found in folder"})
         return
 
-    # Build RAG chain from PDFs
-    rag_chain = build_rag_chain_from_pdfs(pdf_files)
-    if not rag_chain:
-        yield json.dumps({"type": "error", "message": "Failed to build RAG chain"})
-        return
+    # Builds the RAG chain; the per-question steps get threads of their own (see start_step)
+    step_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="csuite-prepare")
+    executor = None
+    rag_chain = None
+    finished = False
+    try:
+        # Build RAG chain from PDFs and pre-retrieve for the pending questions,
+        # off the response thread so a disconnect is still noticed
+        chain_future = step_executor.submit(prepare_rag, pdf_files, [questions[idx] for idx in pending], folder_id)
+        while not wait([chain_future], timeout=HEARTBEAT_INTERVAL)[0]:
+            yield HEARTBEAT
+        if cancel_token.cancelled:
+            return
+        rag_chain, retrieved = chain_future.result()
+        if not rag_chain:
+            finished = True
+            yield json.dumps({"type": "error", "message": "Failed to build RAG chain"})
+            return
 
-    # Init tools
-    rag = rag_tool(rag_chain)
-    web = web_search_tool()
-    analyst = analyst_appraisal_tool()
+        # Init tools
+        rag = rag_tool(rag_chain, cancel_token=cancel_token, usage=usage, retrieved=retrieved)
+        web = web_search_tool(cancel_token=cancel_token)
+        analyst = analyst_appraisal_tool(bypass_cache=bypass_cache, cancel_token=cancel_token, usage=usage)
 
-    output_parser = StructuredOutputParser.from_response_schemas([
-        ResponseSchema(name="score", description="Score from 1 to 5"),
-        ResponseSchema(name="scoring", description="Analyst logic and reasoning"),
-        ResponseSchema(name="sources", description="List of sources with title and location")
-    ])
+        output_parser = StructuredOutputParser.from_response_schemas([
+            ResponseSchema(name="score", description="Score from 1 to 5"),
+            ResponseSchema(name="scoring", description="Analyst logic and reasoning"),
+            ResponseSchema(name="sources", description="List of sources with title and location")
+        ])
 
-    final_json_output = {}
-    context_store = {}
-    total_questions = len(questions)
+        tools = (rag, web, analyst)
+        steps = StepRunner(
+            rag_timeout=getattr(settings, "CSUITE_RAG_TIMEOUT", DEFAULT_RAG_TIMEOUT),
+            web_timeout=getattr(settings, "CSUITE_WEB_TIMEOUT", DEFAULT_WEB_TIMEOUT),
+            cancel_token=cancel_token
+        )
 
-    for idx, question in enumerate(questions):
-        # Send progress update
-        yield json.dumps({
-            "type": "progress",
-            "current": idx + 1,
-            "total": total_questions
-        })
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="csuite-question")
+        # Submitted in question order, so a question's dependencies have always started
+        futures = {
+            executor.submit(
+                _run_question, idx, questions[idx], tools, dependencies[idx], shared_context, output_parser, steps
+            ): idx
+            for idx in pending
+        }
+        running = set(futures)
+        while running:
+            done, running = wait(running, timeout=HEARTBEAT_INTERVAL, return_when=FIRST_COMPLETED)
+            if cancel_token.cancelled:
+                return
+            if not done:
+                yield HEARTBEAT
+            for future in done:
+                idx = futures[future]
+                results[idx] = future.result()
+                if on_result:
+                    on_result(idx, results[idx])
+                yield from result_events(idx, results[idx], len(results), total_questions)
 
-        try:
-            # Step 1: RAG Tool
-            rag_response = rag(question)
-            
-            # Step 2: Web Validation
-            web_response = web(question)
-            
-            # Step 3: Analyst Appraisal
-            prior_context = ""
-            if context_store:
-                safe_context = []
-                for i, item in enumerate(list(context_store.items())[-2:]):
-                    if isinstance(item, tuple) and len(item) == 2:
-                        q_prev, r_prev = item
-                        if isinstance(q_prev, str) and isinstance(r_prev, dict):
-                            rag_snip = r_prev.get("step_1", {}).get("step_output", "")[:1000]
-                            web_snip = r_prev.get("step_2", {}).get("step_output", "")[:1000]
-                            safe_context.append(f"Q{i+1}: {q_prev}\nRAG: {rag_snip}\nWEB: {web_snip}")
-                prior_context = "\n\n".join(safe_context)
-
-            appraisal_output = analyst(
-                question=question,
-                rag_response=rag_response,
-                web_response=web_response,
-                context=prior_context
+        # Yield final results
+        finished = True
+        final_json_output = {f"question_{idx+1}": results[idx] for idx in range(total_questions)}
+        yield json.dumps({"type": "complete", "results": final_json_output})
+    finally:
+        if not finished:
+            # The client went away (or the run was cancelled): abort outstanding calls
+            cancel_token.cancel(cancel_token.reason or "client disconnected")
+            logger.warning(
+                f"Cancelled C-suite analysis ({cancel_token.reason}) with "
+                f"{total_questions - len(results)} of {total_questions} questions outstanding; "
+                f"token usage so far: {usage.summary()}"
             )
-
-            # Parse appraisal output
-            try:
-                parsed_appraisal = output_parser.parse(appraisal_output)
-            except Exception as e:
-                parsed_appraisal = {
-                    "score": None,
-                    "scoring": appraisal_output,
-                    "sources": {},
-                    "agent_commentary": f"Parsing failed: {str(e)}"
-                }
-
-            # Handle source parsing
-            raw_sources = parsed_appraisal.get("sources", "")
-            source_dict = {}
-            if isinstance(raw_sources, str):
-                for line in raw_sources.strip().split("\n"):
-                    if line:
-                        if "http" in line:
-                            try:
-                                name, url = line.rsplit("(", 1)
-                                source_dict[name.strip()] = url.strip("() ")
-                            except:
-                                source_dict[line.strip()] = None
-                        else:
-                            source_dict[line.strip()] = None
-            elif isinstance(raw_sources, list):
-                for src in raw_sources:
-                    if isinstance(src, dict) and "title" in src and "location" in src:
-                        source_dict[src["title"]] = src["location"]
-
-            # Store results
-            final_json_output[f"question_{idx+1}"] = {
-                "question_text": question,
-                "score": int(parsed_appraisal.get("score") or 0),
-                "scoring": parsed_appraisal.get("scoring", ""),
-                "sources": source_dict,
-                "rationale": {
-                    "rag_response": rag_response,
-                    "web_response": web_response,
-                    "agent_commentary": parsed_appraisal.get("agent_commentary", "")
-                }
-            }
-
-            # Update context
-            context_store[question] = {
-                "step_1": {"step_output": rag_response},
-                "step_2": {"step_output": web_response},
-                "step_3": parsed_appraisal
-            }
-
-        except Exception as e:
-            final_json_output[f"question_{idx+1}"] = {
-                "question_text": question,
-                "score": 0,
-                "scoring": "Error during processing",
-                "sources": {},
-                "rationale": {
-                    "rag_response": "",
-                    "web_response": "",
-                    "agent_commentary": str(e)
-                }
-            }
-
-    # Yield final results
-    yield json.dumps({"type": "complete", "results": final_json_output})
+        # Don't hold the worker for questions or a chain build that were cancelled
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        step_executor.shutdown(wait=False, cancel_futures=True)
+        # The chain's HTTP client is this run's own; release its connections
+        http_client = chain_http_client(rag_chain)
+        if http_client is not None:
+            http_client.close()
 
 # Add this function to extract sections from the analyst output
 def extract_sections_from_appraisal(text):
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import analyze, get_folders
+from .views import analyze, get_folders, resume
 
 urlpatterns = [
     path('analyze/', analyze, name='analyze'),
     path('folders/', get_folders, name='csuite_folders'),
+    path('resume/<str:run_id>/', resume, name='csuite_resume'),
 ]
\ No newline at end of file
@@ -1,10 +1,16 @@
 from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework.response import Response
-from .tasks import run_agent_analysis
+from .tasks import resolve_dependencies, DEFAULT_CONCURRENCY, HEARTBEAT
+from .runs import start_run, claim_run, astream_run, DEFAULT_HEARTBEAT_INTERVAL, DEFAULT_STALE_AFTER
+from .models import AnalysisRun
+from django.core.exceptions import ValidationError
 from .questions import IC_Questions
 import os
 import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework.decorators import api_view
 from tapestrysdk import fetch_library_data
 
@@ -30,22 +36,71 @@ def get_folders(request):
     # GET request - return empty list as we now require folder_id
     return Response({"folders": []})
 
+def boolean_flag(value, name, default=False):
+    """
+    Parse a boolean from request input: JSON true/false or the strings
+    "true"/"false" ("false" must not turn into True). Returns (value, None),
+    or (None, error response) for anything else.
+    """
+    if value is None:
+        return default, None
+    if isinstance(value, bool):
+        return value, None
+    if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+        return value.strip().lower() == 'true', None
+    return None, JsonResponse({'error': f'{name} must be true or false'}, status=400)
+
+def parse_concurrency(value):
+    """
+    Validate the requested number of questions run at once, clamped to
+    CSUITE_CONCURRENCY. Returns (concurrency, None) or (None, error response).
+    """
+    limit = getattr(settings, 'CSUITE_CONCURRENCY', DEFAULT_CONCURRENCY)
+    if value is None:
+        return limit, None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return None, JsonResponse({'error': 'concurrency must be an integer'}, status=400)
+    try:
+        value = int(value)
+    except ValueError:
+        return None, JsonResponse({'error': 'concurrency must be an integer'}, status=400)
+    if value < 1:
+        return None, JsonResponse({'error': 'concurrency must be at least 1'}, status=400)
+    return min(value, limit), None
+
 @csrf_exempt
-def analyze(request):
+@require_POST
+async def analyze(request):
     """Run the C-Suite analysis with provided questions and folder, streaming progress."""
-    if request.method != 'POST':
-        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
-        
     try:
         data = json.loads(request.body)
         questions = data.get('questions', IC_Questions)
         folder = data.get('folder')
+        concurrency = data.get('concurrency')
+        depends_on = data.get('depends_on')
         
         if not folder:
             return JsonResponse({'error': 'No folder provided'}, status=400)
+        bypass_cache, error = boolean_flag(data.get('bypass_cache'), 'bypass_cache')
+        if error:
+            return error
+        previous_context, error = boolean_flag(data.get('previous_context'), 'previous_context', True)
+        if error:
+            return error
+        if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q.strip() for q in questions):
+            return JsonResponse({'error': 'questions must be a non-empty list of strings'}, status=400)
+        concurrency, error = parse_concurrency(concurrency)
+        if error:
+            return error
+        try:
+            resolve_dependencies(len(questions), depends_on, previous_context)
+        except (TypeError, ValueError) as e:
+            return JsonResponse({'error': f'Invalid depends_on: {str(e)}'}, status=400)
             
         # Get folder data from Tapestry
-        folder_data = fetch_library_data(request.headers.get('X-Tapestry-API-Key'), folder)
+        folder_data = await sync_to_async(fetch_library_data, thread_sensitive=False)(
+            request.headers.get('X-Tapestry-API-Key'), folder
+        )
         if not folder_data:
             return JsonResponse({'error': 'Failed to fetch folder data'}, status=400)
             
@@ -54,12 +109,64 @@ def analyze(request):
     except Exception as e:
         return JsonResponse({'error': f'Error processing request data: {str(e)}'}, status=400)
     
-    # Define the generator for SSE
-    def event_stream():
-        analysis_generator = run_agent_analysis(questions=questions, folder=folder_data)
-        for update in analysis_generator:
-            yield f'data: {update}\n\n'
+    # Record the run so its finished questions survive a dropped connection
+    run = await sync_to_async(start_run)(questions, folder, folder_data, {
+        "bypass_cache": bypass_cache,
+        "concurrency": concurrency,
+        "depends_on": depends_on,
+        "previous_context": previous_context
+    })
+    return sse_response(run)
+
+def sse_response(run):
+    """Stream a run's events as SSE, with keep-alive comments while it is quiet."""
+    heartbeat_interval = getattr(settings, 'CSUITE_SSE_HEARTBEAT', DEFAULT_HEARTBEAT_INTERVAL)
+
+    async def event_stream():
+        updates = astream_run(run, heartbeat_interval)
+        try:
+            async for update in updates:
+                if update is HEARTBEAT:
+                    # SSE comment: ignored by clients, keeps proxies from timing out
+                    yield ': keep-alive\n\n'
+                else:
+                    yield f'data: {update}\n\n'
+        finally:
+            # Cancels the run if the client went away before it finished
+            await updates.aclose()
 
     response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
     response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
     return response
+
+@csrf_exempt
+@require_POST
+async def resume(request, run_id):
+    """
+    Resume an analysis run by id: finished questions are replayed at once
+    and only the remaining (or failed) ones are run. The folder is fetched
+    again with the caller's X-Tapestry-API-Key, which both checks access
+    and refreshes its file URLs. A run another stream is still driving is
+    refused; one left running by a crashed worker can be resumed once it
+    has not been updated for CSUITE_RUN_STALE_AFTER seconds.
+    """
+    try:
+        run = await AnalysisRun.objects.aget(pk=run_id)
+    except (AnalysisRun.DoesNotExist, ValidationError):
+        return JsonResponse({'error': f'Run {run_id} not found'}, status=404)
+    
+    api_key = request.headers.get('X-Tapestry-API-Key')
+    if not api_key:
+        return JsonResponse({'error': 'X-Tapestry-API-Key header is required'}, status=401)
+    folder_data = await sync_to_async(fetch_library_data, thread_sensitive=False)(api_key, run.folder)
+    if not folder_data:
+        return JsonResponse({'error': 'Failed to fetch folder data'}, status=400)
+    
+    stale_after = getattr(settings, 'CSUITE_RUN_STALE_AFTER', DEFAULT_STALE_AFTER)
+    if not await sync_to_async(claim_run)(run, stale_after):
+        return JsonResponse({'error': f'Run {run_id} is still running', 'status': 'running'}, status=409)
+    
+    run.folder_data = folder_data
+    await AnalysisRun.objects.filter(pk=run.pk).aupdate(folder_data=folder_data)
+    return sse_response(run)
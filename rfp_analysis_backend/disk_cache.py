@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class DiskCache:
+    """
+    A small JSON-on-disk key/value cache shared by every worker on a host.
+
+    Each entry is one file named by the SHA-256 of its key. Entries expire
+    after `ttl` seconds, and when the directory grows past `max_bytes` the
+    least recently used entries (by file mtime, refreshed on every hit) are
+    evicted until it is back under 90% of the limit.
+    """
+
+    def __init__(self, directory, ttl, max_bytes):
+        self.directory = str(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def hash_key(key):
+        """Hash any JSON-serializable key into a stable hex digest."""
+        if not isinstance(key, str):
+            key = json.dumps(key, sort_keys=True, default=str, separators=(",", ":"))
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], f"{digest}.json")
+
+    def get_entry(self, key):
+        """
+        Return the raw entry ({"value", "created"}) for a key even if it has
+        expired, or None if there is no entry.
+        """
+        path = self._path(self.hash_key(key))
+        try:
+            with open(path, "r") as file:
+                entry = json.load(file)
+            # Touch the file so eviction treats it as recently used
+            os.utime(path, None)
+            return entry
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+    def get(self, key, default=None):
+        """Return the cached value for a key, or default if missing or expired."""
+        entry = self.get_entry(key)
+        if entry is None or self.is_expired(entry):
+            return default
+        return entry["value"]
+
+    def is_expired(self, entry):
+        return time.time() - entry.get("created", 0) > self.ttl
+
+    def set(self, key, value):
+        """Store a JSON-serializable value under a key."""
+        path = self._path(self.hash_key(key))
+        data = json.dumps({"value": value, "created": time.time()}, default=str)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temp file and rename so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as file:
+                file.write(data)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {path}: {e}")
+            self._remove(tmp_path)
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def delete(self, key):
+        self._remove(self._path(self.hash_key(key)))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Remove least recently used entries until under 90% of max_bytes."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        target = self.max_bytes * 0.9
+        size = sum(entry_size for _, entry_size, _ in entries)
+        removed = 0
+        for path, entry_size, _ in entries:
+            if size <= target:
+                break
+            self._remove(path)
+            size -= entry_size
+            removed += 1
+        self._size = size
+        if removed:
+            logger.info(f"Evicted {removed} entries from {self.directory}")
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import threading
+from disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable from Django settings
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Request options that change how a call is made but not what it returns
+IGNORED_KWARGS = {"timeout", "stream", "stream_options"}
+
+
+class LLMCache:
+    """
+    Exact-match cache for LLM completions.
+
+    Responses are keyed by a hash of (model, messages or prompt, generation
+    kwargs) and stored on disk with a TTL and size-bounded eviction, so an
+    identical call made by any worker is answered without going back to the
+    model. Hit, miss and bypass counts are kept per process.
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.store = DiskCache(directory, ttl, max_bytes)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0}
+
+    @staticmethod
+    def make_key(model, messages, generation_kwargs=None):
+        kwargs = {k: v for k, v in (generation_kwargs or {}).items() if k not in IGNORED_KWARGS}
+        return {"model": model, "messages": messages, "kwargs": kwargs}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _lookup(self, key, bypass):
+        if bypass:
+            self._count("bypassed")
+            return None
+        value = self.store.get(key)
+        if value == "":
+            # Empty replies are never worth replaying
+            value = None
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    @staticmethod
+    def _storable(value, cacheable=None):
+        """Whether a fresh response may be cached: non-empty and accepted by cacheable."""
+        if value is None or value == "":
+            return False
+        if cacheable is None:
+            return True
+        try:
+            return bool(cacheable(value))
+        except Exception as e:
+            logger.warning(f"Not caching response that failed validation: {e}")
+            return False
+
+    def get(self, model, messages, generation_kwargs, bypass=False):
+        """Return the cached response for this call, or None."""
+        return self._lookup(self.make_key(model, messages, generation_kwargs), bypass)
+
+    def set(self, model, messages, generation_kwargs, value, cacheable=None):
+        """Store a response produced outside get_or_create, e.g. from a stream."""
+        if self._storable(value, cacheable):
+            self.store.set(self.make_key(model, messages, generation_kwargs), value)
+
+    def get_or_create(self, model, messages, generation_kwargs, producer, bypass=False, cacheable=None):
+        """
+        Return the cached response for this call, or call producer() and cache
+        its JSON-serializable result. With bypass the cache is not read, but the
+        fresh response still replaces the stored one.
+
+        Empty responses are never cached. Pass cacheable(value) to cache only
+        responses the caller will accept (e.g. ones that parse and validate),
+        so a bad reply is not replayed to a retry or a later request.
+        """
+        key = self.make_key(model, messages, generation_kwargs)
+        value = self._lookup(key, bypass)
+        if value is not None:
+            return value
+        value = producer()
+        if self._storable(value, cacheable):
+            self.store.set(key, value)
+        return value
+
+    async def aget_or_create(self, model, messages, generation_kwargs, producer, bypass=False, cacheable=None):
+        """
+        Async variant of get_or_create; producer is a coroutine function. The
+        disk reads, writes and eviction run in a worker thread.
+        """
+        key = self.make_key(model, messages, generation_kwargs)
+        value = await asyncio.to_thread(self._lookup, key, bypass)
+        if value is not None:
+            return value
+        value = await producer()
+        if self._storable(value, cacheable):
+            await asyncio.to_thread(self.store.set, key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    """Return the per-process LLM cache, configured from Django settings."""
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                from django.conf import settings
+                _llm_cache = LLMCache(
+                    getattr(settings, "LLM_CACHE_DIR", settings.BASE_DIR / ".cache" / "llm"),
+                    ttl=getattr(settings, "LLM_CACHE_TTL", DEFAULT_TTL),
+                    max_bytes=getattr(settings, "LLM_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES),
+                )
+    return _llm_cache
@@ -1,10 +1,13 @@
 import os
 import time
+import asyncio
+import weakref
 from dotenv import load_dotenv
 
 load_dotenv()
 
 from pinecone import Pinecone, ServerlessSpec
+from pinecone.exceptions import NotFoundException
 from haystack_integrations.document_stores.pinecone import PineconeDocumentStore
 
 # Retrieve your Pinecone API key and environment from environment variables.
@@ -67,6 +70,89 @@ def get_document_store(session_id=None):
             index=index_name,
         )
 
+# Data-plane hosts never change for an index, so describe each one only once
+_index_hosts = {}
+
+# Keep-alive async index handles, per event loop and index name
+_async_indexes = weakref.WeakKeyDictionary()
+
+def get_index_host(index_name):
+    """Return the data-plane host for an index, caching the describe call"""
+    if index_name not in _index_hosts:
+        _index_hosts[index_name] = pc.describe_index(index_name).host
+    return _index_hosts[index_name]
+
+def _close_async_index(loop, index):
+    """Close a pooled handle on the event loop that owns it"""
+    if loop.is_closed():
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        loop.create_task(index.close())
+    elif loop.is_running():
+        asyncio.run_coroutine_threadsafe(index.close(), loop)
+
+def forget_index_host(index_name):
+    """Drop a cached host and close pooled handles once their index has been deleted"""
+    _index_hosts.pop(index_name, None)
+    for loop, indexes in list(_async_indexes.items()):
+        index = indexes.pop(index_name, None)
+        if index is not None:
+            _close_async_index(loop, index)
+
+async def get_async_index(index_name):
+    """
+    Return a pooled IndexAsyncio handle for an index on the running event loop.
+    Handles are kept open so repeated queries reuse the same connections.
+    """
+    loop = asyncio.get_running_loop()
+    indexes = _async_indexes.setdefault(loop, {})
+    if index_name not in indexes:
+        host = _index_hosts.get(index_name) or await asyncio.to_thread(get_index_host, index_name)
+        indexes[index_name] = pc.IndexAsyncio(host=host)
+    return indexes[index_name]
+
+async def aquery_index(index_name, vector, top_k=10, namespace="default", include_metadata=True):
+    """Query an index without blocking the event loop"""
+    index = await get_async_index(index_name)
+    try:
+        return await index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=include_metadata,
+            namespace=namespace
+        )
+    except NotFoundException:
+        # Deleted by another worker: don't keep querying a stale host
+        forget_index_host(index_name)
+        raise
+
+def list_vector_ids(index_name, namespace="default"):
+    """Yield every vector id in an index namespace, page by page"""
+    index = pc.Index(host=get_index_host(index_name))
+    for ids in index.list(namespace=namespace):
+        yield from ids
+
+def _fetch_batches(index, vector_ids, namespace, batch_size):
+    for start in range(0, len(vector_ids), batch_size):
+        response = index.fetch(ids=vector_ids[start:start + batch_size], namespace=namespace)
+        for vector_id, vector in response.vectors.items():
+            yield vector_id, vector.values, vector.metadata or {}
+
+def fetch_vectors(index_name, vector_ids, namespace="default", batch_size=100):
+    """Yield (id, values, metadata) for the given vector ids, fetched in batches"""
+    index = pc.Index(host=get_index_host(index_name))
+    yield from _fetch_batches(index, list(vector_ids), namespace, batch_size)
+
+def iter_index_vectors(index_name, namespace="default", batch_size=100):
+    """Yield (id, values, metadata) for every vector in an index namespace"""
+    index = pc.Index(host=get_index_host(index_name))
+    for ids in index.list(namespace=namespace):
+        yield from _fetch_batches(index, ids, namespace, batch_size)
+
 def reset_document_store(session_id=None):
     """Reset a document store for a specific session"""
     index_name = get_session_index_name(session_id) if session_id else "rfp-analysis"
@@ -74,6 +160,7 @@ def reset_document_store(session_id=None):
     # Delete the index if it exists
     if index_name in pc.list_indexes().names():
         pc.delete_index(index_name)
+        forget_index_host(index_name)
     
     # Create a new index
     pc.create_index(
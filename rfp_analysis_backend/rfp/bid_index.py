@@ -0,0 +1,358 @@
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+import numpy as np
+from numpy.lib.format import open_memmap
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# The historical bids corpus and where its centroid index is kept
+BID_SOURCE_INDEX = "paidmediabids"
+IDS_FILE = "bids.json"
+INDEXED_VECTORS_FILE = "indexed_vectors.txt"
+LOCK_FILE = ".lock"
+
+# Defaults, overridable from Django settings
+DEFAULT_REFRESH_INTERVAL = 15 * 60
+
+# Metadata fields that may name the source document of a chunk
+BID_ID_FIELDS = ("filename", "file_name", "source", "doc_id")
+
+
+def bid_id_for(vector_id, metadata):
+    """Name of the historical bid a chunk belongs to."""
+    for field in BID_ID_FIELDS:
+        if metadata.get(field):
+            return str(metadata[field])
+    # Chunk ids without metadata are often "<document>#<chunk>"
+    return vector_id.split("#")[0]
+
+
+class BidCentroidIndex:
+    """
+    One centroid vector per historical bid document.
+
+    The centroids are the mean of each bid's chunk embeddings, stored as a
+    float32 .npy matrix that workers memory-map read-only, so every process
+    on a host shares the same pages. A JSON sidecar holds the bid ids, the
+    chunk count behind each centroid and the name of the current matrix
+    file. Updates write a new matrix file and then replace the sidecar, so
+    readers always see a consistent pair.
+
+    The Pinecone ids already folded into the centroids are kept in a
+    separate file, letting update() fetch only new chunks and fold them in
+    as running means.
+    """
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self.ids = []
+        self.counts = []
+        self.matrix = None
+        self.norms = None
+        self.version = None
+
+    @property
+    def ids_path(self):
+        return os.path.join(self.directory, IDS_FILE)
+
+    @property
+    def indexed_vectors_path(self):
+        return os.path.join(self.directory, INDEXED_VECTORS_FILE)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def exists(self):
+        return os.path.exists(self.ids_path)
+
+    def disk_version(self):
+        """Version of the index currently on disk, or None if there is none."""
+        try:
+            with open(self.ids_path, "r") as file:
+                return json.load(file)["version"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def load(self):
+        with open(self.ids_path, "r") as file:
+            sidecar = json.load(file)
+        self.ids = sidecar["ids"]
+        self.counts = sidecar["counts"]
+        self.version = sidecar["version"]
+        if self.ids:
+            self._set_matrix(np.load(os.path.join(self.directory, sidecar["vectors"]), mmap_mode="r"))
+        else:
+            self._set_matrix(np.empty((0, 0), dtype=np.float32))
+        logger.info(f"Loaded {len(self.ids)} bid centroids from {self.directory}")
+        return self
+
+    def save(self, indexed_vector_ids=None):
+        """
+        Write the matrix to a new versioned file, then atomically replace the
+        sidecar to point at it. Pass indexed_vector_ids to rewrite the list of
+        Pinecone ids covered by the centroids.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        previous = self.disk_version()
+        self.version = str(time.time_ns())
+        vectors_file = f"centroids-{self.version}.npy"
+
+        if self.ids:
+            matrix = open_memmap(
+                os.path.join(self.directory, vectors_file), mode="w+",
+                dtype=np.float32, shape=self.matrix.shape
+            )
+            matrix[:] = self.matrix
+            matrix.flush()
+            del matrix
+
+        if indexed_vector_ids is not None:
+            self._write_atomic(self.indexed_vectors_path, "\n".join(indexed_vector_ids))
+        self._write_atomic(self.ids_path, json.dumps({
+            "version": self.version,
+            "vectors": vectors_file,
+            "ids": self.ids,
+            "counts": self.counts
+        }))
+
+        # Workers still mapping the old file keep it until they reload
+        if previous:
+            self._remove(os.path.join(self.directory, f"centroids-{previous}.npy"))
+
+    def _write_atomic(self, path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def indexed_vector_ids(self):
+        try:
+            with open(self.indexed_vectors_path, "r") as file:
+                return set(file.read().split())
+        except FileNotFoundError:
+            return set()
+
+    def lock(self):
+        """Exclusive lock so only one process rebuilds or updates the index at a time."""
+        os.makedirs(self.directory, exist_ok=True)
+        return _FileLock(os.path.join(self.directory, LOCK_FILE))
+
+    def _set_matrix(self, matrix):
+        self.matrix = matrix if isinstance(matrix, np.memmap) else np.asarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(self.matrix, axis=1) if len(self.matrix) else np.empty(0, dtype=np.float32)
+        # Avoid dividing by zero for empty rows; they simply score 0
+        norms[norms == 0] = 1.0
+        self.norms = norms
+
+    def _accumulate(self, vectors):
+        """Sum chunk vectors per bid: returns ({bid: sum}, {bid: count}, [vector ids])."""
+        sums = {}
+        counts = {}
+        vector_ids = []
+        for vector_id, values, metadata in vectors:
+            bid_id = bid_id_for(vector_id, metadata)
+            vector = np.asarray(values, dtype=np.float32)
+            if bid_id in sums:
+                sums[bid_id] += vector
+                counts[bid_id] += 1
+            else:
+                sums[bid_id] = vector.copy()
+                counts[bid_id] = 1
+            vector_ids.append(vector_id)
+        return sums, counts, vector_ids
+
+    def build(self, vectors):
+        """
+        Build the centroids from an iterable of (id, values, metadata) chunk
+        vectors, e.g. pinecone_store.iter_index_vectors(BID_SOURCE_INDEX),
+        and save them.
+        """
+        sums, counts, vector_ids = self._accumulate(vectors)
+        self.ids = sorted(sums)
+        self.counts = [counts[bid_id] for bid_id in self.ids]
+        if self.ids:
+            self._set_matrix(np.stack([sums[bid_id] / counts[bid_id] for bid_id in self.ids]))
+        else:
+            self._set_matrix(np.empty((0, 0), dtype=np.float32))
+        self.save(vector_ids)
+        logger.info(f"Built {len(self.ids)} bid centroids from {len(vector_ids)} chunks")
+        return self
+
+    def update(self, vectors):
+        """
+        Fold new chunk vectors into the centroids as running means, adding
+        rows for bids not seen before, and save. Returns the number of
+        chunks added.
+        """
+        sums, counts, vector_ids = self._accumulate(vectors)
+        if not vector_ids:
+            return 0
+
+        matrix = np.array(self.matrix, dtype=np.float32) if self.ids else None
+        positions = {bid_id: i for i, bid_id in enumerate(self.ids)}
+        new_rows = []
+        for bid_id, total in sums.items():
+            added = counts[bid_id]
+            if bid_id in positions:
+                i = positions[bid_id]
+                seen = self.counts[i]
+                matrix[i] = (matrix[i] * seen + total) / (seen + added)
+                self.counts[i] = seen + added
+            else:
+                self.ids.append(bid_id)
+                self.counts.append(added)
+                new_rows.append(total / added)
+        if new_rows:
+            new_rows = np.stack(new_rows)
+            matrix = new_rows if matrix is None else np.vstack([matrix, new_rows])
+        self._set_matrix(matrix)
+        self.save(sorted(self.indexed_vector_ids().union(vector_ids)))
+        logger.info(f"Folded {len(vector_ids)} new chunks into {len(sums)} bid centroids")
+        return len(vector_ids)
+
+    def similarities(self, queries):
+        """
+        Cosine similarity of each query vector (rows of a 2-D array) against
+        every bid centroid, as a (queries x bids) matrix.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        query_norms[query_norms == 0] = 1.0
+        return (queries / query_norms) @ self.matrix.T / self.norms
+
+    def nearest(self, queries, weights=None, top_k=10):
+        """
+        Rank bids by the weighted mean of their similarity to the query
+        vectors. Returns a list of {"bid", "score", "chunks"} dicts.
+        """
+        if not self.ids:
+            return []
+        scores = self.similarities(queries)
+        scores = np.average(scores, axis=0, weights=weights)
+        top_k = min(top_k, len(self.ids))
+        # argpartition avoids sorting every bid when only the top few are wanted
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {"bid": self.ids[i], "score": round(float(scores[i]), 4), "chunks": self.counts[i]}
+            for i in top
+        ]
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "w")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def refresh_bid_index(index, full=False, namespace="default"):
+    """
+    Bring the on-disk index up to date with paidmediabids: a full rebuild,
+    or fetch only the chunk ids not yet folded in. Returns the number of
+    chunks processed.
+    """
+    from pinecone_store import iter_index_vectors, list_vector_ids, fetch_vectors
+
+    with index.lock():
+        if full or not index.exists():
+            index.build(iter_index_vectors(BID_SOURCE_INDEX, namespace=namespace))
+            return sum(index.counts)
+
+        index.load()
+        known = index.indexed_vector_ids()
+        new_ids = [
+            vector_id for vector_id in list_vector_ids(BID_SOURCE_INDEX, namespace=namespace)
+            if vector_id not in known
+        ]
+        if not new_ids:
+            return 0
+        return index.update(fetch_vectors(BID_SOURCE_INDEX, new_ids, namespace=namespace))
+
+
+class BidIndexRefresher(threading.Thread):
+    """
+    Background thread that keeps a worker's bid index current.
+
+    Every interval it folds new paidmediabids chunks into the on-disk index
+    (the file lock lets only one worker do the Pinecone work) and reloads
+    the memory-mapped matrix if another process has written a newer one.
+    """
+
+    def __init__(self, interval, update=True):
+        super().__init__(name="bid-index-refresher", daemon=True)
+        self.interval = interval
+        self.update = update
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                if self.update:
+                    refresh_bid_index(BidCentroidIndex(_bid_index.directory))
+                _reload_if_changed()
+            except Exception as e:
+                logger.error(f"Bid index refresh failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_bid_index = None
+_bid_index_lock = threading.Lock()
+_refresher = None
+
+def _reload_if_changed():
+    global _bid_index
+    version = _bid_index.disk_version()
+    if version and version != _bid_index.version:
+        # Swap in a freshly loaded index; requests holding the old one finish on it
+        _bid_index = BidCentroidIndex(_bid_index.directory).load()
+
+def get_bid_index():
+    """
+    Return the per-process bid centroid index, loaded once per worker. If
+    nothing is on disk yet it is built from Pinecone first (normally the
+    build_bid_index management command does this ahead of time). A
+    background refresher keeps it current every BID_INDEX_REFRESH_INTERVAL
+    seconds; set the interval to 0 to disable it.
+    """
+    global _bid_index, _refresher
+    if _bid_index is None:
+        with _bid_index_lock:
+            if _bid_index is None:
+                index = BidCentroidIndex(
+                    getattr(settings, "BID_INDEX_DIR", settings.BASE_DIR / ".cache" / "bid_index")
+                )
+                if not index.exists():
+                    # Not full: workers that waited on the lock find the index built and only top it up
+                    refresh_bid_index(index)
+                _bid_index = index.load()
+
+                interval = getattr(settings, "BID_INDEX_REFRESH_INTERVAL", DEFAULT_REFRESH_INTERVAL)
+                if interval:
+                    _refresher = BidIndexRefresher(
+                        interval, update=getattr(settings, "BID_INDEX_AUTO_UPDATE", True)
+                    )
+                    _refresher.start()
+    return _bid_index
@@ -0,0 +1,136 @@
+import logging
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable from Django settings
+DEFAULT_RECENT_MESSAGES = 6
+DEFAULT_TOKEN_BUDGET = 1500
+DEFAULT_SUMMARY_TOKENS = 300
+DEFAULT_REUSE_THRESHOLD = 0.9
+DEFAULT_TTL = 24 * 60 * 60
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation about an Information Memorandum. "
+    "Fold the new messages into the existing summary. Keep facts, figures, names and open "
+    "questions; drop pleasantries. Reply with the updated summary only."
+)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) used for the history budget."""
+    return len(text or "") // 4 + 1
+
+
+def memory_cache_key(session_id):
+    return f"chat_memory_{session_id}"
+
+
+class ConversationMemory:
+    """
+    Per-session chat memory.
+
+    The most recent messages are kept verbatim; older ones are folded into a
+    rolling summary so the history sent with each question stays under a
+    token budget. The chunks retrieved for the last question are remembered
+    with its embedding so a close follow-up can reuse them instead of
+    querying Pinecone again.
+    """
+
+    def __init__(self, session_id, summary="", messages=None, query_embedding=None, chunks=None):
+        self.session_id = session_id
+        self.summary = summary
+        self.messages = messages or []
+        self.query_embedding = query_embedding
+        self.chunks = chunks or []
+
+    @classmethod
+    def from_dict(cls, session_id, data):
+        return cls(session_id, **data) if data else cls(session_id)
+
+    def to_dict(self):
+        return {
+            "summary": self.summary,
+            "messages": self.messages,
+            "query_embedding": self.query_embedding,
+            "chunks": self.chunks,
+        }
+
+    def history(self):
+        """Messages to place before the new question: the summary, then recent turns."""
+        history = []
+        if self.summary:
+            history.append({"role": "system", "content": f"Summary of the conversation so far: {self.summary}"})
+        return history + self.messages
+
+    def reusable_chunks(self, query_embedding):
+        """Return the last retrieved chunks if this question is close enough to the last one."""
+        if not self.chunks or self.query_embedding is None:
+            return None
+        previous = np.asarray(self.query_embedding, dtype=np.float32)
+        current = np.asarray(query_embedding, dtype=np.float32)
+        denominator = np.linalg.norm(previous) * np.linalg.norm(current)
+        if not denominator:
+            return None
+        similarity = float(previous @ current / denominator)
+        threshold = getattr(settings, "CHAT_MEMORY_REUSE_THRESHOLD", DEFAULT_REUSE_THRESHOLD)
+        if similarity >= threshold:
+            logger.info(f"Reusing {len(self.chunks)} chunks for follow-up (similarity {similarity:.3f})")
+            return self.chunks
+        return None
+
+    def remember_chunks(self, query_embedding, chunks):
+        self.query_embedding = list(query_embedding)
+        self.chunks = chunks
+
+    def add_turn(self, question, answer):
+        self.messages.append({"role": "user", "content": question})
+        self.messages.append({"role": "assistant", "content": answer})
+
+    def _over_budget(self):
+        recent = getattr(settings, "CHAT_MEMORY_RECENT_MESSAGES", DEFAULT_RECENT_MESSAGES)
+        budget = getattr(settings, "CHAT_MEMORY_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET)
+        tokens = estimate_tokens(self.summary) + sum(estimate_tokens(m["content"]) for m in self.messages)
+        return len(self.messages) > recent or (tokens > budget and len(self.messages) > 2)
+
+    async def compact(self, client, model):
+        """Fold the oldest turns into the rolling summary until within budget."""
+        folded = []
+        while self._over_budget():
+            # Always fold a whole question/answer pair
+            folded.extend(self.messages[:2])
+            self.messages = self.messages[2:]
+        if not folded:
+            return
+
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in folded)
+        response = await client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Existing summary: {self.summary or '(none)'}\n\nNew messages:\n{transcript}"}
+            ],
+            temperature=0,
+            max_tokens=getattr(settings, "CHAT_MEMORY_SUMMARY_TOKENS", DEFAULT_SUMMARY_TOKENS)
+        )
+        self.summary = response.choices[0].message.content.strip()
+        logger.info(f"Folded {len(folded)} messages into the summary for session {self.session_id}")
+
+
+async def load_memory(session_id):
+    data = await cache.aget(memory_cache_key(session_id))
+    return ConversationMemory.from_dict(session_id, data)
+
+
+async def save_memory(memory):
+    await cache.aset(
+        memory_cache_key(memory.session_id),
+        memory.to_dict(),
+        getattr(settings, "CHAT_MEMORY_TTL", DEFAULT_TTL)
+    )
+
+
+def clear_memory(session_id):
+    cache.delete(memory_cache_key(session_id))
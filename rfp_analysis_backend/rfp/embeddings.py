@@ -0,0 +1,37 @@
+import asyncio
+
+# OpenAI accepts up to 2048 inputs per embeddings request
+EMBEDDING_BATCH_SIZE = 256
+
+# Embedding requests in flight at once per call, to stay inside rate limits
+EMBEDDING_CONCURRENCY = 4
+
+
+async def embed_texts(client, texts, model="text-embedding-ada-002", batch_size=EMBEDDING_BATCH_SIZE,
+                      concurrency=EMBEDDING_CONCURRENCY):
+    """
+    Embed a list of texts with an AsyncOpenAI client.
+
+    Batches are sent concurrently, at most `concurrency` at a time, and the
+    embeddings are returned in input order.
+    """
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def embed_batch(batch):
+        async with semaphore:
+            return await client.embeddings.create(model=model, input=batch)
+
+    responses = await asyncio.gather(*[embed_batch(batch) for batch in batches])
+    embeddings = []
+    for response in responses:
+        embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return embeddings
+
+
+async def embed_documents(client, documents, model="text-embedding-ada-002"):
+    """Set the embedding on each haystack Document in place and return the documents."""
+    embeddings = await embed_texts(client, [doc.content or "" for doc in documents], model=model)
+    for doc, embedding in zip(documents, embeddings):
+        doc.embedding = embedding
+    return documents
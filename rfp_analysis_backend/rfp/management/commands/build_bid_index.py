@@ -0,0 +1,31 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rfp.bid_index import BidCentroidIndex, refresh_bid_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Build or incrementally update the local centroid index of historical bids "
+        "in paidmediabids used by compare-indexes/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Rebuild from every chunk instead of folding in only new ones"
+        )
+        parser.add_argument("--namespace", default="default", help="Pinecone namespace to read")
+
+    def handle(self, *args, **options):
+        index = BidCentroidIndex(settings.BID_INDEX_DIR)
+        started = time.perf_counter()
+        processed = refresh_bid_index(index, full=options["full"], namespace=options["namespace"])
+        elapsed = time.perf_counter() - started
+
+        if processed:
+            self.stdout.write(self.style.SUCCESS(
+                f"Indexed {processed} chunks; {len(index)} bids in {index.directory} ({elapsed:.1f}s)"
+            ))
+        else:
+            self.stdout.write(f"Bid index is up to date ({elapsed:.1f}s)")
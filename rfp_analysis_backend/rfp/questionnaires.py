@@ -0,0 +1,41 @@
+import threading
+from disk_cache import DiskCache
+
+# Defaults, overridable from Django settings
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def questionnaire_cache_key(batch_id):
+    return f"questionnaire_{batch_id}"
+
+
+_questionnaire_store = None
+_questionnaire_store_lock = threading.Lock()
+
+def get_questionnaire_store():
+    """
+    Return the on-disk store of chat-batch/ results. It lives on disk rather
+    than in the per-process cache so download-questionnaire/ finds a batch
+    whichever worker answered it.
+    """
+    global _questionnaire_store
+    if _questionnaire_store is None:
+        with _questionnaire_store_lock:
+            if _questionnaire_store is None:
+                from django.conf import settings
+                _questionnaire_store = DiskCache(
+                    getattr(settings, "QUESTIONNAIRE_CACHE_DIR", settings.BASE_DIR / ".cache" / "questionnaires"),
+                    getattr(settings, "QUESTIONNAIRE_TTL", DEFAULT_TTL),
+                    getattr(settings, "QUESTIONNAIRE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES),
+                )
+    return _questionnaire_store
+
+
+def save_questionnaire(batch_id, batch):
+    get_questionnaire_store().set(questionnaire_cache_key(batch_id), batch)
+
+
+def load_questionnaire(batch_id):
+    """Return a stored batch ({"session_id", "results"}), or None if missing or expired."""
+    return get_questionnaire_store().get(questionnaire_cache_key(batch_id))
@@ -0,0 +1,497 @@
+import io
+import csv
+import json
+import asyncio
+import hashlib
+import zipfile
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.worksheet.table import Table, TableColumn, TableStyleInfo
+
+logger = logging.getLogger(__name__)
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CONTENT_TYPES = {
+    "xlsx": XLSX_CONTENT_TYPE,
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Rendered files are memoized by the hash of their input (default: one day)
+DEFAULT_RENDER_CACHE_TTL = 24 * 60 * 60
+
+# Reports up to this size stay in memory; larger ones spill to a temp file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
+ANALYSIS_HEADERS = ["Section", "Field", "Value", "Confidence", "Interpreted", "Source Page"]
+ANALYSIS_WIDTHS = [20, 25, 40, 12, 12, 15]
+MATRIX_HEADERS = ["Section", "Category", "Requirement", "Priority", "Status", "Assigned To", "Notes"]
+MATRIX_WIDTHS = [22, 20, 60, 10, 12, 15, 40]
+QUESTIONNAIRE_HEADERS = ["#", "Question", "Answer", "Sources"]
+QUESTIONNAIRE_WIDTHS = [6, 50, 80, 30]
+
+# Styles are created once and shared by every cell that uses them
+TITLE_FONT = Font(name='Arial', size=16, bold=True)
+DATE_FONT = Font(name='Arial', size=12, italic=True)
+HEADER_FONT = Font(bold=True)
+HEADER_FILL = PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid")
+HIGH_CONFIDENCE_FILL = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")  # Green
+MEDIUM_CONFIDENCE_FILL = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")  # Yellow
+LOW_CONFIDENCE_FILL = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")  # Red
+WRAP_ALIGNMENT = Alignment(wrap_text=True, vertical="top")
+
+
+def confidence_fill(confidence):
+    if confidence >= 0.8:
+        return HIGH_CONFIDENCE_FILL
+    if confidence >= 0.5:
+        return MEDIUM_CONFIDENCE_FILL
+    if confidence > 0:
+        return LOW_CONFIDENCE_FILL
+    return None
+
+
+def cell_value(value):
+    """Lists and objects from structured analyses are written as text."""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+def iter_analysis_rows(rfp_data):
+    """
+    Yield one row per analysis field, in report column order, with None
+    between sections.
+
+    Fields in the structured format ({"value", "confidence", ...}) fill every
+    column; plain values only fill Section, Field and Value.
+    """
+    for section_name, section_data in rfp_data.items():
+        if not isinstance(section_data, dict):
+            continue
+
+        # Format section name for display
+        display_section = section_name.replace('_', ' ').title()
+
+        for field_name, field_data in section_data.items():
+            display_field = field_name.replace('_', ' ').title()
+
+            if isinstance(field_data, dict) and 'value' in field_data:
+                yield [
+                    display_section,
+                    display_field,
+                    cell_value(field_data.get('value', '')),
+                    field_data.get('confidence', 0),
+                    "Yes" if field_data.get('is_interpreted', False) else "No",
+                    field_data.get('source_page', '')
+                ]
+            else:
+                yield [display_section, display_field, str(field_data), None, None, None]
+
+        # Blank row between sections
+        yield None
+
+
+def _set_widths(ws, widths):
+    for column, width in zip("ABCDEFGHIJ", widths):
+        ws.column_dimensions[column].width = width
+
+
+def _header_row(ws, headers):
+    row = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = HEADER_FONT
+        cell.fill = HEADER_FILL
+        row.append(cell)
+    return row
+
+
+def write_analysis_sheet(wb, rfp_data, generated_on=None):
+    """
+    Append the analysis sheet to a write-only workbook. Rows are streamed to
+    the sheet as they are produced, so memory does not grow with the report.
+    generated_on (a datetime) is printed under the title; memoized renders
+    leave it out so their bytes depend only on the analysis.
+    """
+    ws = wb.create_sheet("RFP Analysis Report")
+    # Layout must be set before the first row is written
+    _set_widths(ws, ANALYSIS_WIDTHS)
+    ws.freeze_panes = 'A5'
+
+    title = WriteOnlyCell(ws, value="RFP Analysis Report")
+    title.font = TITLE_FONT
+    ws.append([title])
+    if generated_on is not None:
+        generated = WriteOnlyCell(ws, value=f"Generated on: {generated_on.strftime('%Y-%m-%d %H:%M:%S')}")
+        generated.font = DATE_FONT
+        ws.append([generated])
+    else:
+        ws.append([])
+    ws.append([])
+    ws.append(_header_row(ws, ANALYSIS_HEADERS))
+
+    last_row = 4
+    for row in iter_analysis_rows(rfp_data):
+        last_row += 1
+        if row is None:
+            ws.append([])
+            continue
+        confidence = row[3]
+        if isinstance(confidence, (int, float)):
+            cell = WriteOnlyCell(ws, value=confidence)
+            cell.number_format = '0.0%'
+            fill = confidence_fill(confidence)
+            if fill is not None:
+                cell.fill = fill
+            row[3] = cell
+        ws.append(row)
+
+    # Table for easy filtering and sorting
+    table = Table(displayName="RFPAnalysisTable", ref=f"A4:F{max(last_row - 1, 5)}")
+    # A write-only sheet can't read the header cells back, so name the columns explicitly
+    table.tableColumns = [TableColumn(id=i, name=header) for i, header in enumerate(ANALYSIS_HEADERS, 1)]
+    table.tableStyleInfo = TableStyleInfo(
+        name="TableStyleMedium9",
+        showFirstColumn=False,
+        showLastColumn=False,
+        showRowStripes=True,
+        showColumnStripes=False
+    )
+    ws.add_table(table)
+    return ws
+
+
+def iter_matrix_rows(matrix):
+    """Yield one row per bid matrix item, in MATRIX_HEADERS order."""
+    for section in matrix.get("sections", []):
+        for item in section.get("items", []):
+            yield [
+                section.get("name", ""),
+                item.get("category", ""),
+                cell_value(item.get("requirement", "")),
+                item.get("priority", ""),
+                item.get("status", ""),
+                item.get("assigned_to", ""),
+                item.get("notes", "")
+            ]
+
+
+def write_matrix_sheet(wb, matrix):
+    """Append the bid matrix sheet to a write-only workbook."""
+    ws = wb.create_sheet("Bid Matrix")
+    _set_widths(ws, MATRIX_WIDTHS)
+    ws.freeze_panes = 'A2'
+    ws.append(_header_row(ws, MATRIX_HEADERS))
+    for row in iter_matrix_rows(matrix):
+        requirement = WriteOnlyCell(ws, value=row[2])
+        requirement.alignment = WRAP_ALIGNMENT
+        row[2] = requirement
+        ws.append(row)
+    return ws
+
+
+def questionnaire_sources(result):
+    return ", ".join(
+        f"{source.get('filename') or 'unknown'} p.{source['page']}" if source.get('page') else (source.get('filename') or 'unknown')
+        for source in result.get("sources", [])
+    )
+
+
+def write_questionnaire_sheet(wb, results):
+    """Append a sheet listing questionnaire answers with their source pages."""
+    ws = wb.create_sheet("Questionnaire")
+    _set_widths(ws, QUESTIONNAIRE_WIDTHS)
+    ws.freeze_panes = 'A2'
+    ws.append(_header_row(ws, QUESTIONNAIRE_HEADERS))
+
+    for result in results:
+        question = WriteOnlyCell(ws, value=result["question"])
+        question.alignment = WRAP_ALIGNMENT
+        answer = WriteOnlyCell(ws, value=result.get("answer") or result.get("error", ""))
+        answer.alignment = WRAP_ALIGNMENT
+        ws.append([result["index"] + 1, question, answer, questionnaire_sources(result)])
+    return ws
+
+
+def build_report(rfp_data=None, questionnaire_results=None):
+    """
+    Render a report workbook into a spooled temp file.
+
+    Args:
+        rfp_data: Analysis dict to render as the main sheet, if any
+        questionnaire_results: chat-batch/ results to add as a sheet, if any
+
+    Returns:
+        A file object positioned at the start of the XLSX data
+    """
+    wb = Workbook(write_only=True)
+    if rfp_data is not None:
+        write_analysis_sheet(wb, rfp_data, generated_on=datetime.now())
+    if questionnaire_results is not None:
+        write_questionnaire_sheet(wb, questionnaire_results)
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    wb.save(output)
+    output.seek(0)
+    return output
+
+
+def _workbook_bytes(write_sheet, data):
+    wb = Workbook(write_only=True)
+    write_sheet(wb, data)
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def _csv_bytes(headers, rows):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(headers)
+    writer.writerows(row for row in rows if row is not None)
+    # Excel needs the BOM to open UTF-8 CSV files correctly
+    return output.getvalue().encode("utf-8-sig")
+
+
+def parquet_available():
+    """Parquet export needs pyarrow, which is an optional dependency."""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _parquet_bytes(headers, rows):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = {header: [] for header in headers}
+    for row in rows:
+        if row is None:
+            continue
+        for header, value in zip(headers, row):
+            columns[header].append(value)
+
+    arrays = []
+    for values in columns.values():
+        # Purely numeric columns (e.g. Confidence) stay numeric; the rest are text
+        if all(value is None or (isinstance(value, (int, float)) and not isinstance(value, bool)) for value in values):
+            arrays.append(pa.array(values, type=pa.float64()))
+        else:
+            arrays.append(pa.array([None if value is None else str(value) for value in values], type=pa.string()))
+
+    output = io.BytesIO()
+    pq.write_table(pa.Table.from_arrays(arrays, names=list(headers)), output)
+    return output.getvalue()
+
+
+RENDERERS = {
+    ("report", "xlsx"): lambda data: _workbook_bytes(write_analysis_sheet, data),
+    ("report", "csv"): lambda data: _csv_bytes(ANALYSIS_HEADERS, iter_analysis_rows(data)),
+    ("matrix", "xlsx"): lambda data: _workbook_bytes(write_matrix_sheet, data),
+    ("matrix", "csv"): lambda data: _csv_bytes(MATRIX_HEADERS, iter_matrix_rows(data)),
+    ("report", "parquet"): lambda data: _parquet_bytes(ANALYSIS_HEADERS, iter_analysis_rows(data)),
+    ("matrix", "parquet"): lambda data: _parquet_bytes(MATRIX_HEADERS, iter_matrix_rows(data)),
+}
+
+
+def content_hash(data):
+    """Stable SHA-256 of a JSON-serializable value."""
+    encoded = json.dumps(data, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def render(kind, file_format, data):
+    """
+    Render an analysis ("report") or bid matrix ("matrix") as file bytes.
+
+    The bytes are memoized in the Django cache under the hash of the input,
+    so downloading an unchanged analysis again is served without
+    re-rendering. Raises ValueError for an unknown kind or format.
+    """
+    renderer = RENDERERS.get((kind, file_format))
+    if renderer is None:
+        raise ValueError(f"Cannot render {kind} as {file_format}")
+
+    key = f"rendered_{kind}_{file_format}_{content_hash(data)}"
+    rendered = cache.get(key)
+    if rendered is None:
+        rendered = renderer(data)
+        cache.set(key, rendered, getattr(settings, "REPORT_RENDER_CACHE_TTL", DEFAULT_RENDER_CACHE_TTL))
+    return rendered
+
+
+def bytes_response(content, filename, file_format):
+    response = HttpResponse(content, content_type=CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    response['Content-Length'] = str(len(content))
+    return response
+
+
+async def aiter_file(file, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield a file in chunks and close it once exhausted or abandoned.
+
+    An async iterator so ASGI streams the file instead of collecting a sync
+    iterator into memory; reads run on a thread as the file may have
+    spilled to disk.
+    """
+    try:
+        while True:
+            chunk = await asyncio.to_thread(file.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file.close()
+
+
+def file_response(file, filename, content_type=XLSX_CONTENT_TYPE):
+    """Stream a rendered file (e.g. from build_report) as an attachment."""
+    size = file.seek(0, 2)
+    file.seek(0)
+    response = StreamingHttpResponse(aiter_file(file), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    response['Content-Length'] = str(size)
+    return response
+
+
+class ZipStreamBuffer(io.RawIOBase):
+    """
+    Write-only, unseekable sink for zipfile.ZipFile.
+
+    ZipFile falls back to data descriptors when it cannot seek, so each
+    member can be handed to the client as soon as it is written and the
+    archive is never held in memory as a whole.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        """Return and clear everything written since the last call."""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_bulk_export(analyses, file_format, max_workers=4, missing=None):
+    """
+    Render many analyses concurrently and yield a ZIP archive of them in chunks.
+
+    Args:
+        analyses: Dict of session_id -> analysis
+        file_format: "xlsx", "csv" or "parquet"
+        max_workers: Size of the rendering thread pool
+        missing: Session ids without an analysis, listed in the manifest
+
+    Each file is added to the archive as soon as its render finishes, and a
+    manifest.json at the end lists what was exported and what failed.
+    """
+    buffer = ZipStreamBuffer()
+    manifest = {"format": file_format, "exported": [], "failed": {}, "missing": list(missing or [])}
+
+    # XLSX and Parquet are already compressed; only CSV gains from deflating
+    compression = zipfile.ZIP_DEFLATED if file_format == "csv" else zipfile.ZIP_STORED
+    with zipfile.ZipFile(buffer, mode="w", compression=compression) as archive:
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bulk-export")
+        try:
+            futures = {
+                executor.submit(render, "report", file_format, analysis): session_id
+                for session_id, analysis in analyses.items()
+            }
+            for future in as_completed(futures):
+                session_id = futures[future]
+                try:
+                    content = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to render export for session {session_id}: {e}")
+                    manifest["failed"][session_id] = str(e)
+                    continue
+                archive.writestr(f"rfp_analysis_{session_id}.{file_format}", content)
+                manifest["exported"].append(session_id)
+                yield buffer.take()
+        finally:
+            # If the generator is closed early, drop the queued renders instead of waiting for them
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+    yield buffer.take()
+
+
+async def aiter_bulk_export(analyses, file_format, max_workers=4, missing=None, max_pending=4):
+    """
+    Async iteration over iter_bulk_export's chunks, for serving under ASGI.
+
+    The archive is built on a thread of its own and its chunks are handed
+    to the event loop through a bounded queue, so at most max_pending
+    rendered files wait on a slow client. If the stream is cancelled or
+    closed early (e.g. the client disconnects) the thread stops after the
+    chunk in hand and the renders not yet started are cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=max_pending)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        """Block until the queue has room; False once the consumer has gone away."""
+        try:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        except RuntimeError:
+            # The event loop has already gone away
+            return False
+        while not stop.is_set():
+            try:
+                future.result(timeout=1)
+                return True
+            except FutureTimeoutError:
+                continue
+        future.cancel()
+        return False
+
+    def produce():
+        chunks = iter_bulk_export(analyses, file_format, max_workers=max_workers, missing=missing)
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    break
+        except Exception as e:
+            logger.error(f"Bulk export failed: {e}")
+            put(e)
+        finally:
+            chunks.close()
+            put(done)
+
+    threading.Thread(target=produce, name="bulk-export-zip", daemon=True).start()
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is done:
+                return
+            if isinstance(chunk, Exception):
+                # Abort the response rather than end it with a truncated archive
+                raise chunk
+            if chunk:
+                yield chunk
+    finally:
+        stop.set()
@@ -1,20 +1,28 @@
 from typing import Dict, Any
 import os
 import json
+import asyncio
+import threading
 from dotenv import load_dotenv
 from asgiref.sync import async_to_sync
-from haystack import Pipeline
-from haystack.components.builders import PromptBuilder
-from haystack.components.embedders import OpenAITextEmbedder
-from haystack.components.generators import OpenAIGenerator
-from haystack_integrations.components.retrievers.pinecone import PineconeEmbeddingRetriever
-from haystack.utils import Secret
-from pinecone_store import document_store
+from haystack import Document
+from openai import AsyncOpenAI
+from pinecone_store import document_store, aquery_index
+from llm_cache import get_llm_cache
+from disk_cache import DiskCache
+from .template_registry import template_registry
+from .structured_output import parse_json
 import logging
 import re
 
-# Simple in-memory cache
-analysis_cache = {}
+ANALYSIS_MODES = ("standard", "structured")
+
+# Stored analysis defaults, overridable from Django settings
+DEFAULT_ANALYSIS_TTL = 7 * 24 * 60 * 60
+DEFAULT_ANALYSIS_MAX_BYTES = 512 * 1024 * 1024
+
+# How many times a single failing section is re-requested in structured mode
+STRUCTURED_SECTION_ATTEMPTS = 2
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -41,9 +49,97 @@ def sanitize_json_response(response_text):
     
     return response_text.strip()
 
+def parse_standard_reply(raw_reply):
+    """Parse a free-form analysis reply as JSON, or return an {"error": ...} dict."""
+    if raw_reply:
+        try:
+            # First try to clean the reply with our sanitizer
+            cleaned_reply = sanitize_json_response(raw_reply)
+            return json.loads(cleaned_reply)
+        except json.JSONDecodeError as parse_error:
+            # If that fails, try a more aggressive approach
+            print(f"First parsing attempt failed: {parse_error}")
+            try:
+                # Try to extract just what looks like JSON
+                potential_json = re.search(r'(\{.*\})', raw_reply, re.DOTALL)
+                if potential_json:
+                    second_attempt = potential_json.group(1)
+                    return json.loads(second_attempt)
+            except Exception as e:
+                print(f"Second parsing attempt failed: {e}")
+        
+            # If all parsing attempts fail
+            print(f"Failed to parse LLM reply as JSON: {parse_error}")
+            return {
+                "error": f"Failed to parse LLM reply: {str(parse_error)}",
+                "raw_reply": raw_reply[:1000]  # Include part of the raw reply for debugging
+            }
+    return {"error": "No reply from LLM"}
+
+def get_cache_key(session_id, template_type, mode="standard"):
+    """
+    Key an analysis by the session it was run on, the template actually used
+    (so aliases and the default share an entry) and the analysis mode.
+    """
+    if not session_id:
+        return None
+    return f"{session_id}_{template_registry.resolve(template_type)}_{mode}"
+
+_analysis_store = None
+_analysis_store_lock = threading.Lock()
+
+def get_analysis_store():
+    """
+    Return the on-disk store of analyses, keyed by get_cache_key. It is
+    shared by every worker so report, matrix and export endpoints find an
+    analysis whichever worker ran it, and it survives restarts.
+    """
+    global _analysis_store
+    if _analysis_store is None:
+        with _analysis_store_lock:
+            if _analysis_store is None:
+                from django.conf import settings
+                _analysis_store = DiskCache(
+                    getattr(settings, "ANALYSIS_CACHE_DIR", settings.BASE_DIR / ".cache" / "analyses"),
+                    getattr(settings, "ANALYSIS_CACHE_TTL", DEFAULT_ANALYSIS_TTL),
+                    getattr(settings, "ANALYSIS_CACHE_MAX_BYTES", DEFAULT_ANALYSIS_MAX_BYTES),
+                )
+    return _analysis_store
+
+def get_cached_analysis(session_id, template_type, mode=None):
+    """
+    Return the stored analysis for a session and template, or None. Without
+    a mode, the standard analysis is preferred over the structured one.
+    """
+    if not session_id:
+        return None
+    for candidate in ((mode,) if mode else ANALYSIS_MODES):
+        analysis = get_analysis_store().get(get_cache_key(session_id, template_type, candidate))
+        if analysis is not None:
+            return analysis
+    return None
+
+def session_cache_keys(session_id):
+    """Every key an analysis of this session (and no other) can be stored under."""
+    return {
+        get_cache_key(session_id, template_type, mode)
+        for template_type in template_registry.available()
+        for mode in ANALYSIS_MODES
+    }
+
+def invalidate_session(session_id):
+    """Drop every cached analysis for a session, whichever template produced it."""
+    store = get_analysis_store()
+    for key in session_cache_keys(session_id):
+        store.delete(key)
+
 class RFPAnalyzer:
-    def __init__(self, vector_store):
+    def __init__(self, vector_store, session_id=None, bypass_cache=False):
         self.vector_store = vector_store
+        # Get session ID from the vector store if not given explicitly
+        self.session_id = session_id or getattr(vector_store, 'session_id', None)
+        # Skip cached analyses and LLM responses for this request
+        self.bypass_cache = bypass_cache
         # Use only the dedicated API key without fallback
         self.api_key = os.getenv("BID_QUALIFIER_OPENAI_API_KEY")
         
@@ -56,56 +152,164 @@ class RFPAnalyzer:
             logger.error("BID_QUALIFIER_OPENAI_API_KEY not found!")
             raise ValueError("No OpenAI API key found. Please set BID_QUALIFIER_OPENAI_API_KEY.")
 
+        self.client = AsyncOpenAI(api_key=self.api_key)
+
     def _load_template(self, template_type):
         """
-        Load a template from file or return a default template if not found.
+        Return the compiled template for the given type from the shared registry.
         
         Args:
             template_type: The type of template to load
             
         Returns:
-            The template string
+            The compiled Jinja template
         """
-        # Define the base directory for templates
-        template_dir = os.path.join(os.path.dirname(__file__), "templates")
-        
-        # Ensure the template directory exists
-        if not os.path.exists(template_dir):
-            os.makedirs(template_dir)
-            
-        # Define the path to the template file
-        template_path = os.path.join(template_dir, f"{template_type}.txt")
+        return template_registry.get(template_type)
+
+    async def _generate(self, prompt, json_mode=False, cacheable=None, bypass=False):
+        """
+        Run gpt-4o on a prompt and return the reply text. Only replies accepted
+        by cacheable(reply) are stored in the LLM cache; bypass forces a fresh
+        reply, as retries of a rejected one need.
+        """
+        generation_kwargs = {
+            "max_tokens": 16384,
+            "timeout": 180
+        }
+        if json_mode:
+            generation_kwargs["response_format"] = {"type": "json_object"}
+        messages = [{"role": "user", "content": prompt}]
+
+        async def complete():
+            response = await self.client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                **generation_kwargs
+            )
+            return response.choices[0].message.content or ""
+
+        return await get_llm_cache().aget_or_create(
+            "gpt-4o", messages, generation_kwargs, complete,
+            bypass=self.bypass_cache or bypass, cacheable=cacheable
+        )
+
+    async def _regenerate_section(self, prompt, schema, name, error):
+        """Re-request a single section that failed validation."""
+        def reply_section(reply):
+            parsed = parse_json(reply)
+            return parsed.get(name) if isinstance(parsed, dict) else None
+
+        def section_valid(reply):
+            return not schema.failing_sections({name: reply_section(reply)})
+
+        for attempt in range(STRUCTURED_SECTION_ATTEMPTS):
+            logger.info(f"Re-requesting section '{name}' (attempt {attempt + 1}): {error}")
+            # Always ask the model again: a cached reply to this prompt would fail the same way
+            reply = await self._generate(
+                prompt + schema.section_instruction(name, error), json_mode=True,
+                cacheable=section_valid, bypass=True
+            )
+            section = reply_section(reply)
+            errors = schema.failing_sections({name: section})
+            if not errors:
+                return section
+            error = errors[name]
+        logger.warning(f"Section '{name}' still invalid after {STRUCTURED_SECTION_ATTEMPTS} attempts: {error}")
+        return section
+
+    async def _analyze_structured(self, prompt, template_type):
+        """
+        Request JSON-mode output, validate it against the schema declared by the
+        template and re-request only the sections that fail validation.
+        """
+        schema = template_registry.get_schema(template_type)
+
+        def reply_valid(reply):
+            parsed = parse_json(reply)
+            return isinstance(parsed, dict) and (schema is None or not schema.failing_sections(parsed))
+
+        parsed = parse_json(await self._generate(prompt, json_mode=True, cacheable=reply_valid))
+
+        if schema is None:
+            # Template declares no skeleton, so there is nothing to validate against
+            return parsed if isinstance(parsed, dict) else {"error": "No valid JSON reply from LLM"}
+
+        if not isinstance(parsed, dict):
+            parsed = {}
+        errors = schema.failing_sections(parsed)
+        if errors:
+            logger.info(f"Structured analysis has {len(errors)} invalid sections: {list(errors)}")
+            sections = await asyncio.gather(*[
+                self._regenerate_section(prompt, schema, name, error)
+                for name, error in errors.items()
+            ])
+            for name, section in zip(errors, sections):
+                if section is not None:
+                    parsed[name] = section
+        return parsed
+
+    async def _retrieve(self, text):
+        """Embed the query text and retrieve the matching chunks from Pinecone."""
+        # First, get the embedding for our query text
+        embedding_response = await self.client.embeddings.create(
+            model="text-embedding-3-small",
+            input=text
+        )
+        if not embedding_response.data:
+            print("No embedding generated")
+            return None
         
-        try:
-            # Try to load the specified template
-            with open(template_path, "r") as file:
-                logger.info(f"Loaded template from {template_path}")
-                return file.read()
-        except FileNotFoundError:
-            # If the template doesn't exist, log a warning and use the standard template
-            logger.warning(f"Template {template_type} not found. Using standard template.")
-            standard_path = os.path.join(template_dir, "standard.txt")
-            
-            try:
-                with open(standard_path, "r") as file:
-                    return file.read()
-            except FileNotFoundError:
-                # If even the standard template doesn't exist, return a basic template
-                logger.error(f"Standard template not found at {standard_path}. Using built-in fallback.")
-                return """
-                System: You are an expert RFP analyzer. Extract information from the RFP and return it ONLY as a valid JSON object.
-                
-                Documents:
-                {% for doc in documents %}
-                    {{ doc.content }}
-                {% endfor %}
-                
-                Question: {{ query }}
-                
-                Return a JSON object with key information from the RFP.
-                """
-
-    async def analyze_rfp(self, text: str, template_type="standard", pdf_path=None) -> Dict[str, Any]:
+        # Extract the embedding vector
+        query_embedding = embedding_response.data[0].embedding
+
+        # Now use this embedding to query Pinecone
+        query_response = await aquery_index(
+            getattr(self.vector_store, 'index_name', 'rfp-analysis'),
+            query_embedding,
+            top_k=40,
+            namespace=getattr(self.vector_store, 'namespace', 'default')
+        )
+
+        # Convert matches back into documents the templates can render
+        retrieved_docs = []
+        for match in query_response.matches:
+            metadata = dict(match.metadata or {})
+            content = metadata.pop('content', '')
+            retrieved_docs.append(Document(id=match.id, content=content, meta=metadata, score=match.score))
+
+        logger.info(f"Retrieved {len(retrieved_docs)} documents")
+        # Log document sources
+        doc_sources = {}
+        for doc in retrieved_docs:
+            filename = doc.meta.get('filename', 'unknown')
+            doc_sources[filename] = doc_sources.get(filename, 0) + 1
+        logger.info(f"Document sources: {doc_sources}")
+
+        return retrieved_docs
+
+    async def _analyze_documents(self, documents, template_type, mode):
+        """Render one template over already retrieved documents and parse the LLM reply."""
+        # Load the appropriate template
+        query_template = self._load_template(template_type)
+
+        # Render the prompt with the precompiled template
+        prompt = query_template.render(
+            documents=documents,
+            query="Extract all key information from this RFP document."
+        )
+
+        if mode == "structured":
+            return await self._analyze_structured(prompt, template_type)
+
+        raw_reply = await self._generate(
+            prompt, cacheable=lambda reply: "error" not in parse_standard_reply(reply)
+        )
+        if raw_reply:
+            print("Raw reply content:", raw_reply)
+        return parse_standard_reply(raw_reply)
+
+
+    async def analyze_rfp(self, text: str, template_type="standard", pdf_path=None, mode="standard") -> Dict[str, Any]:
         """
         Build a pipeline to extract key RFP information and format it as JSON.
         
@@ -113,146 +317,76 @@ class RFPAnalyzer:
             text: The RFP text to analyze
             template_type: The type of template to use (standard, technical, government, etc.)
             pdf_path: Optional path to the PDF file
+            mode: "standard" to parse free-form output, or "structured" to request
+                  JSON-mode output validated against the template's schema
+        """
+        results = await self.analyze_templates(text, [template_type], mode=mode)
+        return results[template_type]
+
+    async def analyze_templates(self, text: str, template_types, mode="standard") -> Dict[str, Dict[str, Any]]:
+        """
+        Analyze the RFP with several templates in one go.
+
+        Retrieval runs once and the retrieved context is shared by every
+        template, then the LLM generations run concurrently. Each template's
+        result is cached separately per session.
+        
+        Args:
+            text: The RFP text to analyze
+            template_types: List of template types to run
+            mode: "standard" or "structured", as for analyze_rfp
+            
+        Returns:
+            Dict mapping each template type to its analysis
         """
         try:
-            # Get session ID from the vector store if available
-            session_id = getattr(self.vector_store, 'session_id', None)
-            logger.info(f"Analyzing RFP for session: {session_id} using template: {template_type}")
+            session_id = self.session_id
+            logger.info(f"Analyzing RFP for session: {session_id} using templates: {template_types}")
             
-            # Check cache if we have a session ID
-            cache_key = f"{session_id}_{template_type}" if session_id else None
-            if cache_key and cache_key in analysis_cache:
-                logger.info(f"Using cached analysis for session {session_id} with template {template_type}")
-                return analysis_cache[cache_key]
+            # Serve whatever is already cached for this session
+            results = {}
+            pending = []
+            for template_type in dict.fromkeys(template_types):
+                cached = None
+                if session_id and not self.bypass_cache:
+                    cached = await asyncio.to_thread(get_cached_analysis, session_id, template_type, mode)
+                if cached is not None:
+                    logger.info(f"Using cached analysis for session {session_id} with template {template_type}")
+                    results[template_type] = cached
+                else:
+                    pending.append(template_type)
+            if not pending:
+                return results
             
             # Log that we're creating a new analysis
-            logger.info(f"Creating new RFP analysis with dedicated API key using template: {template_type}")
-            
-            # Load the appropriate template
-            query_template = self._load_template(template_type)
-            
-            # First, get the embedding for our query text
-            embed_pipeline = Pipeline()
-            embed_pipeline.add_component(
-                "text_embedder",
-                OpenAITextEmbedder(
-                    api_key=Secret.from_token(self.api_key),
-                    model="text-embedding-3-small"
-                )
-            )
+            logger.info(f"Creating new RFP analysis with dedicated API key using templates: {pending}")
             
-            # Get the embedding
-            embed_result = embed_pipeline.run({
-                "text_embedder": {
-                    "text": text
-                }
-            })
-            if not embed_result.get("text_embedder", {}).get("embedding"):
-                print("No embedding generated")
-                return {}
-            
-            # Extract the embedding vector
-            query_embedding = embed_result["text_embedder"]["embedding"]
-
-            # Now use this embedding to query Pinecone
-            query_pipeline = Pipeline()
-            query_pipeline.add_component(
-                "retriever",
-                PineconeEmbeddingRetriever(
-                    document_store=self.vector_store,
-                    top_k=40
-                )
-            )
-            query_pipeline.add_component("prompt_builder", PromptBuilder(template=query_template))
-            query_pipeline.add_component(
-                "llm",
-                OpenAIGenerator(
-                    api_key=Secret.from_token(self.api_key),
-                    model="gpt-4o",
-                    generation_kwargs={
-                        "max_tokens": 16384,
-                        "timeout": 180
+            documents = await self._retrieve(text)
+            if documents is None:
+                results.update({template_type: {} for template_type in pending})
+                return results
 
-                    }
-                )
+            analyses = await asyncio.gather(
+                *[self._analyze_documents(documents, template_type, mode) for template_type in pending],
+                return_exceptions=True
             )
-
-            # Connect the components
-            query_pipeline.connect("retriever.documents", "prompt_builder.documents")
-            query_pipeline.connect("prompt_builder.prompt", "llm.prompt")
-
-            # Run the retrieval and LLM pipeline
-            result = query_pipeline.run({
-                "retriever": {"query_embedding": query_embedding},
-                "prompt_builder": {
-                    "query": "Extract all key information from this RFP document."
-                }
-            })
-
-            # Count tokens in retrieved documents
-            if "retriever" in result and "documents" in result["retriever"]:
-                retrieved_docs = result["retriever"]["documents"]
-                logger.info(f"Retrieved {len(retrieved_docs)} documents")
-                # Log document sources
-                doc_sources = {}
-                for doc in retrieved_docs:
-                    if hasattr(doc, 'metadata') and doc.metadata:
-                        filename = doc.metadata.get('filename', 'unknown')
-                        doc_sources[filename] = doc_sources.get(filename, 0) + 1
-                
-                logger.info(f"Document sources: {doc_sources}")
-
-            # Add debug prints
-            print("Full result:", result)
-            print("LLM result:", result.get("llm", {}))
-            print("Raw reply:", result.get("llm", {}).get("replies", []))
-
-            if isinstance(result.get("llm", {}).get("replies"), list) and result["llm"]["replies"]:
-                raw_reply = result["llm"]["replies"][0]
-                print("Raw reply content:", raw_reply)
-                
-                try:
-                    # First try to clean the reply with our sanitizer
-                    cleaned_reply = sanitize_json_response(raw_reply)
-                    parsed_reply = json.loads(cleaned_reply)
-                    
+            for template_type, analysis in zip(pending, analyses):
+                if isinstance(analysis, Exception):
+                    print(f"Error analyzing template {template_type}: {str(analysis)}")
+                    analysis = {"error": str(analysis)}
+                elif session_id and "error" not in analysis:
                     # Cache the result if we have a session ID
-                    if session_id:
-                        analysis_cache[session_id] = parsed_reply
-                    
-                    return parsed_reply
-                except json.JSONDecodeError as parse_error:
-                    # If that fails, try a more aggressive approach
-                    print(f"First parsing attempt failed: {parse_error}")
-                    try:
-                        # Try to extract just what looks like JSON
-                        import re
-                        potential_json = re.search(r'(\{.*\})', raw_reply, re.DOTALL)
-                        if potential_json:
-                            second_attempt = potential_json.group(1)
-                            parsed_reply = json.loads(second_attempt)
-                            
-                            # Cache the result if we have a session ID
-                            if session_id:
-                                analysis_cache[session_id] = parsed_reply
-                            
-                            return parsed_reply
-                    except Exception as e:
-                        print(f"Second parsing attempt failed: {e}")
-                    
-                    # If all parsing attempts fail
-                    print(f"Failed to parse LLM reply as JSON: {parse_error}")
-                    return {
-                        "error": f"Failed to parse LLM reply: {str(parse_error)}",
-                        "raw_reply": raw_reply[:1000]  # Include part of the raw reply for debugging
-                    }
-            return {"error": "No reply from LLM"}
+                    await asyncio.to_thread(
+                        get_analysis_store().set, get_cache_key(session_id, template_type, mode), analysis
+                    )
+                results[template_type] = analysis
+            return results
 
         except Exception as e:
             print(f"Error in analyze_rfp: {str(e)}")
             import traceback
             print(traceback.format_exc())
-            return {"error": str(e)}
+            return {template_type: {"error": str(e)} for template_type in template_types}
 
     async def generate_bid_matrix(self, rfp_info: Dict) -> Dict[str, Any]:
         """Generate a detailed bid matrix from RFP information"""
@@ -266,6 +400,14 @@ class RFPAnalyzer:
                     return item  # For backward compatibility
                 return "Not specified"
             
+            def get_list(key):
+                item = rfp_info.get(key, [])
+                if isinstance(item, dict) and "value" in item:
+                    item = item["value"]
+                if not item:
+                    return []
+                return item if isinstance(item, list) else [item]
+            
             matrix = {
                 "sections": [
                     {
@@ -296,7 +438,7 @@ class RFPAnalyzer:
                                 "priority": "Medium",
                                 "status": "To Review",
                                 "notes": "Evaluate against technical capabilities"
-                            } for req in rfp_info.get("technical_requirements", [])
+                            } for req in get_list("technical_requirements")
                         ]
                     },
                     {
@@ -308,11 +450,34 @@ class RFPAnalyzer:
                                 "priority": "High",
                                 "status": "To Review",
                                 "notes": "Check team availability and expertise"
-                            } for skill in rfp_info.get("skills_needed", [])
+                            } for skill in get_list("skills_needed")
                         ]
                     }
                 ]
             }
+            
+            # Every other analysed section becomes a block of items to review
+            covered = {"technical_requirements", "skills_needed"}
+            for section_name, section_data in rfp_info.items():
+                if section_name in covered or not isinstance(section_data, dict):
+                    continue
+                items = []
+                for field_name, field_data in section_data.items():
+                    value = field_data.get("value") if isinstance(field_data, dict) and "value" in field_data else field_data
+                    if value in (None, "", [], {}, "Not specified"):
+                        continue
+                    items.append({
+                        "category": field_name.replace('_', ' ').title(),
+                        "requirement": value if isinstance(value, str) else json.dumps(value),
+                        "priority": "Medium",
+                        "status": "To Review",
+                        "notes": ""
+                    })
+                if items:
+                    matrix["sections"].append({
+                        "name": section_name.replace('_', ' ').title(),
+                        "items": items
+                    })
             return matrix
         except Exception as e:
             print(f"Error generating bid matrix: {str(e)}")
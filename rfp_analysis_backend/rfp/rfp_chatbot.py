@@ -1,60 +1,171 @@
 import os
-from pinecone import Pinecone 
-from openai import OpenAI
+import asyncio
+import weakref
+from openai import AsyncOpenAI
 from typing import Dict
 import numpy as np
+from asgiref.sync import sync_to_async
+from pinecone.exceptions import NotFoundException
+from pinecone_store import aquery_index, get_index_host, get_session_index_name, create_session_index
+from llm_cache import get_llm_cache
+from .conversation import load_memory, save_memory
+from .semantic_cache import semantic_cache
+from .embeddings import embed_texts
+from django.conf import settings
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+CHAT_MODEL = "gpt-4o"
+GENERATION_KWARGS = {"temperature": 0.3, "max_tokens": 500}
+SYSTEM_PROMPT = "You are an expert Information Memorandum analyst assistant. Answer questions about the Information Memorandum using the provided context. Be concise and specific."
+NO_MATCHES_ANSWER = "I couldn't find any relevant information in the documents. Please try rephrasing your question or make sure documents have been uploaded."
+PAGE_PREFIX = re.compile(r"\[Page (\d+)\]")
+DEFAULT_QUESTIONNAIRE_CONCURRENCY = 8
 
 class RFPChatbot:
-    def __init__(self, vector_store):
+    def __init__(self, vector_store=None, index_name=None, client=None, session_id=None):
         self.vector_store = vector_store
+        # Conversation memory is kept per session; without one the chat is stateless
+        self.session_id = session_id
         # Use only the dedicated API key without fallback
         self.api_key = os.getenv("BID_QUALIFIER_OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("No OpenAI API key found. Please set BID_QUALIFIER_OPENAI_API_KEY.")
-        
-        # Initialize Pinecone with new syntax
-        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-        
-        # Use the index from the vector store if available
-        if hasattr(vector_store, 'index_name'):
-            self.index = pc.Index(vector_store.index_name)
+
+        # Use the given index, then the one from the vector store if available
+        if index_name:
+            self.index_name = index_name
+        elif hasattr(vector_store, 'index_name'):
+            self.index_name = vector_store.index_name
             print(f"Using index from vector store: {vector_store.index_name}")
         else:
             # Fallback to rfpuploads
-            self.index = pc.Index("rfpuploads")
+            self.index_name = "rfpuploads"
             print("Using default index: rfpuploads")
-        
-        # Initialize OpenAI
-        self.client = OpenAI(api_key=self.api_key)
 
-    def get_response(self, question: str) -> Dict:
-        try:
-            # Get embedding for the question
-            print(f"Getting embedding for question: {question}")
-            embedding_response = self.client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=question
-            )
-            query_embedding = list(embedding_response.data[0].embedding)  # Convert to list
-            print(f"Generated embedding dimension: {len(query_embedding)}")
+        # Initialize OpenAI, reusing a pooled client when one is given
+        self.client = client or AsyncOpenAI(api_key=self.api_key)
 
-            # Query Pinecone with default namespace
-            print("Querying Pinecone 'demo' index...")
-            query_response = self.index.query(
-                vector=query_embedding,
+    async def _embed(self, question):
+        """Embed the question."""
+        # Get embedding for the question
+        print(f"Getting embedding for question: {question}")
+        embedding_response = await self.client.embeddings.create(
+            model="text-embedding-ada-002",
+            input=question
+        )
+        query_embedding = list(embedding_response.data[0].embedding)  # Convert to list
+        print(f"Generated embedding dimension: {len(query_embedding)}")
+        return query_embedding
+
+    async def _retrieve(self, query_embedding, memory=None):
+        """
+        Return the matches for a question embedding as dicts with id, score
+        and metadata, reused from memory for close follow-up questions and
+        otherwise queried from Pinecone.
+        """
+        if memory is not None:
+            matches = memory.reusable_chunks(query_embedding)
+            if matches is not None:
+                return matches
+
+        # Query Pinecone with default namespace
+        print(f"Querying Pinecone '{self.index_name}' index...")
+        try:
+            query_response = await aquery_index(
+                self.index_name,
+                query_embedding,
                 top_k=5,
-                include_metadata=True,
                 namespace="default"  # Explicitly query the default namespace
             )
-            print(f"Raw Pinecone response: {query_response}")
+        except NotFoundException:
+            # Cleaned up elsewhere (e.g. by another worker): check it again on the next turn
+            chatbot_service.forget(self.index_name)
+            raise
+
+        # Extract relevant text from matches
+        matches = [
+            {"id": match.id, "score": match.score, "metadata": dict(match.metadata or {})}
+            for match in query_response.matches
+        ]
+        print(f"Number of matches: {len(matches)}")
+        if memory is not None and matches:
+            memory.remember_chunks(query_embedding, matches)
+        return matches
+
+    def _semantic_cacheable(self, memory=None):
+        """
+        Whether a question may be answered from, and saved to, the semantic
+        cache. Answers are only shared within a session, and a question asked
+        after earlier turns may depend on them, so only a conversation's
+        opening question (or a stateless batch question) qualifies.
+        """
+        if not self.session_id:
+            return False
+        return memory is None or not memory.history()
+
+    async def _semantic_lookup(self, query_embedding, bypass_cache, cacheable):
+        """Return a cached answer to a semantically equivalent question, if any."""
+        if bypass_cache or not cacheable:
+            return None
+        return await asyncio.to_thread(semantic_cache.lookup, self.session_id, query_embedding)
+
+    async def _semantic_add(self, question, query_embedding, answer, cacheable):
+        if cacheable and answer:
+            await asyncio.to_thread(semantic_cache.add, self.session_id, question, query_embedding, answer)
+
+    def _build_messages(self, matches, question, memory=None):
+        """Build the completion messages from the retrieved context and conversation history."""
+        context = "\n".join([match["metadata"].get('content', '') for match in matches])
+        history = memory.history() if memory is not None else []
+        return context, [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            *history,
+            {"role": "user", "content": f"Context: {context}\n\nQuestion: {question}"}
+        ]
+
+    async def _load_memory(self):
+        return await load_memory(self.session_id) if self.session_id else None
+
+    async def _remember(self, memory, question, answer):
+        """Record the turn, fold old turns into the summary and save the memory."""
+        if memory is None or not answer:
+            return
+        try:
+            memory.add_turn(question, answer)
+            await memory.compact(self.client, CHAT_MODEL)
+            await save_memory(memory)
+        except Exception as e:
+            logger.error(f"Failed to update conversation memory for session {self.session_id}: {e}")
+
+    async def get_response(self, question: str, bypass_cache=False) -> Dict:
+        try:
+            memory = await self._load_memory()
+            cacheable = self._semantic_cacheable(memory)
+            query_embedding = await self._embed(question)
+
+            # Answer from the semantic cache when the same question was asked before
+            cached = await self._semantic_lookup(query_embedding, bypass_cache, cacheable)
+            if cached is not None:
+                await self._remember(memory, question, cached["answer"])
+                return {
+                    "answer": cached["answer"],
+                    "success": True,
+                    "cached": True,
+                    "debug_info": {
+                        "similar_question": cached["question"],
+                        "similarity": cached["similarity"]
+                    }
+                }
+
+            matches = await self._retrieve(query_embedding, memory)
 
-            # Extract relevant text from matches
-            matches = query_response.matches
-            print(f"Number of matches: {len(matches)}")
-            
             if not matches:
                 return {
-                    "answer": "I couldn't find any relevant information in the documents. Please try rephrasing your question or make sure documents have been uploaded.",
+                    "answer": NO_MATCHES_ANSWER,
                     "success": True,
                     "debug_info": {
                         "num_matches": 0,
@@ -62,23 +173,27 @@ class RFPChatbot:
                     }
                 }
 
-            # Extract context from matches
-            context = "\n".join([match.metadata.get('content', '') for match in matches])
-
             # Generate response
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are an expert Information Memorandum analyst assistant. Answer questions about the Information Memorandum using the provided context. Be concise and specific."},
-                    {"role": "user", "content": f"Context: {context}\n\nQuestion: {question}"}
-                ],
-                temperature=0.3,
-                max_tokens=500
+            context, messages = self._build_messages(matches, question, memory)
+
+            async def complete():
+                response = await self.client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=messages,
+                    **GENERATION_KWARGS
+                )
+                return response.choices[0].message.content
+
+            answer = await get_llm_cache().aget_or_create(
+                CHAT_MODEL, messages, GENERATION_KWARGS, complete, bypass=bypass_cache
             )
+            await self._remember(memory, question, answer)
+            await self._semantic_add(question, query_embedding, answer, cacheable)
 
             return {
-                "answer": response.choices[0].message.content,
+                "answer": answer,
                 "success": True,
+                "cached": False,
                 "debug_info": {
                     "num_matches": len(matches),
                     "context_length": len(context)
@@ -91,4 +206,230 @@ class RFPChatbot:
                 "answer": "Sorry, I encountered an error while processing your question.",
                 "error": str(e),
                 "success": False
-            }
\ No newline at end of file
+            }
+
+    async def stream_response(self, question: str, bypass_cache=False):
+        """
+        Answer a question as a stream of (event, data) pairs:
+
+        - "retrieval": matched chunks with filename, page and score
+        - "token": each piece of completion text as it arrives
+        - "done": token usage and timings, including time to first token
+        - "error": if anything fails part way
+        """
+        started = time.perf_counter()
+        try:
+            memory = await self._load_memory()
+            cacheable = self._semantic_cacheable(memory)
+            query_embedding = await self._embed(question)
+
+            # Answer from the semantic cache when the same question was asked before
+            cached = await self._semantic_lookup(query_embedding, bypass_cache, cacheable)
+            if cached is not None:
+                elapsed = round((time.perf_counter() - started) * 1000)
+                yield "retrieval", {
+                    "num_matches": 0,
+                    "matches": [],
+                    "similar_question": cached["question"],
+                    "similarity": cached["similarity"],
+                    "retrieval_ms": elapsed
+                }
+                yield "token", {"content": cached["answer"]}
+                await self._remember(memory, question, cached["answer"])
+                yield "done", {"usage": None, "cached": True, "ttft_ms": elapsed, "total_ms": elapsed}
+                return
+
+            matches = await self._retrieve(query_embedding, memory)
+            yield "retrieval", {
+                "num_matches": len(matches),
+                "matches": [describe_match(match) for match in matches],
+                "retrieval_ms": round((time.perf_counter() - started) * 1000)
+            }
+
+            if not matches:
+                yield "token", {"content": NO_MATCHES_ANSWER}
+                yield "done", {"usage": None, "cached": False, "ttft_ms": None,
+                               "total_ms": round((time.perf_counter() - started) * 1000)}
+                return
+
+            _, messages = self._build_messages(matches, question, memory)
+            llm_cache = get_llm_cache()
+
+            # Serve a cached answer in one piece
+            cached_answer = await asyncio.to_thread(llm_cache.get, CHAT_MODEL, messages, GENERATION_KWARGS, bypass=bypass_cache)
+            if cached_answer is not None:
+                elapsed = round((time.perf_counter() - started) * 1000)
+                yield "token", {"content": cached_answer}
+                await self._remember(memory, question, cached_answer)
+                yield "done", {"usage": None, "cached": True, "ttft_ms": elapsed, "total_ms": elapsed}
+                return
+
+            stream = await self.client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **GENERATION_KWARGS
+            )
+            ttft_ms = None
+            usage = None
+            answer = []
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage.model_dump()
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    if ttft_ms is None:
+                        ttft_ms = round((time.perf_counter() - started) * 1000)
+                        logger.info(f"Chat time to first token: {ttft_ms}ms")
+                    answer.append(content)
+                    yield "token", {"content": content}
+
+            await asyncio.to_thread(llm_cache.set, CHAT_MODEL, messages, GENERATION_KWARGS, "".join(answer))
+            await self._remember(memory, question, "".join(answer))
+            await self._semantic_add(question, query_embedding, "".join(answer), cacheable)
+            yield "done", {
+                "usage": usage,
+                "cached": False,
+                "ttft_ms": ttft_ms,
+                "total_ms": round((time.perf_counter() - started) * 1000)
+            }
+
+        except Exception as e:
+            print(f"Detailed error: {str(e)}")
+            yield "error", {"error": str(e)}
+
+    async def answer_batch(self, questions, concurrency=None, bypass_cache=False):
+        """
+        Answer many independent questions (e.g. an RFP compliance questionnaire).
+
+        All questions are embedded in one batched request; Pinecone queries
+        and completions then each run under their own bounded concurrency
+        limit. Yields one result dict per question in completion
+        order, each tagged with the question's original index.
+        """
+        concurrency = concurrency or getattr(settings, "QUESTIONNAIRE_CONCURRENCY", DEFAULT_QUESTIONNAIRE_CONCURRENCY)
+        semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+        # Separate limiter so questions waiting on a completion don't hold up retrieval for others
+        retrieval_semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+        embeddings = await embed_texts(
+            self.client, questions, model="text-embedding-ada-002", batch_size=len(questions) or 1
+        )
+        llm_cache = get_llm_cache()
+        cacheable = self._semantic_cacheable()
+
+        async def answer(index, question, query_embedding):
+            try:
+                cached = await self._semantic_lookup(query_embedding, bypass_cache, cacheable)
+                if cached is not None:
+                    return {"index": index, "question": question, "answer": cached["answer"],
+                            "sources": [], "cached": True}
+
+                async with retrieval_semaphore:
+                    matches = await self._retrieve(query_embedding)
+                if not matches:
+                    return {"index": index, "question": question, "answer": NO_MATCHES_ANSWER,
+                            "sources": [], "cached": False}
+
+                _, messages = self._build_messages(matches, question)
+
+                async def complete():
+                    async with semaphore:
+                        response = await self.client.chat.completions.create(
+                            model=CHAT_MODEL,
+                            messages=messages,
+                            **GENERATION_KWARGS
+                        )
+                    return response.choices[0].message.content
+
+                answer_text = await llm_cache.aget_or_create(
+                    CHAT_MODEL, messages, GENERATION_KWARGS, complete, bypass=bypass_cache
+                )
+                await self._semantic_add(question, query_embedding, answer_text, cacheable)
+                return {"index": index, "question": question, "answer": answer_text,
+                        "sources": [describe_match(match) for match in matches], "cached": False}
+            except Exception as e:
+                print(f"Error answering question {index}: {str(e)}")
+                return {"index": index, "question": question, "answer": "", "sources": [],
+                        "cached": False, "error": str(e)}
+
+        tasks = [
+            asyncio.ensure_future(answer(index, question, embedding))
+            for index, (question, embedding) in enumerate(zip(questions, embeddings))
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def describe_match(match):
+    """Summarize a retrieved match for the client: filename, page and score."""
+    metadata = match["metadata"]
+    page = metadata.get('page_number')
+    if page is None:
+        # Chunks carry a "[Page N]" prefix when the page metadata was not stored
+        page_match = PAGE_PREFIX.match(metadata.get('content', ''))
+        page = int(page_match.group(1)) if page_match else None
+    return {
+        "id": match["id"],
+        "filename": metadata.get('filename'),
+        "page": page,
+        "score": round(match["score"], 4) if match["score"] is not None else None
+    }
+
+
+class ChatbotService:
+    """
+    Per-worker factory for chatbots that share pooled, keep-alive clients.
+
+    One AsyncOpenAI client is kept per event loop, Pinecone index handles are
+    pooled in pinecone_store, and session index names are resolved without
+    listing indexes, so a chat turn only pays for its embedding, query and
+    completion calls.
+    """
+
+    def __init__(self):
+        self._clients = weakref.WeakKeyDictionary()
+        self._ready_indexes = set()
+
+    def get_client(self):
+        api_key = os.getenv("BID_QUALIFIER_OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("No OpenAI API key found. Please set BID_QUALIFIER_OPENAI_API_KEY.")
+        loop = asyncio.get_running_loop()
+        if loop not in self._clients:
+            self._clients[loop] = AsyncOpenAI(api_key=api_key)
+        return self._clients[loop]
+
+    async def _ensure_index(self, session_id, index_name):
+        """Resolve the index host once, creating the session index only if it is missing."""
+        if index_name in self._ready_indexes:
+            return
+        try:
+            await sync_to_async(get_index_host, thread_sensitive=False)(index_name)
+        except NotFoundException:
+            # Only a missing index is created; timeouts, auth and server errors propagate
+            if not session_id:
+                raise
+            print(f"Index {index_name} not found, creating it")
+            await sync_to_async(create_session_index, thread_sensitive=False)(session_id)
+        self._ready_indexes.add(index_name)
+
+    def forget(self, index_name):
+        """Called when a session index is deleted or reset."""
+        self._ready_indexes.discard(index_name)
+
+    async def get_chatbot(self, session_id=None):
+        """Return a chatbot for a session (or the shared rfpuploads index)."""
+        index_name = get_session_index_name(session_id) if session_id else "rfpuploads"
+        await self._ensure_index(session_id, index_name)
+        return RFPChatbot(index_name=index_name, client=self.get_client(), session_id=session_id)
+
+
+# Shared per-worker chat service
+chatbot_service = ChatbotService()
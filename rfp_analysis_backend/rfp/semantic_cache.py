@@ -0,0 +1,149 @@
+import time
+import logging
+import threading
+import numpy as np
+from django.conf import settings
+from disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable from Django settings
+DEFAULT_THRESHOLD = 0.92
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_TTL = 24 * 60 * 60
+# Invalidation stamps are tiny; this only bounds a pathological number of sessions
+DEFAULT_STAMP_MAX_BYTES = 16 * 1024 * 1024
+
+
+def invalidation_key(session_id):
+    return f"semantic_cache_invalidated_{session_id}"
+
+
+class _SessionEntries:
+    """Question embeddings (unit-normalised rows) and their answers for one session."""
+
+    def __init__(self, dimension):
+        self.created = time.time()
+        self.matrix = np.empty((0, dimension), dtype=np.float32)
+        self.questions = []
+        self.answers = []
+
+
+class SemanticCache:
+    """
+    Per-session cache of chat answers looked up by question meaning.
+
+    Each session keeps a matrix of normalised question embeddings, so a
+    lookup is a single matrix-vector product. A new question whose cosine
+    similarity to a cached one reaches the threshold is answered from the
+    cache. Entries for a session are dropped whenever documents are
+    ingested into it.
+
+    The entries themselves are held per process, but invalidation is
+    recorded as a timestamp in an on-disk store shared by every worker, so
+    each worker discards entries older than the session's last ingestion
+    on its next lookup. Entries also expire after CHAT_SEMANTIC_CACHE_TTL,
+    the lifetime of the stamps, so an expired stamp never revives them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._stamps = None
+        self._stamps_lock = threading.Lock()
+
+    @property
+    def threshold(self):
+        return getattr(settings, "CHAT_SEMANTIC_CACHE_THRESHOLD", DEFAULT_THRESHOLD)
+
+    @property
+    def max_entries(self):
+        return getattr(settings, "CHAT_SEMANTIC_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)
+
+    @property
+    def ttl(self):
+        return getattr(settings, "CHAT_SEMANTIC_CACHE_TTL", DEFAULT_TTL)
+
+    def _stamp_store(self):
+        if self._stamps is None:
+            with self._stamps_lock:
+                if self._stamps is None:
+                    self._stamps = DiskCache(
+                        getattr(settings, "CHAT_SEMANTIC_CACHE_DIR", settings.BASE_DIR / ".cache" / "semantic_cache"),
+                        self.ttl,
+                        DEFAULT_STAMP_MAX_BYTES,
+                    )
+        return self._stamps
+
+    def _current_entries(self, session_id):
+        """
+        Return the session's entries, dropping them first if they have
+        expired or another worker has invalidated the session since they
+        were created. Must be called with the lock held.
+        """
+        entries = self._sessions.get(session_id)
+        if entries is None:
+            return None
+        invalidated = self._stamp_store().get(invalidation_key(session_id))
+        if time.time() - entries.created > self.ttl or (invalidated is not None and invalidated >= entries.created):
+            del self._sessions[session_id]
+            return None
+        return entries
+
+    @staticmethod
+    def _normalise(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, session_id, embedding):
+        """
+        Return {"answer", "question", "similarity"} for the closest cached
+        question if it clears the threshold, else None.
+        """
+        with self._lock:
+            entries = self._current_entries(session_id)
+            if entries is None or not entries.questions:
+                return None
+            query = self._normalise(embedding)
+            if query.shape[0] != entries.matrix.shape[1]:
+                return None
+            scores = entries.matrix @ query
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                return None
+            logger.info(f"Semantic cache hit for session {session_id} (similarity {similarity:.3f})")
+            return {
+                "answer": entries.answers[best],
+                "question": entries.questions[best],
+                "similarity": round(similarity, 4)
+            }
+
+    def add(self, session_id, question, embedding, answer):
+        vector = self._normalise(embedding)
+        with self._lock:
+            entries = self._current_entries(session_id)
+            if entries is None or entries.matrix.shape[1] != vector.shape[0]:
+                entries = self._sessions[session_id] = _SessionEntries(vector.shape[0])
+            entries.matrix = np.vstack([entries.matrix, vector])
+            entries.questions.append(question)
+            entries.answers.append(answer)
+
+            # Drop the oldest entries beyond the per-session limit
+            overflow = len(entries.questions) - self.max_entries
+            if overflow > 0:
+                entries.matrix = entries.matrix[overflow:]
+                entries.questions = entries.questions[overflow:]
+                entries.answers = entries.answers[overflow:]
+
+    def invalidate(self, session_id):
+        """Forget every cached answer for a session, e.g. after new documents are ingested."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        # Tell the other workers
+        self._stamp_store().set(invalidation_key(session_id), time.time())
+
+
+# Shared per-process cache
+semantic_cache = SemanticCache()
@@ -0,0 +1,96 @@
+import time
+import logging
+import numpy as np
+from pinecone_store import get_session_index_name, iter_index_vectors
+from .bid_index import get_bid_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLUSTERS = 5
+KMEANS_ITERATIONS = 25
+
+
+def load_session_vectors(session_id, namespace="default"):
+    """Fetch every chunk embedding of a session's RFP as a (chunks x dim) array."""
+    index_name = get_session_index_name(session_id)
+    values = [vector for _, vector, _ in iter_index_vectors(index_name, namespace=namespace)]
+    return np.asarray(values, dtype=np.float32)
+
+
+def kmeans(vectors, k, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Spherical k-means over unit-normalised vectors.
+
+    Returns (centroids, sizes): k (or fewer) mean directions and how many
+    chunks were assigned to each.
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    unit = vectors / norms
+    k = max(1, min(k, len(unit)))
+    rng = np.random.default_rng(seed)
+    centroids = unit[rng.choice(len(unit), size=k, replace=False)]
+
+    labels = None
+    for _ in range(iterations):
+        new_labels = np.argmax(unit @ centroids.T, axis=1)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        for cluster in range(k):
+            members = unit[labels == cluster]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[cluster] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+    sizes = np.bincount(labels, minlength=k)
+    keep = sizes > 0
+    return centroids[keep], sizes[keep]
+
+
+def summarize_vectors(vectors, method="centroid", clusters=DEFAULT_CLUSTERS):
+    """
+    Reduce a document's chunk vectors to a few summary vectors with weights.
+
+    "centroid" gives the single mean vector; "kmeans" gives one mean per
+    topic cluster, weighted by cluster size, so a long RFP covering several
+    areas is not flattened into one average.
+    """
+    if method == "kmeans" and len(vectors) > 1:
+        return kmeans(vectors, clusters)
+    return vectors.mean(axis=0, keepdims=True), np.ones(1)
+
+
+def rank_similar_bids(session_id, method="centroid", clusters=DEFAULT_CLUSTERS, top_k=10):
+    """
+    Rank historical bids by similarity to a session's RFP.
+
+    Args:
+        session_id: Session whose index holds the RFP chunks
+        method: "centroid" or "kmeans" summary of the RFP
+        clusters: Number of k-means clusters when method is "kmeans"
+        top_k: Number of bids to return
+
+    Returns:
+        Dict with the ranked bids and timing details
+    """
+    started = time.perf_counter()
+    vectors = load_session_vectors(session_id)
+    fetched = time.perf_counter()
+    if not len(vectors):
+        return {"results": [], "chunks_compared": 0}
+
+    bid_index = get_bid_index()
+    summary, weights = summarize_vectors(vectors, method, clusters)
+    results = bid_index.nearest(summary, weights=weights, top_k=top_k)
+    finished = time.perf_counter()
+
+    logger.info(f"Ranked {len(bid_index)} bids for session {session_id} in {(finished - fetched) * 1000:.1f}ms")
+    return {
+        "results": results,
+        "chunks_compared": len(vectors),
+        "summary_vectors": len(summary),
+        "bids_indexed": len(bid_index),
+        "fetch_ms": round((fetched - started) * 1000, 1),
+        "compare_ms": round((finished - fetched) * 1000, 1)
+    }
@@ -0,0 +1,124 @@
+import json
+import logging
+import fastjsonschema
+from jiter import from_json
+
+logger = logging.getLogger(__name__)
+
+# Marker that precedes the JSON skeleton in every analysis template
+SKELETON_MARKER = "Return a JSON object with exactly this structure:"
+
+
+def extract_skeleton(template_source):
+    """
+    Pull the example JSON object out of a template's source.
+
+    Returns the parsed skeleton, or None if the template does not declare one.
+    """
+    marker = template_source.find(SKELETON_MARKER)
+    start = template_source.find("{", marker if marker != -1 else 0)
+    if start == -1:
+        return None
+
+    # Walk to the matching closing brace, ignoring braces inside strings
+    depth = 0
+    in_string = False
+    escaped = False
+    for pos in range(start, len(template_source)):
+        char = template_source[pos]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                try:
+                    return json.loads(template_source[start:pos + 1])
+                except json.JSONDecodeError as e:
+                    logger.warning(f"Template skeleton is not valid JSON: {e}")
+                    return None
+    return None
+
+
+def skeleton_to_schema(skeleton, key=None):
+    """
+    Derive a JSON schema from a template skeleton.
+
+    Objects require every key shown in the skeleton, arrays use their first
+    element as the item schema. "value" fields are left unconstrained because
+    templates allow strings, lists or nested objects there.
+    """
+    if key == "value":
+        return {}
+    if isinstance(skeleton, dict):
+        return {
+            "type": "object",
+            "properties": {k: skeleton_to_schema(v, k) for k, v in skeleton.items()},
+            "required": list(skeleton)
+        }
+    if isinstance(skeleton, list):
+        schema = {"type": "array"}
+        if skeleton:
+            schema["items"] = skeleton_to_schema(skeleton[0])
+        return schema
+    if isinstance(skeleton, bool):
+        return {"type": "boolean"}
+    if isinstance(skeleton, (int, float)):
+        return {"type": "number"}
+    return {"type": ["string", "number", "null"]}
+
+
+class StructuredSchema:
+    """
+    The response schema for one template, with a compiled validator per
+    top-level section so failures can be retried section by section.
+    """
+
+    def __init__(self, skeleton):
+        self.skeleton = skeleton
+        self.schema = skeleton_to_schema(skeleton)
+        self.sections = list(skeleton)
+        self._validators = {
+            name: fastjsonschema.compile(skeleton_to_schema(section, name))
+            for name, section in skeleton.items()
+        }
+
+    def failing_sections(self, data):
+        """Return {section: error message} for every section that does not validate."""
+        if not isinstance(data, dict):
+            return {name: "response is not a JSON object" for name in self.sections}
+        errors = {}
+        for name in self.sections:
+            if name not in data:
+                errors[name] = "section missing"
+                continue
+            try:
+                self._validators[name](data[name])
+            except fastjsonschema.JsonSchemaException as e:
+                errors[name] = e.message
+        return errors
+
+    def section_instruction(self, name, error):
+        """Follow-up instruction asking the model to regenerate a single section."""
+        return (
+            f"\n\nYour previous answer for the \"{name}\" section was invalid ({error}). "
+            f"Return ONLY a JSON object with the single key \"{name}\" following exactly this structure:\n"
+            f"{json.dumps({name: self.skeleton[name]}, indent=2)}"
+        )
+
+
+def parse_json(raw_reply):
+    """Parse a JSON-mode reply, returning None if it is not valid JSON."""
+    try:
+        return from_json(raw_reply.encode("utf-8"))
+    except ValueError as e:
+        logger.warning(f"Structured reply is not valid JSON: {e}")
+        return None
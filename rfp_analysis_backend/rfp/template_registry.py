@@ -0,0 +1,147 @@
+import os
+import threading
+import logging
+from jinja2 import Environment, TemplateSyntaxError
+from .structured_output import StructuredSchema, extract_skeleton
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
+DEFAULT_TEMPLATE = "standard"
+
+# Used only when the templates directory has no standard template at all
+FALLBACK_TEMPLATE = """
+System: You are an expert RFP analyzer. Extract information from the RFP and return it ONLY as a valid JSON object.
+
+Documents:
+{% for doc in documents %}
+    {{ doc.content }}
+{% endfor %}
+
+Question: {{ query }}
+
+Return a JSON object with key information from the RFP.
+"""
+
+
+class TemplateRegistry:
+    """
+    Loads and compiles every analysis template in the templates directory once.
+
+    Compiled templates are reused across analyses. When auto_reload is on
+    (development), file modification times are checked on access and any
+    added, changed or removed template is picked up without a restart.
+    """
+
+    def __init__(self, template_dir=TEMPLATE_DIR, auto_reload=None):
+        self.template_dir = template_dir
+        self._auto_reload = auto_reload
+        self._env = Environment()
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._sources = {}
+        self._mtimes = {}
+        self._schemas = {}
+        self._loaded = False
+
+    @property
+    def auto_reload(self):
+        if self._auto_reload is not None:
+            return self._auto_reload
+        try:
+            from django.conf import settings
+            return getattr(settings, "TEMPLATE_AUTO_RELOAD", settings.DEBUG)
+        except Exception:
+            return False
+
+    def _scan(self):
+        """Return {template_type: mtime} for every template file on disk."""
+        mtimes = {}
+        try:
+            with os.scandir(self.template_dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith(".txt"):
+                        mtimes[entry.name[:-len(".txt")]] = entry.stat().st_mtime
+        except FileNotFoundError:
+            logger.warning(f"Template directory {self.template_dir} not found")
+        return mtimes
+
+    def _load(self, mtimes):
+        templates = {}
+        sources = {}
+        for template_type in mtimes:
+            path = os.path.join(self.template_dir, f"{template_type}.txt")
+            try:
+                with open(path, "r") as file:
+                    source = file.read()
+                templates[template_type] = self._env.from_string(source)
+                sources[template_type] = source
+            except (OSError, TemplateSyntaxError) as e:
+                logger.error(f"Failed to load template {path}: {e}")
+        self._templates = templates
+        self._sources = sources
+        self._mtimes = mtimes
+        self._schemas = {}
+        self._loaded = True
+        logger.info(f"Compiled {len(templates)} analysis templates: {sorted(templates)}")
+
+    def _ensure_loaded(self):
+        if self._loaded and not self.auto_reload:
+            return
+        mtimes = self._scan()
+        if self._loaded and mtimes == self._mtimes:
+            return
+        with self._lock:
+            if not self._loaded or mtimes != self._mtimes:
+                self._load(mtimes)
+
+    def available(self):
+        """Return the sorted list of template types that can be requested."""
+        self._ensure_loaded()
+        return sorted(self._templates)
+
+    def resolve(self, template_type):
+        """Return the template type that will actually be used for a request."""
+        self._ensure_loaded()
+        if template_type in self._templates:
+            return template_type
+        return DEFAULT_TEMPLATE
+
+    def get(self, template_type):
+        """
+        Return the compiled template for a type, falling back to the standard
+        template (and then a built-in one) when it does not exist.
+        """
+        self._ensure_loaded()
+        template = self._templates.get(template_type)
+        if template is not None:
+            return template
+        logger.warning(f"Template {template_type} not found. Using standard template.")
+        template = self._templates.get(DEFAULT_TEMPLATE)
+        if template is not None:
+            return template
+        logger.error("Standard template not found. Using built-in fallback.")
+        return self._env.from_string(FALLBACK_TEMPLATE)
+
+    def get_source(self, template_type):
+        """Return the raw source of a template, with the same fallback as get()."""
+        self._ensure_loaded()
+        return self._sources.get(
+            self.resolve(template_type),
+            self._sources.get(DEFAULT_TEMPLATE, FALLBACK_TEMPLATE)
+        )
+
+    def get_schema(self, template_type):
+        """
+        Return the StructuredSchema declared by a template's JSON skeleton,
+        or None if it has none. Derived once per template and reload.
+        """
+        resolved = self.resolve(template_type)
+        if resolved not in self._schemas:
+            skeleton = extract_skeleton(self.get_source(resolved))
+            self._schemas[resolved] = StructuredSchema(skeleton) if isinstance(skeleton, dict) else None
+        return self._schemas[resolved]
+
+
+# Shared per-process registry
+template_registry = TemplateRegistry()
@@ -4,11 +4,19 @@ from .views import (
     analyze_pdf, 
     analyze_documents,
     analyze_rfp, 
+    analyze_rfp_batch,
+    list_templates,
+    llm_cache_stats,
     generate_bid_matrix, 
     download_matrix, 
     chat_with_rfp,
+    chat_stream,
+    chat_batch,
+    download_questionnaire,
     compare_indexes,
     download_report,
+    download_session_report,
+    bulk_export,
     cleanup_session,
     clear_session,
     check_model_limits
@@ -19,11 +27,19 @@ urlpatterns = [
     path('analyze-pdf/', analyze_pdf, name='analyze_pdf'),
     path('analyze-documents/', analyze_documents, name='analyze_documents'),
     path('analyze-rfp/', analyze_rfp, name='analyze_rfp'),
+    path('analyze-rfp-batch/', analyze_rfp_batch, name='analyze_rfp_batch'),
+    path('llm-cache-stats/', llm_cache_stats, name='llm_cache_stats'),
+    path('templates/', list_templates, name='list_templates'),
     path('generate-matrix/<str:doc_id>/', generate_bid_matrix, name='generate_bid_matrix'),
     path('download-matrix/<str:doc_id>/', download_matrix, name='download_matrix'),
     path('chat/', chat_with_rfp, name='chat_with_rfp'),
+    path('chat-stream/', chat_stream, name='chat_stream'),
+    path('chat-batch/', chat_batch, name='chat_batch'),
+    path('download-questionnaire/<str:batch_id>/', download_questionnaire, name='download_questionnaire'),
     path('compare-indexes/', compare_indexes, name='compare_indexes'),
     path('download-report/', download_report, name='download_report'),
+    path('session-report/<str:session_id>/', download_session_report, name='download_session_report'),
+    path('bulk-export/', bulk_export, name='bulk_export'),
     path('cleanup-session/', cleanup_session, name='cleanup_session'),
     path('clear-session/', clear_session, name='clear_session'),
     path('check-model-limits/', check_model_limits, name='check-model-limits'),
@@ -2,7 +2,9 @@ import os
 import uuid
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.parsers import MultiPartParser
 from PyPDF2 import PdfReader
@@ -11,35 +13,44 @@ from haystack.components.preprocessors import DocumentSplitter
 from haystack.components.embedders import OpenAIDocumentEmbedder
 from haystack.utils import Secret
 from pinecone_store import document_store, get_document_store, reset_document_store
-from .rfp_analyzer import RFPAnalyzer, analysis_cache
-from asgiref.sync import async_to_sync
-from .rfp_chatbot import RFPChatbot
+from .rfp_analyzer import RFPAnalyzer, invalidate_session, get_cached_analysis, ANALYSIS_MODES
+from .template_registry import template_registry, DEFAULT_TEMPLATE
+from asgiref.sync import async_to_sync, sync_to_async
+from .rfp_chatbot import RFPChatbot, chatbot_service
+from .conversation import clear_memory
+from .semantic_cache import semantic_cache
+from .questionnaires import save_questionnaire, load_questionnaire
+from .similarity import rank_similar_bids, DEFAULT_CLUSTERS
+from .reports import build_report, file_response, render, bytes_response, aiter_bulk_export, parquet_available
 from rest_framework.response import Response
 from rest_framework import status
 import json
+import time
 import asyncio
 from pinecone_store import Pinecone
+from pinecone.exceptions import NotFoundException
 import numpy as np
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
-from openpyxl.utils import get_column_letter
-from openpyxl.worksheet.table import Table, TableStyleInfo
 from datetime import datetime
 from pinecone_store import reset_document_store
-from pinecone_store import get_session_index_name, pc, index_name_base
+from pinecone_store import get_session_index_name, pc, index_name_base, forget_index_host
 from django.conf import settings
 from django.core.cache import cache
 import logging
 import zipfile
 import tempfile
 import shutil
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from .embeddings import embed_documents
+from llm_cache import get_llm_cache
 from pinecone_store import document_store as global_document_store
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Questionnaire batches: size limit per request
+MAX_QUESTIONNAIRE_QUESTIONS = 1000
+
 # Create a global analyzer instance using our Pinecone document store.
 analyzer = RFPAnalyzer(vector_store=document_store)
 
@@ -245,6 +256,11 @@ def upload_pdf(request):
             session_id = str(uuid.uuid4())
             print(f"Generated new session ID: {session_id}")
             
+        # New documents make cached analyses and chat answers stale
+        invalidate_session(session_id)
+        semantic_cache.invalidate(session_id)
+        clear_memory(session_id)
+            
         # Get the document store for this session
         document_store = get_document_store(session_id)
         print(f"Using document store for session: {session_id}")
@@ -318,27 +334,261 @@ def upload_pdf(request):
         print(traceback.format_exc())
         return JsonResponse({"error": str(e)}, status=500)
 
-@api_view(["POST"])
-@parser_classes([MultiPartParser])
-def analyze_documents(request):
+def prepare_uploaded_documents(uploaded_file):
+    """
+    Extract and split an uploaded file (or every file in an uploaded ZIP) into
+    document chunks with filename and page metadata.
+    
+    Returns:
+        (split_docs, None) on success, or (None, error_response)
+    """
+    # Initialize split_docs list
+    split_docs = []
+    
+    # Process the file based on its type
+    if uploaded_file.name.lower().endswith('.zip'):
+        logger.info(f"Processing ZIP file: {uploaded_file.name}")
+        
+        # Create a temporary directory for extraction
+        temp_dir = tempfile.mkdtemp()
+        logger.info(f"Created temporary directory: {temp_dir}")
+        
+        try:
+            # Save the zip file temporarily
+            zip_path = os.path.join(temp_dir, uploaded_file.name)
+            with open(zip_path, 'wb') as f:
+                for chunk in uploaded_file.chunks():
+                    f.write(chunk)
+            
+            logger.info(f"Saved ZIP file to: {zip_path}")
+            
+            # Extract the zip file
+            extracted_files = []
+            
+            try:
+                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                    # Get list of all files in the zip
+                    for file_info in zip_ref.infolist():
+                        # Skip directories and macOS hidden files
+                        if (file_info.is_dir() or 
+                            file_info.filename.startswith('__MACOSX/') or
+                            os.path.basename(file_info.filename).startswith('._') or
+                            os.path.basename(file_info.filename) == '.DS_Store'):
+                            logger.info(f"Skipping file/directory: {file_info.filename}")
+                            continue
+                            
+                        # Extract the file
+                        file_path = os.path.join(temp_dir, file_info.filename)
+                        zip_ref.extract(file_info, temp_dir)
+                        
+                        # Add to our list
+                        extracted_files.append({
+                            'path': file_path,
+                            'name': os.path.basename(file_info.filename)
+                        })
+                
+                logger.info(f"Extracted {len(extracted_files)} files from ZIP")
+            except Exception as zip_error:
+                logger.error(f"Error extracting ZIP file: {str(zip_error)}")
+                return None, JsonResponse({"error": f"Failed to extract ZIP file: {str(zip_error)}"}, status=400)
+            
+            # Process each file
+            for file_data in extracted_files:
+                file_path = file_data['path']
+                file_name = file_data['name']
+                
+                # Skip macOS hidden files and other files we can't process
+                if (file_name.startswith('._') or 
+                    file_name.startswith('.DS_Store') or
+                    not (file_name.lower().endswith('.pdf') or 
+                         file_name.lower().endswith('.docx') or 
+                         file_name.lower().endswith('.xlsx') or
+                         file_name.lower().endswith('.xls'))):
+                    logger.info(f"Skipping file: {file_name}")
+                    continue
+                
+                logger.info(f"Processing file from ZIP: {file_name}")
+                
+                try:
+                    # Determine file type
+                    file_type = None
+                    if file_name.lower().endswith('.pdf'):
+                        file_type = 'pdf'
+                    elif file_name.lower().endswith('.docx'):
+                        file_type = 'docx'
+                    elif file_name.lower().endswith(('.xlsx', '.xls')):
+                        file_type = 'excel'
+                    
+                    # Extract text from the file
+                    extracted_text = extract_text_from_file(file_path, file_type)
+                    logger.info(f"Extracted text from {file_name}")
+                    
+                    # Create a document splitter
+                    splitter = DocumentSplitter(split_by="sentence", split_length=20, split_overlap=2)
+                    splitter.warm_up()
+                    
+                    # Create documents based on file type
+                    if file_type == 'pdf':
+                        # For PDFs, create documents with page metadata
+                        docs = []
+                        for page_info in extracted_text:
+                            doc = Document(content=page_info["text"])
+                            doc.metadata = {
+                                "filename": file_name,
+                                "source": f"ZIP: {uploaded_file.name}",
+                                "page_number": page_info["page_number"]
+                            }
+                            docs.append(doc)
+                    else:
+                        # For other file types, create a single document
+                        docs = [Document(content=extracted_text)]
+                        # Add metadata
+                        for doc in docs:
+                            doc.metadata = {
+                                "filename": file_name,
+                                "source": f"ZIP: {uploaded_file.name}"
+                            }
+                    
+                    # Split the documents
+                    for doc in docs:
+                        # Split each document and preserve its metadata
+                        doc_splits = splitter.run([doc])["documents"]
+                        
+                        # Ensure metadata is preserved in each split
+                        for split_doc in doc_splits:
+                            if not hasattr(split_doc, 'metadata') or split_doc.metadata is None:
+                                split_doc.metadata = {}
+                            
+                            # Copy metadata from parent document
+                            if hasattr(doc, 'metadata') and doc.metadata:
+                                for key, value in doc.metadata.items():
+                                    split_doc.metadata[key] = value
+                        
+                        split_docs.extend(doc_splits)
+                    
+                    logger.info(f"Added {len(doc_splits)} chunks from {file_name}")
+                    
+                except Exception as e:
+                    logger.error(f"Error processing file {file_name}: {str(e)}")
+                    # Continue with other files even if one fails
+            
+        finally:
+            # Clean up temporary directory
+            try:
+                shutil.rmtree(temp_dir)
+                logger.info("Cleaned up temporary directory")
+            except Exception as cleanup_error:
+                logger.error(f"Error cleaning up temporary directory: {str(cleanup_error)}")
+        
+        # If no documents were processed successfully
+        if not split_docs:
+            logger.error("No valid documents found in ZIP file")
+            return None, JsonResponse({"error": "No valid documents found in ZIP file"}, status=400)
+        
+    else:
+        # Process a single file
+        logger.info(f"Processing single file: {uploaded_file.name}")
+        
+        # Save the file temporarily
+        file_path = default_storage.save(f"uploads/{uploaded_file.name}", ContentFile(uploaded_file.read()))
+        logger.info(f"Saved file to: {file_path}")
+        
+        # Determine file type
+        file_type = None
+        if uploaded_file.name.lower().endswith('.pdf'):
+            file_type = 'pdf'
+        elif uploaded_file.name.lower().endswith('.docx'):
+            file_type = 'docx'
+        elif uploaded_file.name.lower().endswith(('.xlsx', '.xls')):
+            file_type = 'excel'
+        else:
+            logger.error(f"Unsupported file type: {uploaded_file.name}")
+            return None, JsonResponse({"error": "Unsupported file type"}, status=400)
+        
+        # Extract text from the file
+        extracted_text = extract_text_from_file(default_storage.path(file_path), file_type)
+        
+        # Create a document splitter
+        splitter = DocumentSplitter(split_by="sentence", split_length=20, split_overlap=2)
+        # Warm up the splitter before using it
+        splitter.warm_up()
+        
+        # Create documents based on file type
+        if file_type == 'pdf':
+            # For PDFs, create documents with page metadata
+            docs = []
+            for page_info in extracted_text:
+                doc = Document(content=page_info["text"])
+                doc.metadata = {
+                    "filename": uploaded_file.name,
+                    "page_number": page_info["page_number"]
+                }
+                docs.append(doc)
+        else:
+            # For other file types, create a single document
+            docs = [Document(content=extracted_text)]
+            # Add metadata
+            for doc in docs:
+                doc.metadata = {"filename": uploaded_file.name}
+        
+        # Split the documents
+        for doc in docs:
+            # Split each document and preserve its metadata
+            doc_splits = splitter.run([doc])["documents"]
+            
+            # Ensure metadata is preserved in each split
+            for split_doc in doc_splits:
+                if not hasattr(split_doc, 'metadata') or split_doc.metadata is None:
+                    split_doc.metadata = {}
+                
+                # Copy metadata from parent document
+                if hasattr(doc, 'metadata') and doc.metadata:
+                    for key, value in doc.metadata.items():
+                        split_doc.metadata[key] = value
+            
+            split_docs.extend(doc_splits)
+        
+        # Clean up the temporary file
+        default_storage.delete(file_path)
+    
+    # Add page numbers to document content
+    for doc in split_docs:
+        if hasattr(doc, 'metadata') and doc.metadata and 'page_number' in doc.metadata:
+            page_number = doc.metadata['page_number']
+            # Add page number as a prefix to the content if not already present
+            if not doc.content.startswith(f"[Page {page_number}]"):
+                doc.content = f"[Page {page_number}] {doc.content}"
+                logger.info(f"Added page number {page_number} to document content")
+
+    # Log a sample document to verify
+    if split_docs:
+        logger.info(f"Sample document content with page number: {split_docs[0].content[:100]}...")
+        logger.info(f"Sample document metadata: {split_docs[0].metadata}")
+
+    return split_docs, None
+
+@csrf_exempt
+@require_POST
+async def analyze_documents(request):
     """Process and index documents in Pinecone."""
     try:
         # Log request information
-        logger.info(f"Request data keys: {request.data.keys()}")
+        logger.info(f"Request data keys: {request.POST.keys()}")
         logger.info(f"Request FILES keys: {request.FILES.keys()}")
         
         # Generate a session ID if not provided
-        session_id = request.data.get('session_id')
+        session_id = request.POST.get('session_id')
         if not session_id:
             session_id = str(uuid.uuid4())
             logger.info(f"Generated new session ID: {session_id}")
         
         # Clear any cached analysis for this session
-        if session_id in analysis_cache:
-            del analysis_cache[session_id]
+        invalidate_session(session_id)
+        semantic_cache.invalidate(session_id)
+        clear_memory(session_id)
         
         # Get the document store for this session
-        document_store = get_document_store(session_id)
+        document_store = await sync_to_async(get_document_store)(session_id)
         logger.info(f"Using document store for session: {session_id}")
         
         # Check if file is in the request - try both 'file' and 'files' keys
@@ -357,234 +607,17 @@ def analyze_documents(request):
                 logger.error("No files found in request")
                 return JsonResponse({
                     "error": "No file provided",
-                    "request_data_keys": list(request.data.keys()),
+                    "request_data_keys": list(request.POST.keys()),
                     "request_files_keys": list(request.FILES.keys())
                 }, status=400)
         
         logger.info(f"Processing file: {uploaded_file.name}, size: {uploaded_file.size}")
         
-        # Initialize split_docs list
-        split_docs = []
-        
-        # Process the file based on its type
-        if uploaded_file.name.lower().endswith('.zip'):
-            logger.info(f"Processing ZIP file: {uploaded_file.name}")
-            
-            # Create a temporary directory for extraction
-            temp_dir = tempfile.mkdtemp()
-            logger.info(f"Created temporary directory: {temp_dir}")
-            
-            try:
-                # Save the zip file temporarily
-                zip_path = os.path.join(temp_dir, uploaded_file.name)
-                with open(zip_path, 'wb') as f:
-                    for chunk in uploaded_file.chunks():
-                        f.write(chunk)
-                
-                logger.info(f"Saved ZIP file to: {zip_path}")
-                
-                # Extract the zip file
-                extracted_files = []
-                
-                try:
-                    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                        # Get list of all files in the zip
-                        for file_info in zip_ref.infolist():
-                            # Skip directories and macOS hidden files
-                            if (file_info.is_dir() or 
-                                file_info.filename.startswith('__MACOSX/') or
-                                os.path.basename(file_info.filename).startswith('._') or
-                                os.path.basename(file_info.filename) == '.DS_Store'):
-                                logger.info(f"Skipping file/directory: {file_info.filename}")
-                                continue
-                                
-                            # Extract the file
-                            file_path = os.path.join(temp_dir, file_info.filename)
-                            zip_ref.extract(file_info, temp_dir)
-                            
-                            # Add to our list
-                            extracted_files.append({
-                                'path': file_path,
-                                'name': os.path.basename(file_info.filename)
-                            })
-                    
-                    logger.info(f"Extracted {len(extracted_files)} files from ZIP")
-                except Exception as zip_error:
-                    logger.error(f"Error extracting ZIP file: {str(zip_error)}")
-                    return JsonResponse({"error": f"Failed to extract ZIP file: {str(zip_error)}"}, status=400)
-                
-                # Process each file
-                for file_data in extracted_files:
-                    file_path = file_data['path']
-                    file_name = file_data['name']
-                    
-                    # Skip macOS hidden files and other files we can't process
-                    if (file_name.startswith('._') or 
-                        file_name.startswith('.DS_Store') or
-                        not (file_name.lower().endswith('.pdf') or 
-                             file_name.lower().endswith('.docx') or 
-                             file_name.lower().endswith('.xlsx') or
-                             file_name.lower().endswith('.xls'))):
-                        logger.info(f"Skipping file: {file_name}")
-                        continue
-                    
-                    logger.info(f"Processing file from ZIP: {file_name}")
-                    
-                    try:
-                        # Determine file type
-                        file_type = None
-                        if file_name.lower().endswith('.pdf'):
-                            file_type = 'pdf'
-                        elif file_name.lower().endswith('.docx'):
-                            file_type = 'docx'
-                        elif file_name.lower().endswith(('.xlsx', '.xls')):
-                            file_type = 'excel'
-                        
-                        # Extract text from the file
-                        extracted_text = extract_text_from_file(file_path, file_type)
-                        logger.info(f"Extracted text from {file_name}")
-                        
-                        # Create a document splitter
-                        splitter = DocumentSplitter(split_by="sentence", split_length=20, split_overlap=2)
-                        splitter.warm_up()
-                        
-                        # Create documents based on file type
-                        if file_type == 'pdf':
-                            # For PDFs, create documents with page metadata
-                            docs = []
-                            for page_info in extracted_text:
-                                doc = Document(content=page_info["text"])
-                                doc.metadata = {
-                                    "filename": file_name,
-                                    "source": f"ZIP: {uploaded_file.name}",
-                                    "page_number": page_info["page_number"]
-                                }
-                                docs.append(doc)
-                        else:
-                            # For other file types, create a single document
-                            docs = [Document(content=extracted_text)]
-                            # Add metadata
-                            for doc in docs:
-                                doc.metadata = {
-                                    "filename": file_name,
-                                    "source": f"ZIP: {uploaded_file.name}"
-                                }
-                        
-                        # Split the documents
-                        for doc in docs:
-                            # Split each document and preserve its metadata
-                            doc_splits = splitter.run([doc])["documents"]
-                            
-                            # Ensure metadata is preserved in each split
-                            for split_doc in doc_splits:
-                                if not hasattr(split_doc, 'metadata') or split_doc.metadata is None:
-                                    split_doc.metadata = {}
-                                
-                                # Copy metadata from parent document
-                                if hasattr(doc, 'metadata') and doc.metadata:
-                                    for key, value in doc.metadata.items():
-                                        split_doc.metadata[key] = value
-                            
-                            split_docs.extend(doc_splits)
-                        
-                        logger.info(f"Added {len(doc_splits)} chunks from {file_name}")
-                        
-                    except Exception as e:
-                        logger.error(f"Error processing file {file_name}: {str(e)}")
-                        # Continue with other files even if one fails
-                
-            finally:
-                # Clean up temporary directory
-                try:
-                    shutil.rmtree(temp_dir)
-                    logger.info("Cleaned up temporary directory")
-                except Exception as cleanup_error:
-                    logger.error(f"Error cleaning up temporary directory: {str(cleanup_error)}")
-            
-            # If no documents were processed successfully
-            if not split_docs:
-                logger.error("No valid documents found in ZIP file")
-                return JsonResponse({"error": "No valid documents found in ZIP file"}, status=400)
-            
-        else:
-            # Process a single file
-            logger.info(f"Processing single file: {uploaded_file.name}")
-            
-            # Save the file temporarily
-            file_path = default_storage.save(f"uploads/{uploaded_file.name}", ContentFile(uploaded_file.read()))
-            logger.info(f"Saved file to: {file_path}")
-            
-            # Determine file type
-            file_type = None
-            if uploaded_file.name.lower().endswith('.pdf'):
-                file_type = 'pdf'
-            elif uploaded_file.name.lower().endswith('.docx'):
-                file_type = 'docx'
-            elif uploaded_file.name.lower().endswith(('.xlsx', '.xls')):
-                file_type = 'excel'
-            else:
-                logger.error(f"Unsupported file type: {uploaded_file.name}")
-                return JsonResponse({"error": "Unsupported file type"}, status=400)
-            
-            # Extract text from the file
-            extracted_text = extract_text_from_file(default_storage.path(file_path), file_type)
-            
-            # Create a document splitter
-            splitter = DocumentSplitter(split_by="sentence", split_length=20, split_overlap=2)
-            # Warm up the splitter before using it
-            splitter.warm_up()
-            
-            # Create documents based on file type
-            if file_type == 'pdf':
-                # For PDFs, create documents with page metadata
-                docs = []
-                for page_info in extracted_text:
-                    doc = Document(content=page_info["text"])
-                    doc.metadata = {
-                        "filename": uploaded_file.name,
-                        "page_number": page_info["page_number"]
-                    }
-                    docs.append(doc)
-            else:
-                # For other file types, create a single document
-                docs = [Document(content=extracted_text)]
-                # Add metadata
-                for doc in docs:
-                    doc.metadata = {"filename": uploaded_file.name}
-            
-            # Split the documents
-            for doc in docs:
-                # Split each document and preserve its metadata
-                doc_splits = splitter.run([doc])["documents"]
-                
-                # Ensure metadata is preserved in each split
-                for split_doc in doc_splits:
-                    if not hasattr(split_doc, 'metadata') or split_doc.metadata is None:
-                        split_doc.metadata = {}
-                    
-                    # Copy metadata from parent document
-                    if hasattr(doc, 'metadata') and doc.metadata:
-                        for key, value in doc.metadata.items():
-                            split_doc.metadata[key] = value
-                
-                split_docs.extend(doc_splits)
-            
-            # Clean up the temporary file
-            default_storage.delete(file_path)
-        
-        # Add page numbers to document content
-        for doc in split_docs:
-            if hasattr(doc, 'metadata') and doc.metadata and 'page_number' in doc.metadata:
-                page_number = doc.metadata['page_number']
-                # Add page number as a prefix to the content if not already present
-                if not doc.content.startswith(f"[Page {page_number}]"):
-                    doc.content = f"[Page {page_number}] {doc.content}"
-                    logger.info(f"Added page number {page_number} to document content")
-
-        # Log a sample document to verify
-        if split_docs:
-            logger.info(f"Sample document content with page number: {split_docs[0].content[:100]}...")
-            logger.info(f"Sample document metadata: {split_docs[0].metadata}")
+        split_docs, error_response = await sync_to_async(
+            prepare_uploaded_documents, thread_sensitive=False
+        )(uploaded_file)
+        if error_response is not None:
+            return error_response
         
         # Get OpenAI API key - use only the dedicated key without fallback
         api_key = os.getenv("BID_QUALIFIER_OPENAI_API_KEY")
@@ -599,11 +632,10 @@ def analyze_documents(request):
         
         # Embed the documents with the dedicated key
         logger.info(f"Embedding {len(split_docs)} document chunks")
-        embedder = OpenAIDocumentEmbedder(api_key=Secret.from_token(api_key))
-        embedded_docs = embedder.run(split_docs)["documents"]
+        embedded_docs = await embed_documents(AsyncOpenAI(api_key=api_key), split_docs)
         
         # Write to Pinecone
-        document_store.write_documents(embedded_docs)
+        await sync_to_async(document_store.write_documents, thread_sensitive=False)(embedded_docs)
         logger.info(f"Indexed {len(embedded_docs)} document chunks in Pinecone")
         
         return JsonResponse({
@@ -620,35 +652,47 @@ def analyze_documents(request):
             "error": f"Analysis failed: {str(e)}"
         }, status=500)
 
-@api_view(["POST"])
-def analyze_rfp(request):
+@csrf_exempt
+@require_POST
+async def analyze_rfp(request):
     """Analyze an RFP document."""
     try:
         # Get the session ID and template type from the request
         data = json.loads(request.body)
         session_id = data.get('session_id')
         template_type = data.get('template_type', 'standard')
+        mode = data.get('mode', 'standard')
         
         if not session_id:
             return JsonResponse({"error": "No session ID provided"}, status=400)
+        if mode not in ANALYSIS_MODES:
+            return JsonResponse({"error": f"mode must be one of {list(ANALYSIS_MODES)}"}, status=400)
+        bypass_cache, error = boolean_flag(data.get('bypass_cache'), 'bypass_cache')
+        if error:
+            return error
             
         # Get the document store for this session
-        document_store = get_document_store(session_id)
+        document_store = await sync_to_async(get_document_store)(session_id)
         
         # Initialize the analyzer with the document store
-        analyzer = RFPAnalyzer(vector_store=document_store)
+        analyzer = RFPAnalyzer(
+            vector_store=document_store,
+            session_id=session_id,
+            bypass_cache=bypass_cache
+        )
         
         # Analyze the RFP with the specified template
-        analysis = async_to_sync(analyzer.analyze_rfp)(
+        analysis = await analyzer.analyze_rfp(
             text="Extract all key information from this RFP document.",
-            template_type=template_type
+            template_type=template_type,
+            mode=mode
         )
         
         return JsonResponse({
             "success": True,
             "result": analysis,
             "session_id": session_id,
-            "template_used": template_type
+            "template_used": template_registry.resolve(template_type)
         })
         
     except Exception as e:
@@ -659,77 +703,177 @@ def analyze_rfp(request):
             "error": f"Analysis failed: {str(e)}"
         }, status=500)
 
+@csrf_exempt
+@require_POST
+async def analyze_rfp_batch(request):
+    """Analyze an RFP with several templates, sharing a single retrieval."""
+    try:
+        data = json.loads(request.body)
+        session_id = data.get('session_id')
+        template_types = data.get('template_types') or ['standard']
+        mode = data.get('mode', 'standard')
+        
+        if not session_id:
+            return JsonResponse({"error": "No session ID provided"}, status=400)
+        if mode not in ANALYSIS_MODES:
+            return JsonResponse({"error": f"mode must be one of {list(ANALYSIS_MODES)}"}, status=400)
+        bypass_cache, error = boolean_flag(data.get('bypass_cache'), 'bypass_cache')
+        if error:
+            return error
+        if not isinstance(template_types, list):
+            return JsonResponse({"error": "template_types must be a list"}, status=400)
+            
+        # Get the document store for this session
+        document_store = await sync_to_async(get_document_store)(session_id)
+        analyzer = RFPAnalyzer(
+            vector_store=document_store,
+            session_id=session_id,
+            bypass_cache=bypass_cache
+        )
+        
+        # Retrieve once and run every template's generation concurrently
+        results = await analyzer.analyze_templates(
+            text="Extract all key information from this RFP document.",
+            template_types=template_types,
+            mode=mode
+        )
+        
+        return JsonResponse({
+            "success": True,
+            "results": {
+                template_type: {
+                    "result": analysis,
+                    "template_used": template_registry.resolve(template_type)
+                }
+                for template_type, analysis in results.items()
+            },
+            "session_id": session_id
+        })
+        
+    except Exception as e:
+        import traceback
+        print(f"Error in analyze_rfp_batch: {str(e)}")
+        print(traceback.format_exc())
+        return JsonResponse({
+            "error": f"Analysis failed: {str(e)}"
+        }, status=500)
+
+@api_view(["GET"])
+def llm_cache_stats(request):
+    """Return hit/miss counts for this worker's LLM response cache."""
+    return JsonResponse({
+        "success": True,
+        "stats": get_llm_cache().stats()
+    })
+
+@api_view(["GET"])
+def list_templates(request):
+    """List the analysis template types that can be passed as template_type."""
+    return JsonResponse({
+        "success": True,
+        "templates": template_registry.available(),
+        "default": DEFAULT_TEMPLATE
+    })
+
+def cached_analysis_or_404(session_id, template_type):
+    """Return (analysis, None) from the analysis store, or (None, error response)."""
+    analysis = get_cached_analysis(session_id, template_type)
+    if analysis is None:
+        return None, JsonResponse({
+            'error': f'No analysis found for session {session_id} with template "{template_type}". Run analyze-rfp/ first.'
+        }, status=404)
+    return analysis, None
+
+def requested_format(request):
+    file_format = request.query_params.get('format', 'xlsx')
+    if file_format not in ('xlsx', 'csv'):
+        return None, JsonResponse({'error': 'format must be "xlsx" or "csv"'}, status=400)
+    return file_format, None
+
 @api_view(["POST"])
 def generate_bid_matrix(request, doc_id):
     """
-    Generate a bid matrix based on an RFP document.
+    Generate a bid matrix from the stored analysis of a session.
+    doc_id is the session_id the RFP was analysed under; pass ?template= to
+    pick the analysis template (defaults to the standard one).
     """
-    result = async_to_sync(analyzer.generate_bid_matrix)({"doc_id": doc_id})
+    template_type = request.query_params.get('template', DEFAULT_TEMPLATE)
+    analysis, error = cached_analysis_or_404(doc_id, template_type)
+    if error:
+        return error
+    result = async_to_sync(analyzer.generate_bid_matrix)(analysis)
     return JsonResponse({"matrix": result})
 
 @api_view(["GET"])
 def download_matrix(request, doc_id):
     """
-    Download the bid matrix as an Excel file.
+    Download the bid matrix for a session's stored analysis as an Excel
+    (default) or CSV file (?format=csv). Rendered files are memoized by
+    analysis hash.
     """
-    import io
-    import pandas as pd 
-
-    data = {
-        "Requirement": [],
-        "Priority": [],
-        "Complexity": [],
-        "Status": [],
-        "Assigned To": [],
-        "Notes": [],
-    }
-    df = pd.DataFrame(data)
-    excel_buffer = io.BytesIO()
-    df.to_excel(excel_buffer, index=False)
-    excel_buffer.seek(0)
+    template_type = request.query_params.get('template', DEFAULT_TEMPLATE)
+    file_format, error = requested_format(request)
+    if error:
+        return error
+    analysis, error = cached_analysis_or_404(doc_id, template_type)
+    if error:
+        return error
+    
+    matrix = async_to_sync(analyzer.generate_bid_matrix)(analysis)
+    content = render("matrix", file_format, matrix)
+    return bytes_response(content, f"bid_matrix_{doc_id}.{file_format}", file_format)
 
-    response = HttpResponse(
-        excel_buffer.read(),
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
-    response["Content-Disposition"] = f"attachment; filename=bid_matrix_{doc_id}.xlsx"
-    return response
+@api_view(["GET"])
+def download_session_report(request, session_id):
+    """
+    Download the report for a session's stored analysis without posting the
+    analysis back. Supports ?template= and ?format=xlsx|csv; rendered files
+    are memoized by analysis hash so repeat downloads are served instantly.
+    """
+    template_type = request.query_params.get('template', DEFAULT_TEMPLATE)
+    file_format, error = requested_format(request)
+    if error:
+        return error
+    analysis, error = cached_analysis_or_404(session_id, template_type)
+    if error:
+        return error
+    
+    content = render("report", file_format, analysis)
+    return bytes_response(content, f"rfp_analysis_{session_id}.{file_format}", file_format)
 
-@api_view(['POST'])
-def chat_with_rfp(request):
+@csrf_exempt
+@require_POST
+async def chat_with_rfp(request):
     """
     Chat with the RFP using the session data.
     """
     try:
+        data = json.loads(request.body)
         # Log the request data for debugging
-        print("Request data:", request.data)
+        print("Request data:", data)
         
         # Get the session ID from the request
-        session_id = request.data.get('session_id')
-        message = request.data.get('message')
+        session_id = data.get('session_id')
+        message = data.get('message')
         
         print("Extracted session_id:", session_id)
         print("Extracted message:", message)
         
         if not message:
             return JsonResponse({'error': 'Message is required'}, status=400)
+        bypass_cache, error = boolean_flag(data.get('bypass_cache'), 'bypass_cache')
+        if error:
+            return error
         
-        # Get the document store - use global store if no session ID
-        if session_id:
-            document_store = get_document_store(session_id)
-        else:
-            # Use the global document store if no session ID is provided
-            document_store = global_document_store
-        
-        # Create a chatbot instance
-        chatbot = RFPChatbot(document_store)
+        # Get a chatbot on pooled clients - uses the global index if no session ID
+        chatbot = await chatbot_service.get_chatbot(session_id)
         
         # Get the response using the existing get_response method
-        response = chatbot.get_response(message)
+        response = await chatbot.get_response(message, bypass_cache=bypass_cache)
         
         # Extract the answer from the response
         if response and 'answer' in response:
-            return JsonResponse({'response': response['answer']})
+            return JsonResponse({'response': response['answer'], 'cached': response.get('cached', False)})
         else:
             return JsonResponse({'error': 'Failed to get a response from the chatbot'}, status=500)
     
@@ -737,9 +881,157 @@ def chat_with_rfp(request):
         logger.error(f"Error in chat_with_rfp: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
+@csrf_exempt
+@require_POST
+async def chat_stream(request):
+    """
+    Chat with the RFP, streaming the answer as server-sent events: retrieval
+    metadata first, then completion tokens, then a final event with usage.
+    """
+    try:
+        data = json.loads(request.body)
+        session_id = data.get('session_id')
+        message = data.get('message')
+        
+        if not message:
+            return JsonResponse({'error': 'Message is required'}, status=400)
+        bypass_cache, error = boolean_flag(data.get('bypass_cache'), 'bypass_cache')
+        if error:
+            return error
+        
+        chatbot = await chatbot_service.get_chatbot(session_id)
+    except Exception as e:
+        logger.error(f"Error in chat_stream: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+    
+    async def event_stream():
+        async for event, payload in chatbot.stream_response(message, bypass_cache=bypass_cache):
+            yield f'event: {event}\ndata: {json.dumps(payload)}\n\n'
+    
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def boolean_flag(value, name, default=False):
+    """
+    Parse a boolean from request input: JSON true/false or the strings
+    "true"/"false" ("false" must not turn into True). Returns (value, None),
+    or (None, error response) for anything else.
+    """
+    if value is None:
+        return default, None
+    if isinstance(value, bool):
+        return value, None
+    if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+        return value.strip().lower() == 'true', None
+    return None, JsonResponse({'error': f'{name} must be true or false'}, status=400)
+
+def positive_int(value, name, default, maximum=None):
+    """
+    Parse a positive integer from request input, clamped to maximum.
+    Returns (value, None), or (None, error response) for bad input.
+    """
+    if value is None or value == '':
+        return default, None
+    try:
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError(value)
+        number = int(value)
+    except (TypeError, ValueError):
+        return None, JsonResponse({'error': f'{name} must be an integer'}, status=400)
+    if number < 1:
+        return None, JsonResponse({'error': f'{name} must be at least 1'}, status=400)
+    return (min(number, maximum) if maximum else number), None
+
+@csrf_exempt
+@require_POST
+async def chat_batch(request):
+    """
+    Answer a list of questions (e.g. an RFP compliance questionnaire) in one
+    request. Answers stream back in completion order as NDJSON (default) or
+    SSE, and the full set is kept under a batch_id for Excel export.
+    """
+    try:
+        data = json.loads(request.body)
+        session_id = data.get('session_id')
+        questions = data.get('questions')
+        output_format = data.get('format', 'ndjson')
+        bypass_cache, error = boolean_flag(data.get('bypass_cache'), 'bypass_cache')
+        if error:
+            return error
+        
+        if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q.strip() for q in questions):
+            return JsonResponse({'error': 'questions must be a non-empty list of strings'}, status=400)
+        if len(questions) > MAX_QUESTIONNAIRE_QUESTIONS:
+            return JsonResponse({'error': f'At most {MAX_QUESTIONNAIRE_QUESTIONS} questions per request'}, status=400)
+        if output_format not in ('ndjson', 'sse'):
+            return JsonResponse({'error': 'format must be "ndjson" or "sse"'}, status=400)
+        max_concurrency = getattr(settings, 'QUESTIONNAIRE_CONCURRENCY', 8)
+        concurrency, error = positive_int(data.get('concurrency'), 'concurrency', max_concurrency, max_concurrency)
+        if error:
+            return error
+        
+        chatbot = await chatbot_service.get_chatbot(session_id)
+    except Exception as e:
+        logger.error(f"Error in chat_batch: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+    
+    batch_id = str(uuid.uuid4())
+    
+    def format_event(event, payload):
+        if output_format == 'sse':
+            return f'event: {event}\ndata: {json.dumps(payload)}\n\n'
+        return json.dumps({"type": event, **payload}) + "\n"
+    
+    async def event_stream():
+        started = time.perf_counter()
+        results = []
+        try:
+            async for result in chatbot.answer_batch(
+                questions, concurrency=concurrency, bypass_cache=bypass_cache
+            ):
+                results.append(result)
+                yield format_event("result", result)
+        except Exception as e:
+            logger.error(f"Error in chat_batch stream: {str(e)}")
+            yield format_event("error", {"error": str(e)})
+        
+        # Keep the answers in question order for export
+        results.sort(key=lambda result: result["index"])
+        await asyncio.to_thread(save_questionnaire, batch_id, {"session_id": session_id, "results": results})
+        yield format_event("done", {
+            "batch_id": batch_id,
+            "answered": sum(1 for result in results if not result.get("error")),
+            "total": len(questions),
+            "total_ms": round((time.perf_counter() - started) * 1000)
+        })
+    
+    content_type = 'text/event-stream' if output_format == 'sse' else 'application/x-ndjson'
+    response = StreamingHttpResponse(event_stream(), content_type=content_type)
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_view(["GET"])
+def download_questionnaire(request, batch_id):
+    """Download the answers from a chat-batch/ run as an Excel file."""
+    batch = load_questionnaire(batch_id)
+    if not batch:
+        return JsonResponse({'error': f'Questionnaire batch {batch_id} not found or expired'}, status=404)
+    
+    report = build_report(questionnaire_results=batch["results"])
+    return file_response(report, f'questionnaire_{batch_id}.xlsx')
+
 @api_view(["GET"])
 def compare_indexes(request):
-    """Compare documents in paidmediabids against session-specific RFP index for similarity."""
+    """
+    Rank historical bids in paidmediabids by similarity to a session's RFP.
+    
+    The RFP is summarised as the centroid of its chunk embeddings (or, with
+    method=kmeans, one centroid per topic cluster) and compared against the
+    precomputed per-bid centroids in the local bid index.
+    """
     try:
         # Get session ID from query parameters
         session_id = request.query_params.get('session_id')
@@ -750,61 +1042,43 @@ def compare_indexes(request):
                 'error': 'No session_id provided. Please include a session_id query parameter.'
             }, status=400)
         
-        # Initialize Pinecone
-        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        method = request.query_params.get('method', 'centroid')
+        if method not in ('centroid', 'kmeans'):
+            return JsonResponse({
+                'success': False,
+                'error': 'method must be "centroid" or "kmeans"'
+            }, status=400)
+        clusters, error = positive_int(request.query_params.get('clusters'), 'clusters', DEFAULT_CLUSTERS)
+        if error:
+            return error
+        top_k, error = positive_int(request.query_params.get('top_k'), 'top_k', 10)
+        if error:
+            return error
         
-        # Get the index name for this session
         rfp_index_name = get_session_index_name(session_id)
         print(f"Using RFP index: {rfp_index_name}")
         
-        # Check if the index exists
-        available_indexes = pc.list_indexes().names()
-        if rfp_index_name not in available_indexes:
+        try:
+            comparison = rank_similar_bids(session_id, method=method, clusters=clusters, top_k=top_k)
+        except NotFoundException:
             return JsonResponse({
                 'success': False,
-                'error': f'Index "{rfp_index_name}" not found. Available indexes: {available_indexes}'
+                'error': f'Index "{rfp_index_name}" not found'
             }, status=404)
         
-        # Get both indexes
-        uswebbid = pc.Index("paidmediabids")
-        rfp = pc.Index(rfp_index_name)
-        
-        # Get vectors from rfp-index
-        rfp_response = rfp.query(
-            vector=[1.0] * 1536,
-            top_k=50,
-            include_values=True,
-            include_metadata=True,
-            namespace="default"
-        ).to_dict()
-
-        # Get the first vector from rfp-index results
-        if rfp_response.get('matches'):
-            rfp_vector = rfp_response['matches'][0]['values']
-            
-            # Use this vector to query uswebbid
-            uswebbid_response = uswebbid.query(
-                vector=rfp_vector,
-                top_k=50,
-                include_values=True,
-                include_metadata=True,
-                namespace="default"
-            ).to_dict()
-            
-            # Calculate average similarity score
-            scores = [match['score'] for match in uswebbid_response.get('matches', [])]
-            average_similarity = sum(scores) / len(scores) if scores else 0
-            
-            return JsonResponse({
-                'success': True,
-                'similarity_score': round(average_similarity, 4),
-                'total_documents_compared': len(scores)
-            })
-        else:
+        if not comparison['chunks_compared']:
             return JsonResponse({
                 'success': False,
                 'error': f'No vectors found in {rfp_index_name} index'
             })
+        
+        return JsonResponse({
+            'success': True,
+            'method': method,
+            # Score of the closest past bid, kept for existing clients
+            'similarity_score': comparison['results'][0]['score'] if comparison['results'] else 0,
+            **comparison
+        })
 
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -813,6 +1087,50 @@ def compare_indexes(request):
             'error': str(e)
         }, status=500)
 
+@api_view(["POST"])
+def bulk_export(request):
+    """
+    Export the stored analyses of many sessions as one ZIP archive.
+    
+    Body: {"session_ids": [...], "format": "xlsx" | "csv" | "parquet",
+    "template": optional template type}. Files are rendered in a thread pool
+    and streamed into the archive as each one finishes; a manifest.json lists
+    sessions that had no stored analysis or failed to render.
+    """
+    session_ids = request.data.get('session_ids')
+    file_format = request.data.get('format', 'xlsx')
+    template_type = request.data.get('template', DEFAULT_TEMPLATE)
+    
+    if not isinstance(session_ids, list) or not session_ids or not all(isinstance(session_id, str) for session_id in session_ids):
+        return JsonResponse({'error': 'session_ids must be a non-empty list of strings'}, status=400)
+    if file_format not in ('xlsx', 'csv', 'parquet'):
+        return JsonResponse({'error': 'format must be "xlsx", "csv" or "parquet"'}, status=400)
+    if file_format == 'parquet' and not parquet_available():
+        return JsonResponse({'error': 'Parquet export requires pyarrow, which is not installed'}, status=400)
+    
+    analyses = {}
+    missing = []
+    for session_id in dict.fromkeys(session_ids):
+        analysis = get_cached_analysis(session_id, template_type)
+        if analysis is None:
+            missing.append(session_id)
+        else:
+            analyses[session_id] = analysis
+    if not analyses:
+        return JsonResponse({'error': 'None of the sessions have a stored analysis', 'missing': missing}, status=404)
+    
+    print(f"Bulk exporting {len(analyses)} sessions as {file_format} ({len(missing)} missing)")
+    response = StreamingHttpResponse(
+        aiter_bulk_export(
+            analyses, file_format,
+            max_workers=getattr(settings, 'BULK_EXPORT_WORKERS', 4),
+            missing=missing
+        ),
+        content_type='application/zip'
+    )
+    response['Content-Disposition'] = f'attachment; filename=rfp_analyses_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
+    return response
+
 @api_view(["POST"])
 def download_report(request):
     """Download the RFP analysis as an Excel report."""
@@ -823,125 +1141,19 @@ def download_report(request):
         rfp_data = request.data.get('rfpData', {})
         print(f"Received RFP data keys: {rfp_data.keys()}")  # Debug log
 
-        # Create a new workbook and worksheet
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "RFP Analysis Report"
-
-        # Add title and date
-        ws['A1'] = "RFP Analysis Report"
-        ws['A2'] = f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        
-        # Apply formatting to title
-        title_font = Font(name='Arial', size=16, bold=True)
-        ws['A1'].font = title_font
-        
-        # Apply formatting to date
-        date_font = Font(name='Arial', size=12, italic=True)
-        ws['A2'].font = date_font
-        
-        ws.merge_cells('A1:F1')
-        ws.merge_cells('A2:F2')
-        
-        # Add header row
-        headers = ["Section", "Field", "Value", "Confidence", "Interpreted", "Source Page"]
-        for col, header in enumerate(headers, start=1):
-            cell = ws.cell(row=4, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid")
-        
-        # Set column widths
-        ws.column_dimensions['A'].width = 20  # Section
-        ws.column_dimensions['B'].width = 25  # Field
-        ws.column_dimensions['C'].width = 40  # Value
-        ws.column_dimensions['D'].width = 12  # Confidence
-        ws.column_dimensions['E'].width = 12  # Interpreted
-        ws.column_dimensions['F'].width = 15  # Source Page
-        
-        # Start from row 5 (after headers)
-        current_row = 5
-        
-        # Process each section in the RFP data
-        for section_name, section_data in rfp_data.items():
-            if not isinstance(section_data, dict):
-                continue
-                
-            # Format section name for display
-            display_section = section_name.replace('_', ' ').title()
-            
-            # Process each field in the section
-            for field_name, field_data in section_data.items():
-                # Format field name for display
-                display_field = field_name.replace('_', ' ').title()
-                
-                # Handle different data structures
-                if isinstance(field_data, dict) and 'value' in field_data:
-                    # New format with confidence and other metadata
-                    value = field_data.get('value', '')
-                    confidence = field_data.get('confidence', 0)
-                    is_interpreted = field_data.get('is_interpreted', False)
-                    source_page = field_data.get('source_page', '')
-                    
-                    # Write to Excel
-                    ws.cell(row=current_row, column=1, value=display_section)
-                    ws.cell(row=current_row, column=2, value=display_field)
-                    ws.cell(row=current_row, column=3, value=value)
-                    
-                    # Format confidence as percentage
-                    confidence_cell = ws.cell(row=current_row, column=4, value=confidence)
-                    confidence_cell.number_format = '0.0%'
-                    
-                    # Color code confidence
-                    if confidence >= 0.8:
-                        confidence_cell.fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")  # Green
-                    elif confidence >= 0.5:
-                        confidence_cell.fill = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")  # Yellow
-                    elif confidence > 0:
-                        confidence_cell.fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")  # Red
-                    
-                    # Format is_interpreted as Yes/No
-                    ws.cell(row=current_row, column=5, value="Yes" if is_interpreted else "No")
-                    
-                    # Source page
-                    ws.cell(row=current_row, column=6, value=source_page)
-                    
-                else:
-                    # Old format or simple value
-                    ws.cell(row=current_row, column=1, value=display_section)
-                    ws.cell(row=current_row, column=2, value=display_field)
-                    ws.cell(row=current_row, column=3, value=str(field_data))
-                    # Leave other columns empty
-                
-                current_row += 1
-            
-            # Add a blank row between sections
-            current_row += 1
-        
-        # Create a table for easy filtering and sorting
-        tab = Table(displayName="RFPAnalysisTable", ref=f"A4:{get_column_letter(len(headers))}{current_row-1}")
-        style = TableStyleInfo(
-            name="TableStyleMedium9", 
-            showFirstColumn=False,
-            showLastColumn=False, 
-            showRowStripes=True, 
-            showColumnStripes=False
-        )
-        tab.tableStyleInfo = style
-        ws.add_table(tab)
-        
-        # Freeze the header row
-        ws.freeze_panes = 'A5'
+        # Append questionnaire answers from a chat-batch/ run if requested
+        questionnaire_results = None
+        questionnaire_batch_id = request.data.get('questionnaire_batch_id')
+        if questionnaire_batch_id:
+            batch = load_questionnaire(questionnaire_batch_id)
+            if batch:
+                questionnaire_results = batch["results"]
+            else:
+                print(f"Questionnaire batch {questionnaire_batch_id} not found, skipping sheet")
         
-        # Create response
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = 'attachment; filename=rfp_analysis_report.xlsx'
-
-        # Save workbook to response
-        wb.save(response)
+        report = build_report(rfp_data, questionnaire_results)
         print("Report generated successfully")
-        return response
+        return file_response(report, 'rfp_analysis_report.xlsx')
 
     except Exception as e:
         print(f"Error generating report: {str(e)}")
@@ -961,8 +1173,9 @@ def cleanup_session(request):
             return JsonResponse({"error": "No session ID provided"}, status=400)
         
         # Clear any cached analysis for this session
-        if session_id in analysis_cache:
-            del analysis_cache[session_id]
+        invalidate_session(session_id)
+        semantic_cache.invalidate(session_id)
+        clear_memory(session_id)
         
         # Get the index name for this session
         index_name = get_session_index_name(session_id)
@@ -991,6 +1204,8 @@ def cleanup_session(request):
                 else:
                     print(f"Deleting index {index_name}")
                     pc.delete_index(index_name)
+                    forget_index_host(index_name)
+                    chatbot_service.forget(index_name)
                     return JsonResponse({
                         "success": True,
                         "message": f"Session {session_id} cleaned up successfully"
@@ -1032,8 +1247,9 @@ def analyze_pdf(request):
             print(f"Generated new session ID: {session_id}")
         
         # Clear any cached analysis for this session
-        if session_id in analysis_cache:
-            del analysis_cache[session_id]
+        invalidate_session(session_id)
+        semantic_cache.invalidate(session_id)
+        clear_memory(session_id)
         
         # Get the document store for this session
         document_store = get_document_store(session_id)
@@ -1138,8 +1354,9 @@ def clear_session(request):
             return JsonResponse({"error": "No session ID provided"}, status=400)
         
         # Clear any cached analysis for this session
-        if session_id in analysis_cache:
-            del analysis_cache[session_id]
+        invalidate_session(session_id)
+        semantic_cache.invalidate(session_id)
+        clear_memory(session_id)
         
         # Reset the document store for this session
         document_store = reset_document_store(session_id)